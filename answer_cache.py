@@ -0,0 +1,101 @@
+"""
+Semantic cache of library-wide answers. A question whose embedding is close enough to one
+answered before (cosine similarity >= ANSWER_CACHE_THRESHOLD) gets the stored answer and
+sources, skipping retrieval, reranking and the LLM call. Entries are scoped to the content of
+the library, not to its owner: users who imported the same course files under the same names
+share answers. Adding, removing or replacing a video retires them; they also expire after
+ANSWER_CACHE_TTL and the least recently used go first above ANSWER_CACHE_MAX_ENTRIES.
+"""
+import os
+import copy
+import time
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+import catalog
+import metrics
+import embedding_engine
+
+# configurations
+ANSWER_CACHE_ENABLED = os.environ.get("PINPOINT_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("PINPOINT_ANSWER_CACHE_THRESHOLD", 0.9))
+ANSWER_CACHE_TTL = int(os.environ.get("PINPOINT_ANSWER_CACHE_TTL", 24 * 3600))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = 1000
+
+_entries = OrderedDict()  # entry id -> {"scope", "embedding", "answer", "matches", "created_at"}, LRU order
+_ids = itertools.count()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+
+def get_scope(username):
+    """
+    Version of the user's library content (names, file hashes, index version and embedding model),
+    equal for every user with the same ready videos. Sources name videos, so names are part of it.
+    """
+    rows = sorted(catalog.list_videos(username, states=("ready",)), key=lambda r: r['display_name'])
+    sha = hashlib.sha1(embedding_engine.EMBEDDING_MODEL_VERSION.encode())
+    for row in rows:
+        sha.update(f"{row['display_name']}|{row['file_hash']}|{row['index_version']}".encode())
+    # videos imported before file hashes were recorded can't be compared across users
+    owner = username if any(not row['file_hash'] for row in rows) else "shared"
+    return f"{owner}:{sha.hexdigest()[:16]}"
+
+
+def to_unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _drop_expired(now):
+    for entry_id in [k for k, e in _entries.items() if now - e['created_at'] > ANSWER_CACHE_TTL]:
+        del _entries[entry_id]
+        _stats['expired'] += 1
+
+
+def lookup(scope, embedding):
+    """Returns (answer, matches) of the most similar cached question in this scope, or None."""
+    if not ANSWER_CACHE_ENABLED: return None
+    with metrics.span("query.answer_cache") as span, _lock:
+        _drop_expired(time.time())
+        candidates = [(entry_id, entry) for entry_id, entry in _entries.items() if entry['scope'] == scope]
+        best_id, similarity = None, 0.0
+        if candidates:
+            similarities = np.stack([entry['embedding'] for _, entry in candidates]) @ to_unit(embedding)
+            best = int(np.argmax(similarities))
+            best_id, similarity = candidates[best][0], float(similarities[best])
+
+        hit = best_id is not None and similarity >= ANSWER_CACHE_THRESHOLD
+        _stats['hits' if hit else 'misses'] += 1
+        span.set(hit=int(hit), entries=len(candidates), similarity=round(similarity, 3))
+        if not hit: return None
+        _entries.move_to_end(best_id)
+        entry = _entries[best_id]
+        # callers may annotate the matches, the cached ones stay untouched
+        return entry['answer'], copy.deepcopy(entry['matches'])
+
+
+def store(scope, embedding, answer, matches):
+    if not ANSWER_CACHE_ENABLED: return
+    with _lock:
+        _entries[next(_ids)] = {"scope": scope, "embedding": to_unit(embedding), "answer": answer,
+                                "matches": copy.deepcopy(matches), "created_at": time.time()}
+        _stats['stores'] += 1
+        while len(_entries) > ANSWER_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evicted'] += 1
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def get_stats():
+    """Hit/miss counters of this process, for the debug page."""
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return {**_stats, "entries": len(_entries), "hit_rate": round(_stats['hits'] / lookups, 3) if lookups else None,
+                "threshold": ANSWER_CACHE_THRESHOLD, "ttl_seconds": ANSWER_CACHE_TTL}
@@ -1,9 +1,26 @@
+import time
+
+_import_start = time.perf_counter()
 import streamlit as st
 import os
 import glob
+import warmup
+import model_manager
+import ingest_worker
 import auth
+import bulk_ingest
+import chroma_server
 import video_processor
-import query_engine
+import library_ui
+import chat_ui
+import debug_ui
+import media_server
+
+# heavy libraries (torch, whisper, chromadb...) are only imported on first use
+warmup.record_timing("import_app_modules", time.perf_counter() - _import_start, first_only=True)
+
+# configurations
+SIDEBAR_REFRESH_SECONDS = 3  # how often the sidebar job status refreshes by itself
 
 # page configurations
 st.set_page_config(
@@ -47,13 +64,6 @@ def load_css():
 
 load_css()
 
-# pre-load models
-if 'models_loaded' not in st.session_state:
-    with st.spinner("🚀 Warming up AI engines..."):
-        query_engine.load_reranker()
-        st.session_state['models_loaded'] = True
-
-
 # remove any stuck lock files from previous sessions
 def cleanup_stuck_locks():
     if 'cleanup_done' not in st.session_state:
@@ -64,6 +74,9 @@ def cleanup_stuck_locks():
             except:
                 pass
         st.session_state['cleanup_done'] = True
+    # videos and progress files left by a crash, with no job to finish them (running jobs of a
+    # crashed worker are requeued and resume from their checkpoint)
+    ingest_worker.clean_up_orphans()
 
 
 cleanup_stuck_locks()
@@ -81,19 +94,72 @@ auth.init_user_db()
 if 'logged_in' not in st.session_state: st.session_state['logged_in'] = False
 if 'current_page' not in st.session_state: st.session_state['current_page'] = "✨ AI Chat"
 if 'selected_video' not in st.session_state: st.session_state['selected_video'] = None
-if 'chat_history' not in st.session_state: st.session_state['chat_history'] = []
 if 'start_time' not in st.session_state: st.session_state['start_time'] = 0
-if 'processing_global' not in st.session_state: st.session_state['processing_global'] = False
 
 
-def lock_global_chat():
-    """Callback to lock input immediately when Enter is pressed"""
-    st.session_state['processing_global'] = True
+def get_active_jobs(username):
+    try:
+        return video_processor.get_active_progress(username)
+    except Exception:
+        # in case of faliure, we avoid crash
+        return []
+
+
+# sidebar job status, refreshed on its own instead of rerunning the page
+def background_status(username, polling):
+    active_jobs = get_active_jobs(username)
+    if active_jobs:
+        st.info(f"⚡ Processing {len(active_jobs)} item(s)")
+
+    # a finished job changes the library, so then the whole page reruns (and shows the toast);
+    # the rerun also turns the refresh off once nothing is left to watch
+    previous_count = st.session_state.get('active_job_count', 0)
+    st.session_state['active_job_count'] = len(active_jobs)
+    if len(active_jobs) < previous_count or (polling and not active_jobs and not warmup.is_warming_up()):
+        st.rerun()
+
+    if warmup.is_warming_up():
+        st.caption("🔥 Warming up AI models...")
+    timings = warmup.get_timings()
+    if timings:
+        with st.expander("⏱️ Startup Timings"):
+            for name, seconds in timings.items():
+                st.caption(f"{name}: {seconds:.2f}s")
+
+
+def render_background_status(username):
+    """Refreshes every SIDEBAR_REFRESH_SECONDS, but only while jobs run or models warm up."""
+    polling = bool(get_active_jobs(username)) or warmup.is_warming_up()
+    st.fragment(background_status, run_every=SIDEBAR_REFRESH_SECONDS if polling else None)(username, polling)
 
 
 def main_app():
     username = st.session_state['username']
 
+    # load the search models in the background while the user looks around
+    warmup.start_background_warmup()
+
+    # in server mode the shared vector store has to be up before anything touches the index
+    if video_processor.CHROMA_MODE == "server" and 'vector_store_checked' not in st.session_state:
+        chroma_server.ensure_server_running()
+        st.session_state['vector_store_checked'] = True
+
+    # the player streams web renditions from a small range-request server in this process
+    media_server.start_media_server()
+
+    # jobs left in the queue by a previous server run and outdated indexes need a worker pool,
+    # and its supervisor is the one watching the drop folders
+    if 'workers_checked' not in st.session_state:
+        if bulk_ingest.BULK_WATCH_ENABLED or ingest_worker.has_pending_jobs() or bulk_ingest.has_pending_items() \
+                or ingest_worker.has_outdated_videos():
+            ingest_worker.ensure_workers_running()
+        st.session_state['workers_checked'] = True
+
+    # a query left running by an interrupted run is not wanted anymore
+    leftover_query = st.session_state.pop('active_query', None)
+    if leftover_query:
+        leftover_query.cancel()
+
     # checks if any background jobs finished since the last update
     completed_jobs = video_processor.get_and_clear_notifications(username)
     if completed_jobs:
@@ -113,6 +179,8 @@ def main_app():
 
         # sidebar navigation
         nav_options = ["✨ AI Chat", "🎬 My Studio", "📥 Import"]
+        if debug_ui.is_admin(username):
+            nav_options.append("🩺 Debug")
 
         # ensure valid page selection
         if st.session_state.get('current_page') not in nav_options:
@@ -138,14 +206,15 @@ def main_app():
                 api_input = st.text_input("Enter Key", type="password")
                 if api_input: st.session_state['gemini_api_key'] = api_input
 
-        # show active processing jobs
-        try:
-            active_jobs = video_processor.get_active_progress(username)
-            if active_jobs:
-                st.info(f"⚡ Processing {len(active_jobs)} item(s)")
-        except Exception as e:
-            # in case of faliure, we avoid crash
-            pass
+        render_background_status(username)
+
+        model_stats = model_manager.manager.get_stats()
+        with st.expander("🧠 Model Memory"):
+            st.caption(f"{model_stats['resident_mb']} / {model_stats['budget_mb']} MB resident")
+            for name, stats in model_stats['models'].items():
+                state = "loaded" if stats['loaded'] else "unloaded"
+                st.caption(f"**{name}** ({state}): {stats['loads']} loads, {stats['uses']} uses, "
+                           f"{stats['evictions']} evictions, {stats['load_seconds']:.1f}s loading")
 
         st.write("")
         if st.button("Logout", use_container_width=True):
@@ -154,81 +223,17 @@ def main_app():
 
     # sidebar options logic
     if st.session_state['current_page'] == "📥 Import":
-        video_processor.render_upload_page(username)
+        library_ui.render_upload_page(username)
 
     elif st.session_state['current_page'] == "🎬 My Studio":
-        video_processor.render_library_page(username)
+        library_ui.render_library_page(username)
+
+    elif st.session_state['current_page'] == "🩺 Debug":
+        debug_ui.render_debug_page()
 
     elif st.session_state['current_page'] == "✨ AI Chat":
         if st.session_state['selected_video'] is None:
-            if not st.session_state['chat_history']:
-                st.markdown("""
-                        <div style="text-align: center; padding: 40px 0;">
-                            <h1 style="font-size: 3rem; background: -webkit-linear-gradient(left, #FF4B4B, #FF914D); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">
-                                Ask your videos anything.
-                            </h1>
-                            <p style="color: #8B949E; font-size: 1.2rem;">
-                                Your personal video intelligence hub.
-                            </p>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-            # render history
-            for i, msg in enumerate(st.session_state['chat_history']):
-                with st.chat_message(msg['role'], avatar="⚡" if msg['role'] == "assistant" else None):
-                    st.write(msg['content'])
-                    if "sources" in msg and msg['sources']:
-                        with st.expander("📚 Sources"):
-                            for idx, match in enumerate(msg['sources']):
-                                c1, c2 = st.columns([4, 1])
-                                with c1:
-                                    # Safe text truncation to avoid errors
-                                    txt = match.get('text', '')[:100]
-                                    st.caption(f"**{match['video_name']}**: *{txt}...*")
-                                with c2:
-                                    if st.button("Play", key=f"hist_{i}_{idx}"):
-                                        st.session_state['selected_video'] = match['video_name']
-                                        st.session_state['start_time'] = match['start_time']
-                                        st.rerun()
-
-            # search videos across library
-            user_query = st.chat_input(
-                "Search across your entire library...",
-                on_submit=lock_global_chat,
-                disabled=st.session_state['processing_global']
-            )
-
-            if user_query:
-                # append user message to history
-                st.session_state['chat_history'].append({"role": "user", "content": user_query})
-                with st.chat_message("user"):
-                    st.write(user_query)
-                try:
-                    with st.chat_message("assistant", avatar="⚡"):
-                        with st.spinner("🧠 Thinking..."):
-                            # search
-                            matches = query_engine.search_all_collections(user_query, username)
-
-                            # generate answer
-                            if matches:
-                                ai_response = query_engine.ask_gemini(user_query, matches,
-                                                                      st.session_state['gemini_api_key'])
-                                st.session_state['chat_history'].append({
-                                    "role": "assistant",
-                                    "content": ai_response,
-                                    "sources": matches
-                                })
-                                st.write(ai_response)  # show answer immediately
-                            else:
-                                msg = "I couldn't find any relevant information in your library."
-                                st.session_state['chat_history'].append({"role": "assistant", "content": msg})
-                                st.write(msg)
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
-                finally:
-                    # unlocks the chat even if there was a crash
-                    st.session_state['processing_global'] = False
-                    st.rerun()
+            chat_ui.render_library_chat(username, st.session_state['gemini_api_key'])
         else:
             # new header layout with resizer
             col_back, col_title, col_resize = st.columns([1, 5, 3])
@@ -268,10 +273,11 @@ def main_app():
                 video_player = st.empty()
                 start_ts = st.session_state.get('start_time', 0)
                 video_player.empty()
-                video_player.video(video_path, start_time=int(start_ts))
+                chat_ui.render_player(video_player, video_path, selected_vid, username, start_time=start_ts)
+                chat_ui.render_timeline(selected_vid, username)
 
             with col_chat:
-                query_engine.render_search_ui(
+                chat_ui.render_search_ui(
                     selected_vid, video_path, video_player, username, st.session_state['gemini_api_key']
                 )
 
@@ -3,9 +3,10 @@ import bcrypt
 import streamlit as st
 import os
 import re
+import paths
 
 # configurations
-BASE_DB_FOLDER = "Database"
+BASE_DB_FOLDER = paths.BASE_DB_FOLDER
 USERS_DB_FILE = os.path.join(BASE_DB_FOLDER, "users.db")
 
 # ensure DB folder exists
@@ -0,0 +1,466 @@
+"""
+Benchmark suite for indexing and retrieval at different library sizes. Synthetic
+transcripts replace Whisper, so only the embedding model and reranker are needed.
+Everything is written to a scratch folder, never to the real Database.
+
+    python benchmark.py run --scales 5x50,20x100,50x200 --output bench.json
+    python benchmark.py compare baseline.json bench.json --threshold 0.15
+    python benchmark.py embed --backends torch,onnx,onnx-int8 --output embed.json
+
+A scale "NxM" is a library of N videos with M transcript segments each. Library-wide
+queries are timed with and without the routing index, and its recall is reported for
+several cut-offs (--routing-top sets the one used by search).
+
+`embed` compares the embedding engine's backends: texts per second at several batch sizes,
+single-query latency, and cosine agreement with the PyTorch vectors (or, with --user, with
+the vectors already stored in that user's library). It fails below --min-agreement.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+# configurations
+DEFAULT_SCALES = "5x50,20x100"
+DEFAULT_QUERIES = 20
+DEFAULT_REGRESSION_THRESHOLD = 0.15  # 15% worse than the baseline counts as a regression
+BENCH_USER = "bench"
+SEGMENT_WORDS = (8, 20)
+SEGMENT_SECONDS = (3.0, 9.0)
+RERANK_PAIRS = 256
+ROUTING_CURVE = (1, 3, 5, 10, 20)  # routed video counts whose recall is reported
+EMBED_TEXTS = 2000
+EMBED_BATCH_SIZES = "1,16,64,128"
+EMBED_QUERY_SAMPLES = 50
+DEFAULT_MIN_AGREEMENT = 0.98  # mean cosine similarity to the reference vectors
+
+# every metric and whether a higher value is better
+METRICS = {
+    "index_chunks_per_sec": True,
+    "global_query_p50_ms": False,
+    "global_query_p95_ms": False,
+    "exhaustive_query_p50_ms": False,
+    "route_p50_ms": False,
+    "routing_recall": True,
+    "single_query_p50_ms": False,
+    "single_query_p95_ms": False,
+    "expand_context_p50_ms": False,
+    "rerank_pairs_per_sec": True,
+    "top1_hit_rate": True,
+    "exhaustive_top1_hit_rate": True,
+    "peak_rss_mb": False,
+    "disk_mb": False,
+}
+
+FILLER_WORDS = ("the and so we then this that is of to in it for on with as".split())
+TOPIC_WORDS = ("entropy enthalpy gradient tensor lattice protein enzyme neuron theorem integral matrix vector "
+               "photon electron quantum market inflation equilibrium algorithm recursion compiler network "
+               "protocol database transaction kernel scheduler memory cache pipeline latency bandwidth "
+               "genome mutation evolution climate carbon ocean glacier volcano fossil orbit galaxy nebula "
+               "gravity momentum friction voltage circuit resistor capacitor signal spectrum filter").split()
+
+
+# synthetic data
+def make_transcript(rng, num_segments):
+    """Whisper-shaped segments about a few topics, so different videos are distinguishable."""
+    topics = rng.sample(TOPIC_WORDS, 4)
+    segments, t = [], 0.0
+    for _ in range(num_segments):
+        words = [rng.choice(topics) if rng.random() < 0.3 else rng.choice(FILLER_WORDS)
+                 for _ in range(rng.randint(*SEGMENT_WORDS))]
+        duration = rng.uniform(*SEGMENT_SECONDS)
+        segments.append({"start": round(t, 2), "end": round(t + duration, 2), "text": " " + " ".join(words)})
+        t += duration
+    return segments
+
+
+def make_queries(rng, library, count):
+    """Picks random chunks and uses a slice of their text as the query. Returns (query, video_name) pairs."""
+    queries = []
+    for _ in range(count):
+        video_name = rng.choice(list(library))
+        documents = library[video_name]
+        words = rng.choice(documents).split()
+        start = rng.randint(0, max(0, len(words) - 8))
+        queries.append((" ".join(words[start: start + 8]), video_name))
+    return queries
+
+
+# measurements
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # windows
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def folder_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum([os.path.getsize(os.path.join(root, name)) for name in files])
+    return total / (1024 * 1024)
+
+
+def timed_ms(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def build_library(username, num_videos, num_segments, rng):
+    """Indexes a synthetic library the same way ingestion does. Returns ({video: documents}, seconds, chunks)."""
+    import catalog
+    import video_processor
+
+    _, chroma_dir, _ = video_processor.get_user_paths(username)
+    client = video_processor.get_db_client(chroma_dir)
+    library, index_seconds, total_chunks = {}, 0.0, 0
+
+    for v in range(num_videos):
+        video_name = f"synthetic_{v:04d}.mp4"
+        segments = video_processor.save_transcript(username, video_name, make_transcript(rng, num_segments))
+        ids, documents, metadatas = video_processor.build_chunks(segments, video_name)
+        collection_name = video_processor.get_safe_collection_name(video_name)
+
+        start = time.perf_counter()
+        collection = client.create_collection(name=collection_name,
+                                              embedding_function=video_processor.get_embedding_function(),
+                                              metadata=video_processor.get_index_stamp())
+        collection.add(ids=ids, documents=documents, metadatas=metadatas)
+        video_processor.save_routing_index(username, video_name, collection)
+        index_seconds += time.perf_counter() - start
+
+        catalog.add_video(username, video_name, state="ready", collection_name=collection_name,
+                          chunk_count=len(ids), duration_sec=segments[-1]['end'], size_bytes=0,
+                          index_version=video_processor.INDEX_VERSION,
+                          model_version=video_processor.get_index_stamp()['embedding_model'])
+        library[video_name] = documents
+        total_chunks += len(ids)
+
+    catalog.mark_backfilled(username)
+    return library, index_seconds, total_chunks
+
+
+def bench_scale(num_videos, num_segments, num_queries, seed):
+    import model_manager
+    import query_engine
+    import routing
+    import video_processor
+
+    rng = random.Random(seed)
+    username = f"{BENCH_USER}_{num_videos}x{num_segments}"
+    library, index_seconds, total_chunks = build_library(username, num_videos, num_segments, rng)
+    queries = make_queries(rng, library, num_queries)
+    collections = video_processor.get_video_collections(username)
+
+    global_ms, single_ms, expand_ms, hits = [], [], [], 0
+    for query, video_name in queries:
+        elapsed, matches = timed_ms(query_engine.search_all_collections, query, username)
+        global_ms.append(elapsed)
+        hits += bool(matches) and matches[0]['video_name'] == video_name
+
+        elapsed, results = timed_ms(query_engine.search_single_video, collections[video_name], query, username)
+        single_ms.append(elapsed)
+
+        if results and results['ids'] and results['ids'][0]:
+            _, chroma_dir, _ = video_processor.get_user_paths(username)
+            collection = video_processor.get_db_client(chroma_dir).get_collection(collections[video_name])
+            elapsed, _ = timed_ms(query_engine.expand_context, collection, results['ids'][0][0])
+            expand_ms.append(elapsed)
+
+    # routing: search without it, and how often the right video survives at each cut-off
+    routing_enabled, routing.ROUTING_ENABLED = routing.ROUTING_ENABLED, False
+    exhaustive_ms, exhaustive_hits = [], 0
+    for query, video_name in queries:
+        elapsed, matches = timed_ms(query_engine.search_all_collections, query, username)
+        exhaustive_ms.append(elapsed)
+        exhaustive_hits += bool(matches) and matches[0]['video_name'] == video_name
+    routing.ROUTING_ENABLED = True
+
+    route_ms, recall = [], {top: 0 for top in ROUTING_CURVE + (routing.ROUTING_TOP_VIDEOS,)}
+    embeddings = query_engine.embed_queries([query for query, _ in queries])
+    for (query, video_name), embedding in zip(queries, embeddings):
+        elapsed, _ = timed_ms(routing.route_videos, username, collections, embedding)
+        route_ms.append(elapsed)
+        for top in recall:
+            recall[top] += video_name in routing.route_videos(username, collections, embedding, top)
+    routing.ROUTING_ENABLED = routing_enabled
+
+    # reranker throughput on (query, chunk) pairs from this library
+    documents = [doc for docs in library.values() for doc in docs]
+    pairs = [[rng.choice(queries)[0], rng.choice(documents)] for _ in range(RERANK_PAIRS)]
+    with model_manager.manager.use("reranker") as reranker:
+        start = time.perf_counter()
+        for i in range(0, len(pairs), query_engine.RERANK_BATCH_SIZE):
+            reranker.predict(pairs[i: i + query_engine.RERANK_BATCH_SIZE])
+        rerank_seconds = time.perf_counter() - start
+
+    _, chroma_dir, _ = video_processor.get_user_paths(username)
+    rss = peak_rss_mb()
+    return {
+        "videos": num_videos,
+        "chunks": total_chunks,
+        "index_seconds": round(index_seconds, 3),
+        "index_chunks_per_sec": round(total_chunks / index_seconds, 1),
+        "global_query_p50_ms": round(percentile(global_ms, 50), 1),
+        "global_query_p95_ms": round(percentile(global_ms, 95), 1),
+        "single_query_p50_ms": round(percentile(single_ms, 50), 1),
+        "single_query_p95_ms": round(percentile(single_ms, 95), 1),
+        "expand_context_p50_ms": round(percentile(expand_ms, 50), 2) if expand_ms else None,
+        "rerank_pairs_per_sec": round(len(pairs) / rerank_seconds, 1),
+        "exhaustive_query_p50_ms": round(percentile(exhaustive_ms, 50), 1),
+        "route_p50_ms": round(percentile(route_ms, 50), 2),
+        "routing_recall": round(recall[routing.ROUTING_TOP_VIDEOS] / len(queries), 3),
+        "routing_recall_curve": {str(top): round(recall[top] / len(queries), 3) for top in ROUTING_CURVE},
+        "top1_hit_rate": round(hits / len(queries), 3),
+        "exhaustive_top1_hit_rate": round(exhaustive_hits / len(queries), 3),
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        "disk_mb": round(folder_size_mb(chroma_dir), 2),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_scales(text):
+    return [tuple(int(n) for n in scale.lower().split("x")) for scale in text.split(",") if scale]
+
+
+# commands
+def cmd_run(args):
+    output = os.path.abspath(args.output)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pinpoint_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    # every module resolves "Database/..." relative to the working directory
+    os.chdir(workdir)
+
+    import model_manager
+    import routing
+    import video_processor
+
+    if args.routing_top:
+        routing.ROUTING_TOP_VIDEOS = args.routing_top
+    load_seconds = {}
+    for name in ["embedder", "reranker"]:
+        start = time.perf_counter()
+        model_manager.manager.preload(name)
+        load_seconds[name] = round(time.perf_counter() - start, 2)
+
+    results = {
+        "meta": {
+            "commit": get_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "device": model_manager.get_device(),
+            "embedding_model": video_processor.get_index_stamp()['embedding_model'],
+            "index_version": video_processor.INDEX_VERSION,
+            "queries": args.queries,
+            "seed": args.seed,
+            "routing_top_videos": routing.ROUTING_TOP_VIDEOS,
+            "model_load_seconds": load_seconds,
+        },
+        "scales": {}
+    }
+
+    try:
+        for num_videos, num_segments in parse_scales(args.scales):
+            label = f"{num_videos}x{num_segments}"
+            print(f"Benchmarking {label}...")
+            results['scales'][label] = bench_scale(num_videos, num_segments, args.queries, args.seed)
+            print("  " + ", ".join([f"{k}={v}" for k, v in results['scales'][label].items()]))
+    finally:
+        os.chdir(os.path.dirname(output))
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+def compare_results(baseline, current, threshold):
+    """Returns (rows, regressions); a metric regresses when it is worse than the baseline by more than threshold."""
+    rows, regressions = [], []
+    for label, current_metrics in current['scales'].items():
+        baseline_metrics = baseline['scales'].get(label)
+        if not baseline_metrics: continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline_metrics.get(metric), current_metrics.get(metric)
+            if not old or new is None: continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            row = (label, metric, old, new, change)
+            rows.append(row)
+            if worse > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    print(f"baseline {baseline['meta'].get('commit')} vs. current {current['meta'].get('commit')}")
+    for label, metric, old, new, change in rows:
+        flag = "  REGRESSION" if (label, metric, old, new, change) in regressions else ""
+        print(f"{label:>10} {metric:<24} {old:>10} -> {new:<10} {change * 100:+6.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold * 100:.0f}%")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+def load_embedding_texts(args):
+    """Returns (texts, reference vectors or None): a user's stored chunks, or synthetic ones."""
+    import numpy as np
+    import video_processor
+
+    if not args.user:
+        rng = random.Random(args.seed)
+        texts = []
+        while len(texts) < args.texts:
+            _, documents, _ = video_processor.build_chunks(make_transcript(rng, 300), "embed.mp4")
+            texts.extend(documents)
+        return texts[:args.texts], None
+
+    _, chroma_dir, _ = video_processor.get_user_paths(args.user)
+    client = video_processor.get_db_client(chroma_dir)
+    texts, vectors = [], []
+    for collection_name in video_processor.get_video_collections(args.user, states=("ready",)).values():
+        data = client.get_collection(collection_name).get(include=["documents", "embeddings"])
+        texts.extend(data['documents'])
+        vectors.extend(data['embeddings'])
+        if len(texts) >= args.texts: break
+    return texts[:args.texts], np.asarray(vectors[:args.texts], dtype=np.float32)
+
+
+def bench_embedding_backend(backend, texts, batch_sizes, threads):
+    import embedding_engine
+
+    start = time.perf_counter()
+    if backend == "torch":
+        embedding_engine.set_torch_threads(threads)
+    model = embedding_engine.load_model(backend, threads)
+    load_seconds = time.perf_counter() - start
+    embedding_engine.encode_with(model, texts[:8])  # warm-up
+
+    throughput = {}
+    for batch_size in batch_sizes:
+        elapsed, _ = timed_ms(embedding_engine.encode_with, model, texts, batch_size)
+        throughput[str(batch_size)] = round(len(texts) / (elapsed / 1000), 1)
+
+    query_ms = [timed_ms(embedding_engine.encode_with, model, [text])[0] for text in texts[:EMBED_QUERY_SAMPLES]]
+    vectors = embedding_engine.encode_with(model, texts)
+    return {
+        "loaded_backend": getattr(model, "backend", "torch"),
+        "load_seconds": round(load_seconds, 2),
+        "texts_per_sec": throughput,
+        "query_p50_ms": round(percentile(query_ms, 50), 2),
+        "query_p95_ms": round(percentile(query_ms, 95), 2),
+    }, vectors
+
+
+def cmd_embed(args):
+    import embedding_engine
+
+    texts, reference = load_embedding_texts(args)
+    if not texts:
+        print("No texts to embed")
+        return 1
+    batch_sizes = [int(n) for n in args.batch_sizes.split(",") if n]
+    backends = [b for b in args.backends.split(",") if b]
+    # the PyTorch vectors are the reference unless stored ones were loaded
+    if reference is None and "torch" not in backends:
+        backends.insert(0, "torch")
+
+    results = {"meta": {"commit": get_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "texts": len(texts), "user": args.user, "threads": args.threads,
+                        "int8_file": embedding_engine.ONNX_INT8_FILE},
+               "backends": {}}
+    failed = []
+    for backend in backends:
+        print(f"Benchmarking the {backend} backend on {len(texts)} texts...")
+        result, vectors = bench_embedding_backend(backend, texts, batch_sizes, args.threads)
+        if reference is None:
+            reference = vectors
+        result['agreement'] = embedding_engine.cosine_agreement(reference, vectors)
+        results['backends'][backend] = result
+        print("  " + ", ".join([f"{k}={v}" for k, v in result.items()]))
+        if result['agreement']['mean'] < args.min_agreement:
+            failed.append(backend)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if failed:
+        print(f"Cosine agreement below {args.min_agreement}: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PinPoint indexing and retrieval benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="benchmark synthetic libraries at several scales")
+    p.add_argument("--scales", default=DEFAULT_SCALES, help="comma separated NxM (videos x segments)")
+    p.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="queries per scale")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--routing-top", type=int, help="videos kept by the routing index (default: ROUTING_TOP_VIDEOS)")
+    p.add_argument("--output", default="bench_results.json")
+    p.add_argument("--workdir", help="where to build the libraries (default: a temporary folder)")
+    p.add_argument("--keep", action="store_true", help="keep the temporary libraries")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("compare", help="compare two result files and fail on regressions")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("embed", help="compare embedding backends (throughput, latency, cosine agreement)")
+    p.add_argument("--backends", default="torch,onnx,onnx-int8")
+    p.add_argument("--texts", type=int, default=EMBED_TEXTS, help="chunks to embed")
+    p.add_argument("--batch-sizes", default=EMBED_BATCH_SIZES, help="comma separated batch sizes")
+    p.add_argument("--threads", type=int, default=0, help="intra-op threads (0: library default)")
+    p.add_argument("--user", help="use this user's stored chunks and vectors as the reference")
+    p.add_argument("--min-agreement", type=float, default=DEFAULT_MIN_AGREEMENT)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", default="embed_results.json")
+    p.set_defaults(func=cmd_embed)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Bulk ingestion of whole folders (e.g. a semester archive). Files come from each user's
+drop folder (Database/users/<user>/inbox, watched by the ingestion supervisor) or from a
+directory passed to import_folder / `pinpoint.py bulk`. Every file is hashed so duplicates
+and videos already in the library are skipped, and the rest is handed to the job queue at
+a throttled rate, never with more than a few jobs of one user queued or running at once.
+"""
+import os
+import glob
+import time
+import uuid
+import shutil
+import threading
+import catalog
+import ingest_worker
+import video_processor
+
+# configurations
+INBOX_FOLDER = "inbox"
+BULK_WATCH_ENABLED = os.environ.get("PINPOINT_BULK_WATCH", "1") == "1"
+BULK_ENQUEUE_INTERVAL = float(os.environ.get("PINPOINT_BULK_INTERVAL", 2))  # seconds between two enqueued files
+BULK_USER_CONCURRENCY = int(os.environ.get("PINPOINT_BULK_USER_CONCURRENCY", 2))  # queued + running jobs per user
+FILE_SETTLE_SECONDS = 10  # a file still being copied in is left alone until unchanged this long
+INBOX_RESCAN_INTERVAL = 60  # full rescans of the drop folders (watch events only make them sooner)
+BULK_MAX_ATTEMPTS = 3  # a file that failed this often is not added again until its imports are cleared
+
+
+def init_bulk_queue():
+    ingest_worker.init_job_queue()
+    conn = ingest_worker.get_jobs_connection()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            batch_id TEXT,
+            source_path TEXT,
+            move INTEGER,
+            state TEXT,
+            video_name TEXT,
+            job_id INTEGER,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS bulk_items_state ON bulk_items(state, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS bulk_items_user ON bulk_items(username, state)")
+    if "api_key" in [column[1] for column in conn.execute("PRAGMA table_info(bulk_items)")]:
+        conn.execute("UPDATE bulk_items SET api_key=NULL WHERE api_key IS NOT NULL")
+    conn.commit()
+    conn.close()
+
+
+def get_inbox_dir(username):
+    """The user's drop folder: video files put here are imported automatically."""
+    inbox_dir = os.path.join(video_processor.BASE_DB_FOLDER, "users", username, INBOX_FOLDER)
+    os.makedirs(inbox_dir, exist_ok=True)
+    return inbox_dir
+
+
+def find_video_files(folder, recursive=True):
+    pattern = os.path.join(folder, "**", "*") if recursive else os.path.join(folder, "*")
+    return sorted([path for path in glob.glob(pattern, recursive=recursive)
+                   if os.path.isfile(path) and path.lower().endswith(video_processor.VIDEO_EXTENSIONS)])
+
+
+def add_files(username, paths, batch_id, move=False, api_key=""):
+    """
+    Registers files for import; files already waiting, or that failed BULK_MAX_ATTEMPTS times, are
+    not added again (a drop folder keeps a file that failed before it was moved). Returns how many were added.
+    """
+    init_bulk_queue()
+    now = time.time()
+    conn = ingest_worker.get_jobs_connection()
+    waiting = {row[0] for row in conn.execute("SELECT source_path FROM bulk_items WHERE username=? AND state='pending'",
+                                              (username,))}
+    failures = dict(conn.execute("SELECT source_path, COUNT(*) FROM bulk_items WHERE username=? AND state='failed' "
+                                 "GROUP BY source_path", (username,)).fetchall())
+    added = 0
+    for path in paths:
+        path = os.path.abspath(path)
+        if path in waiting or failures.get(path, 0) >= BULK_MAX_ATTEMPTS: continue
+        cur = conn.execute("INSERT INTO bulk_items(username, batch_id, source_path, move, state, created_at, "
+                           "updated_at) VALUES (?,?,?,?,'pending',?,?)",
+                           (username, batch_id, path, int(move), now, now))
+        ingest_worker.store_api_key(f"bulk_{cur.lastrowid}", api_key)
+        waiting.add(path)
+        added += 1
+    conn.commit()
+    conn.close()
+    return added
+
+
+def import_folder(username, folder, recursive=True, move=False, api_key=""):
+    """Queues every video under a folder for a throttled import. Returns (batch id, files added)."""
+    if not os.path.isdir(folder):
+        raise ValueError(f"Not a folder: {folder}")
+    batch_id = uuid.uuid4().hex[:8]
+    return batch_id, add_files(username, find_video_files(folder, recursive), batch_id, move, api_key)
+
+
+def scan_inboxes():
+    """Registers the files in every user's drop folder (they are moved into the library)."""
+    added = 0
+    for inbox_dir in glob.glob(os.path.join(video_processor.BASE_DB_FOLDER, "users", "*", INBOX_FOLDER)):
+        username = os.path.basename(os.path.dirname(inbox_dir))
+        added += add_files(username, find_video_files(inbox_dir), INBOX_FOLDER, move=True)
+    return added
+
+
+def has_pending_items():
+    init_bulk_queue()
+    conn = ingest_worker.get_jobs_connection()
+    row = conn.execute("SELECT 1 FROM bulk_items WHERE state='pending' LIMIT 1").fetchone()
+    conn.close()
+    return row is not None
+
+
+# scheduling
+def finish_item(item_id, state, **fields):
+    ingest_worker.take_api_key(f"bulk_{item_id}")
+    fields = {"state": state, **fields}
+    assignments = ", ".join([f"{name}=?" for name in fields])
+    conn = ingest_worker.get_jobs_connection()
+    conn.execute(f"UPDATE bulk_items SET {assignments}, updated_at=? WHERE id=?",
+                 (*fields.values(), time.time(), item_id))
+    conn.commit()
+    conn.close()
+
+
+def get_free_video_name(username, videos_dir, file_name):
+    """The file name, or 'name (2).ext' etc. if the library already has a different video with it."""
+    base, ext = os.path.splitext(file_name)
+    candidate, counter = file_name, 1
+    while os.path.exists(os.path.join(videos_dir, candidate)) or catalog.get_video(username, candidate):
+        counter += 1
+        candidate = f"{base} ({counter}){ext}"
+    return candidate
+
+
+def enqueue_item(item_id, username, source_path, move):
+    """Deduplicates one file and hands it to the job queue."""
+    file_hash = video_processor.compute_file_hash(source_path)
+    existing = catalog.find_video_by_hash(username, file_hash)
+    if existing:
+        if move: os.remove(source_path)
+        finish_item(item_id, "duplicate", video_name=existing['display_name'])
+        return
+
+    videos_dir, chroma_dir, _ = video_processor.get_user_paths(username)
+    video_name = get_free_video_name(username, videos_dir, os.path.basename(source_path))
+    file_path = os.path.join(videos_dir, video_name)
+    if move:
+        shutil.move(source_path, file_path)
+    else:
+        shutil.copy2(source_path, file_path)
+
+    job_id = ingest_worker.enqueue_job(username, video_name, file_path, chroma_dir,
+                                       ingest_worker.take_api_key(f"bulk_{item_id}"))
+    # recorded now, so a second copy later in the batch is recognized before this one is processed
+    catalog.update_video(username, video_name, file_hash=file_hash)
+    finish_item(item_id, "enqueued", video_name=video_name, job_id=job_id)
+
+
+def enqueue_next():
+    """Enqueues the oldest waiting file whose owner is below the concurrency limit. Returns True if one was."""
+    init_bulk_queue()
+    conn = ingest_worker.get_jobs_connection()
+    rows = conn.execute("SELECT id, username, source_path, move FROM bulk_items "
+                        "WHERE state='pending' ORDER BY id").fetchall()
+    conn.close()
+
+    busy_users = set()
+    for item_id, username, source_path, move in rows:
+        if username in busy_users: continue
+        if ingest_worker.count_pending_jobs(username) >= BULK_USER_CONCURRENCY:
+            busy_users.add(username)
+            continue
+        if not os.path.exists(source_path):
+            finish_item(item_id, "failed", error="File disappeared")
+            continue
+        if time.time() - os.path.getmtime(source_path) < FILE_SETTLE_SECONDS:
+            continue  # still being written
+
+        try:
+            enqueue_item(item_id, username, source_path, move)
+        except Exception as e:
+            print(f"Bulk import of {source_path} failed: {e}")
+            finish_item(item_id, "failed", error=str(e))
+        return True
+    return False
+
+
+def get_progress(username):
+    """Counts of the user's bulk imports: waiting, duplicate, queued, processing, done, failed, cancelled."""
+    init_bulk_queue()
+    conn = ingest_worker.get_jobs_connection()
+    rows = conn.execute("SELECT bulk_items.state, jobs.state, COUNT(*) FROM bulk_items "
+                        "LEFT JOIN jobs ON bulk_items.job_id = jobs.id WHERE bulk_items.username=? "
+                        "GROUP BY bulk_items.state, jobs.state", (username,)).fetchall()
+    conn.close()
+
+    progress = {"waiting": 0, "duplicate": 0, "queued": 0, "processing": 0, "done": 0, "failed": 0, "cancelled": 0}
+    for item_state, job_state, count in rows:
+        if item_state == "pending":
+            key = "waiting"
+        elif item_state == "enqueued":
+            key = {"new": "queued", "running": "processing"}.get(job_state, job_state or "failed")
+        else:
+            key = item_state
+        progress[key] = progress.get(key, 0) + count
+    return progress
+
+
+def clear_finished(username):
+    """Forgets imports that are over (done, duplicate, failed), resetting the progress counts."""
+    init_bulk_queue()
+    conn = ingest_worker.get_jobs_connection()
+    conn.execute("DELETE FROM bulk_items WHERE username=? AND (state IN ('duplicate', 'failed') OR "
+                 "(state='enqueued' AND job_id IN (SELECT id FROM jobs WHERE state IN "
+                 "('done', 'failed', 'cancelled'))))", (username,))
+    conn.commit()
+    conn.close()
+
+
+# supervisor side
+def watch_inboxes(scan_requested):
+    """Watches the drop folders with watchdog, so new files are picked up without waiting for a rescan."""
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+
+    class InboxHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory:
+                scan_requested.set()
+
+    observer = Observer()
+    observer.daemon = True
+    handler = InboxHandler()
+    watched = set()
+
+    def schedule_new_inboxes():
+        for inbox_dir in glob.glob(os.path.join(video_processor.BASE_DB_FOLDER, "users", "*", INBOX_FOLDER)):
+            if inbox_dir not in watched:
+                observer.schedule(handler, inbox_dir, recursive=True)
+                watched.add(inbox_dir)
+
+    schedule_new_inboxes()
+    observer.start()
+    return schedule_new_inboxes
+
+
+def run_scheduler():
+    """Supervisor thread: scans the drop folders and feeds waiting files to the job queue."""
+    init_bulk_queue()
+    scan_requested = threading.Event()
+    schedule_new_inboxes = None
+    if BULK_WATCH_ENABLED:
+        try:
+            schedule_new_inboxes = watch_inboxes(scan_requested)
+        except Exception as e:
+            # rescans alone still pick everything up, only later
+            print(f"Drop folder watching unavailable: {e}")
+
+    last_scan = 0
+    while True:
+        if scan_requested.is_set() or time.time() - last_scan > INBOX_RESCAN_INTERVAL:
+            scan_requested.clear()
+            last_scan = time.time()
+            try:
+                scan_inboxes()
+                if schedule_new_inboxes:
+                    schedule_new_inboxes()
+            except Exception as e:
+                print(f"Drop folder scan failed: {e}")
+
+        try:
+            enqueue_next()
+        except Exception as e:
+            print(f"Bulk scheduling failed: {e}")
+        time.sleep(BULK_ENQUEUE_INTERVAL)
@@ -0,0 +1,319 @@
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+import paths
+
+# configurations
+CATALOG_DB_FILE = os.path.join(paths.BASE_DB_FOLDER, "catalog.db")
+POOL_SIZE = 8  # idle connections kept open
+MIGRATION_CLAIM_TIMEOUT = 3600  # a migration claim older than this is considered abandoned
+VIDEO_STATES = ["queued", "processing", "ready", "error"]
+
+# library page orderings (column, with a name tie-break so pages are stable)
+VIDEO_SORTS = {
+    "name": "display_name COLLATE NOCASE",
+    "date": "created_at",
+    "status": "state",
+    "duration": "COALESCE(duration_sec, 0)"
+}
+
+# columns callers may set through add_video / update_video
+VIDEO_FIELDS = ["collection_name", "file_hash", "size_bytes", "duration_sec", "chunk_count",
+                "index_version", "model_version", "state"]
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _new_connection():
+    conn = sqlite3.connect(CATALOG_DB_FILE, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def connection():
+    """Borrows a pooled connection; commits on success, rolls back on error."""
+    init_catalog()
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _new_connection()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def init_catalog():
+    global _initialized
+    if _initialized: return
+    with _init_lock:
+        if _initialized: return
+        os.makedirs(paths.BASE_DB_FOLDER, exist_ok=True)
+        conn = _new_connection()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS videos (
+                username TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                display_name TEXT NOT NULL,
+                collection_name TEXT,
+                file_hash TEXT,
+                size_bytes INTEGER,
+                duration_sec REAL,
+                chunk_count INTEGER DEFAULT 0,
+                index_version INTEGER,
+                model_version TEXT,
+                state TEXT,
+                migration_claimed_at REAL,
+                created_at REAL,
+                updated_at REAL,
+                PRIMARY KEY (username, video_id)
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS videos_by_name ON videos(username, display_name);
+            CREATE INDEX IF NOT EXISTS videos_by_state ON videos(username, state);
+            CREATE INDEX IF NOT EXISTS videos_by_hash ON videos(username, file_hash);
+            -- one per library sort, matching its ORDER BY (collation, expression and name tie-break)
+            DROP INDEX IF EXISTS videos_by_created;
+            DROP INDEX IF EXISTS videos_by_duration;
+            CREATE INDEX IF NOT EXISTS videos_sort_name ON videos(username, display_name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS videos_sort_date ON videos(username, created_at, display_name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS videos_sort_status ON videos(username, state, display_name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS videos_sort_duration
+                ON videos(username, COALESCE(duration_sec, 0), display_name COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS backfilled_users (
+                username TEXT PRIMARY KEY,
+                backfilled_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS retired_collections (
+                username TEXT NOT NULL,
+                collection_name TEXT NOT NULL,
+                retired_at REAL,
+                PRIMARY KEY (username, collection_name)
+            );
+        ''')
+        # catalogs created before index migrations existed
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(videos)")]
+        if "migration_claimed_at" not in columns:
+            conn.execute("ALTER TABLE videos ADD COLUMN migration_claimed_at REAL")
+        conn.commit()
+        conn.close()
+        _initialized = True
+
+
+def _check_fields(fields):
+    unknown = set(fields) - set(VIDEO_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown catalog fields: {sorted(unknown)}")
+
+
+# write operations
+def add_video(username, display_name, **fields):
+    """Creates the catalog entry of a video, or updates it if the name is already known."""
+    _check_fields(fields)
+    now = time.time()
+    with connection() as conn:
+        row = conn.execute("SELECT video_id FROM videos WHERE username=? AND display_name=?",
+                           (username, display_name)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO videos(username, video_id, display_name, created_at, updated_at) "
+                          "VALUES (?,?,?,?,?)", (username, uuid.uuid4().hex, display_name, now, now))
+    if fields:
+        update_video(username, display_name, **fields)
+
+
+def update_video(username, display_name, **fields):
+    _check_fields(fields)
+    if not fields: return
+    assignments = ", ".join([f"{name}=?" for name in fields])
+    with connection() as conn:
+        conn.execute(f"UPDATE videos SET {assignments}, updated_at=? WHERE username=? AND display_name=?",
+                     (*fields.values(), time.time(), username, display_name))
+
+
+def rename_video(username, old_name, new_name, collection_name=None):
+    with connection() as conn:
+        conn.execute("UPDATE videos SET display_name=?, collection_name=COALESCE(?, collection_name), "
+                     "updated_at=? WHERE username=? AND display_name=?",
+                     (new_name, collection_name, time.time(), username, old_name))
+
+
+def remove_video(username, display_name):
+    with connection() as conn:
+        conn.execute("DELETE FROM videos WHERE username=? AND display_name=?", (username, display_name))
+
+
+# read operations
+def get_video(username, display_name):
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM videos WHERE username=? AND display_name=?",
+                           (username, display_name)).fetchone()
+    return dict(row) if row else None
+
+
+def list_videos(username, states=None):
+    """Returns the user's catalog rows (optionally only some states), ordered by name."""
+    query = "SELECT * FROM videos WHERE username=?"
+    params = [username]
+    if states:
+        query += f" AND state IN ({','.join(['?'] * len(states))})"
+        params += list(states)
+    with connection() as conn:
+        return [dict(row) for row in conn.execute(query + " ORDER BY display_name", params)]
+
+
+def query_videos(username, search=None, states=None, sort="name", descending=False, limit=None, offset=0):
+    """
+    One page of the user's videos, filtered and sorted by the database. Returns (rows, total),
+    total being the number of matching videos across all pages.
+    """
+    if sort not in VIDEO_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    where = "WHERE username=?"
+    params = [username]
+    if search:
+        where += " AND display_name LIKE ? ESCAPE '\\'"
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    if states:
+        where += f" AND state IN ({','.join(['?'] * len(states))})"
+        params += list(states)
+
+    direction = "DESC" if descending else "ASC"
+    # the same terms as the videos_sort_* indexes, so a page is read in index order without sorting
+    order = f"ORDER BY {VIDEO_SORTS[sort]} {direction}"
+    if sort != "name":
+        order += f", display_name COLLATE NOCASE {direction}"
+    with connection() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM videos {where}", params).fetchone()[0]
+        rows = conn.execute(f"SELECT * FROM videos {where} {order} LIMIT ? OFFSET ?",
+                            params + [-1 if limit is None else limit, offset]).fetchall()
+    return [dict(row) for row in rows], total
+
+
+def list_video_names(username, states=None):
+    return [row['display_name'] for row in list_videos(username, states)]
+
+
+def get_collection_names(username, states=None):
+    """Returns {display_name: collection_name} for the user's videos."""
+    return {row['display_name']: row['collection_name'] for row in list_videos(username, states)}
+
+
+def find_video_by_hash(username, file_hash):
+    """The user's video with this content that is indexed or on its way (used to skip duplicate imports)."""
+    with connection() as conn:
+        # a failed import is no reason to skip (or delete) another copy of the file
+        row = conn.execute("SELECT * FROM videos WHERE username=? AND file_hash=? AND state IS NOT 'error' LIMIT 1",
+                           (username, file_hash)).fetchone()
+    return dict(row) if row else None
+
+
+def get_storage_bytes(username):
+    with connection() as conn:
+        row = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM videos WHERE username=?",
+                           (username,)).fetchone()
+    return row[0]
+
+
+# maintenance
+def needs_backfill(username):
+    with connection() as conn:
+        row = conn.execute("SELECT 1 FROM backfilled_users WHERE username=?", (username,)).fetchone()
+    return row is None
+
+
+def mark_backfilled(username):
+    with connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO backfilled_users(username, backfilled_at) VALUES (?,?)",
+                     (username, time.time()))
+
+
+def fail_orphaned_videos(pending_jobs):
+    """Janitor: videos stuck in queued/processing without a pending job are marked as errors."""
+    with connection() as conn:
+        rows = conn.execute("SELECT username, display_name FROM videos "
+                            "WHERE state IN ('queued', 'processing')").fetchall()
+        orphaned = [(row['username'], row['display_name']) for row in rows
+                    if (row['username'], row['display_name']) not in pending_jobs]
+        for username, display_name in orphaned:
+            conn.execute("UPDATE videos SET state='error', updated_at=? WHERE username=? AND display_name=?",
+                         (time.time(), username, display_name))
+    return orphaned
+
+
+# index migrations
+def list_outdated_videos(index_version, model_version, username=None):
+    """Ready videos whose index was built with another schema or embedding model."""
+    query = "SELECT * FROM videos WHERE state='ready' AND (index_version IS NOT ? OR model_version IS NOT ?)"
+    params = [index_version, model_version]
+    if username:
+        query += " AND username=?"
+        params.append(username)
+    with connection() as conn:
+        return [dict(row) for row in conn.execute(query + " ORDER BY updated_at", params)]
+
+
+def claim_outdated_video(index_version, model_version):
+    """Atomically claims the next outdated video for migration. Returns the row or None."""
+    now = time.time()
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM videos WHERE state='ready' "
+                           "AND (index_version IS NOT ? OR model_version IS NOT ?) "
+                           "AND (migration_claimed_at IS NULL OR migration_claimed_at < ?) "
+                           "ORDER BY updated_at LIMIT 1",
+                           (index_version, model_version, now - MIGRATION_CLAIM_TIMEOUT)).fetchone()
+        if row is None: return None
+        conn.execute("UPDATE videos SET migration_claimed_at=? WHERE username=? AND video_id=?",
+                     (now, row['username'], row['video_id']))
+    return dict(row)
+
+
+def release_migration_claim(username, display_name):
+    with connection() as conn:
+        conn.execute("UPDATE videos SET migration_claimed_at=NULL WHERE username=? AND display_name=?",
+                     (username, display_name))
+
+
+def swap_collection(username, display_name, old_collection, new_collection, **fields):
+    """
+    Points a video at its rebuilt collection, only if it still uses old_collection and is ready
+    (a rename, re-upload or delete in the meantime wins). The old collection is retired.
+    Returns True if the swap happened.
+    """
+    _check_fields(fields)
+    assignments = "".join([f", {name}=?" for name in fields])
+    now = time.time()
+    with connection() as conn:
+        cur = conn.execute(f"UPDATE videos SET collection_name=?, migration_claimed_at=NULL, updated_at=?{assignments} "
+                           "WHERE username=? AND display_name=? AND collection_name=? AND state='ready'",
+                           (new_collection, now, *fields.values(), username, display_name, old_collection))
+        if cur.rowcount:
+            conn.execute("INSERT OR REPLACE INTO retired_collections(username, collection_name, retired_at) "
+                         "VALUES (?,?,?)", (username, old_collection, now))
+        return cur.rowcount > 0
+
+
+def pop_retired_collections(grace_seconds):
+    """Returns (and forgets) collections retired more than grace_seconds ago, so they can be dropped."""
+    cutoff = time.time() - grace_seconds
+    with connection() as conn:
+        rows = conn.execute("SELECT username, collection_name FROM retired_collections WHERE retired_at < ?",
+                            (cutoff,)).fetchall()
+        conn.execute("DELETE FROM retired_collections WHERE retired_at < ?", (cutoff,))
+    return [(row['username'], row['collection_name']) for row in rows]
@@ -0,0 +1,154 @@
+"""
+Persistent chat history, kept in the catalog database. Messages are stored per user and
+per conversation (the library chat, or one video's chat, keyed by the catalog video id so
+renames keep the history). Sources are stored as chunk references and their text is
+rebuilt from the cached transcript when a page of history is loaded.
+"""
+import json
+import time
+import threading
+import catalog
+import video_processor
+
+# configurations
+CHAT_WINDOW_SIZE = 20  # messages kept in the session; older ones are loaded on demand
+CHAT_PAGE_SIZE = 20  # messages loaded per "show earlier" click
+LIBRARY_CHAT = ""  # conversation id of the library-wide chat
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def init_chat_store():
+    global _initialized
+    if _initialized: return
+    with _init_lock:
+        if _initialized: return
+        with catalog.connection() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    conversation TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    query TEXT,
+                    is_quiz INTEGER DEFAULT 0,
+                    sources TEXT,
+                    created_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS chat_by_conversation ON chat_messages(username, conversation, id);
+            ''')
+        _initialized = True
+
+
+def get_conversation_id(username, video_name=None):
+    """The library chat for no video, else the video's catalog id (its name if it is not catalogued)."""
+    if video_name is None: return LIBRARY_CHAT
+    video = catalog.get_video(username, video_name)
+    return video['video_id'] if video else video_name
+
+
+# chunk references
+def make_source_ref(username, match, video_ids=None, window=0):
+    """Reduces a search match to what is needed to show it again (no text)."""
+    if video_ids is None:
+        video_ids = {}
+    if match['video_name'] not in video_ids:
+        video_ids[match['video_name']] = get_conversation_id(username, match['video_name'])
+    return {
+        "video_id": video_ids[match['video_name']],
+        "chunk_id": match.get('chunk_id'),
+        "window": window,
+        "start_time": match['start_time'],
+        "end_time": match['end_time'],
+        "score": match.get('score')
+    }
+
+
+def resolve_sources(username, refs, names_by_id, transcripts):
+    """Rebuilds the source texts of stored references. Sources of deleted videos are dropped."""
+    sources = []
+    for ref in refs:
+        video_name = names_by_id.get(ref['video_id'])
+        if video_name is None: continue
+        if video_name not in transcripts:
+            transcripts[video_name] = video_processor.load_transcript(username, video_name) or []
+        sources.append({
+            "video_name": video_name,
+            "chunk_id": ref['chunk_id'],
+            "text": get_chunk_text(username, video_name, ref, transcripts[video_name]),
+            "start_time": ref['start_time'],
+            "end_time": ref['end_time'],
+            "score": ref.get('score')
+        })
+    return sources
+
+
+def get_chunk_text(username, video_name, ref, segments):
+    """Text of a chunk and its neighbours (ref['window'] chunks on each side)."""
+    if not ref['chunk_id']: return ""
+    step = video_processor.GROUP_SIZE
+    first = int(ref['chunk_id'].rsplit('_', 1)[1]) - ref['window'] * step
+    if segments:
+        return " ".join([s['text'].strip() for s in segments[max(0, first):first + (2 * ref['window'] + 1) * step]])
+
+    # videos indexed before transcripts were cached: read the chunks back from the index
+    from query_engine import fetch_context_segments
+    try:
+        _, chroma_dir, _ = video_processor.get_user_paths(username)
+        collection = video_processor.open_collection(video_processor.get_db_client(chroma_dir),
+                                                     video_processor.get_collection_name(username, video_name))
+        return " ".join([seg['text'] for seg in fetch_context_segments(collection, ref['chunk_id'],
+                                                                          ref['window'])])
+    except Exception:
+        return ""
+
+
+# messages
+def add_message(username, conversation, role, content, sources=None, query=None, is_quiz=False):
+    """Stores a message (sources as chunk references). Returns its id."""
+    init_chat_store()
+    with catalog.connection() as conn:
+        cursor = conn.execute("INSERT INTO chat_messages(username, conversation, role, content, query, is_quiz, "
+                              "sources, created_at) VALUES (?,?,?,?,?,?,?,?)",
+                              (username, conversation, role, content, query, int(is_quiz),
+                               json.dumps(sources) if sources else None, time.time()))
+        return cursor.lastrowid
+
+
+def load_messages(username, conversation, before_id=None, limit=CHAT_WINDOW_SIZE):
+    """
+    Returns (messages, has_older): up to `limit` messages older than before_id (the newest
+    ones if None), oldest first, with their sources resolved.
+    """
+    init_chat_store()
+    query = "SELECT * FROM chat_messages WHERE username=? AND conversation=?"
+    params = [username, conversation]
+    if before_id is not None:
+        query += " AND id<?"
+        params.append(before_id)
+    with catalog.connection() as conn:
+        rows = conn.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+    has_older = len(rows) > limit
+    rows = list(reversed(rows[:limit]))
+
+    names_by_id = {row['video_id']: row['display_name'] for row in catalog.list_videos(username)}
+    transcripts = {}
+    messages = []
+    for row in rows:
+        message = {"id": row['id'], "role": row['role'], "content": row['content']}
+        if row['is_quiz']:
+            message['is_quiz'] = True
+        if row['query']:
+            message['query'] = row['query']
+        if row['sources']:
+            message['sources'] = resolve_sources(username, json.loads(row['sources']), names_by_id, transcripts)
+        messages.append(message)
+    return messages, has_older
+
+
+def clear_conversation(username, conversation):
+    init_chat_store()
+    with catalog.connection() as conn:
+        conn.execute("DELETE FROM chat_messages WHERE username=? AND conversation=?", (username, conversation))
@@ -0,0 +1,387 @@
+import os
+import re
+import html
+import json
+import time
+from urllib.parse import urlparse
+import streamlit as st
+import streamlit.components.v1 as components
+import chat_store
+import keyframes
+import warmup
+import media_server
+import video_processor
+import query_engine
+
+# configurations
+PLAYER_HEIGHT = 420
+SOURCE_FIELDS = ["video_name", "chunk_id", "text", "start_time", "end_time", "score"]  # kept in the session
+PLAYER_CHANNEL = "pinpoint-player"  # browser channel the jump buttons send seek times on
+
+
+# locking mechanism for video chat input
+def lock_video_chat():
+    st.session_state['processing_video'] = True
+
+
+def highlight_text(text, query):
+    """Highlights relevant keywords in the text based on the query."""
+    if not query: return text[:100] + "..."
+
+    # stopwords list
+    STOP_WORDS = {
+        "what", "where", "when", "how", "who", "why", "which",
+        "the", "is", "are", "was", "were", "be", "been", "being",
+        "and", "or", "but", "if", "because", "as", "until", "while",
+        "of", "at", "by", "for", "with", "about", "against", "between",
+        "into", "through", "during", "before", "after", "above", "below",
+        "to", "from", "up", "down", "in", "out", "on", "off", "over", "under",
+        "again", "further", "then", "once", "here", "there", "all", "any",
+        "can", "will", "just", "don", "should", "now"
+    }
+
+    raw_words = query.lower().split()
+
+    # keep words that are NOT stop words AND are > 2 chars
+    keywords = [w for w in raw_words if w not in STOP_WORDS and len(w) > 2]
+
+    # if filtering removed everything, we keep the original words to avoid breaking the logic
+    if not keywords:
+        keywords = [w for w in raw_words if len(w) > 2]
+
+    # we create a pattern that matches the keyword + any suffix (like 's', 'ing', 'ed')
+    if keywords:
+        pattern_str = r'\b(?:' + '|'.join([re.escape(w) + r'\w*' for w in keywords]) + r')'
+        regex = re.compile(pattern_str, re.IGNORECASE)
+    else:
+        regex = None
+
+    # find the first occurrence of ANY of our smart keywords
+    first_match_index = -1
+    if regex:
+        match = regex.search(text)
+        if match:
+            first_match_index = match.start()
+
+    if first_match_index != -1:
+        start = max(0, first_match_index - 30)
+        end = min(len(text), first_match_index + 60)
+        snippet = "..." + text[start:end] + "..."
+    else:
+        snippet = text[:80] + "..."
+
+    # apply highlight to all occurrences in the snippet
+    if regex:
+        highlighted = regex.sub(
+            lambda
+                m: f'<span style="background-color: rgba(255, 215, 0, 0.3); color: inherit; padding: 0px 2px; border-radius: 4px;">{m.group(0)}</span>',
+            snippet
+        )
+    else:
+        highlighted = snippet
+
+    return highlighted
+
+
+@st.cache_data(show_spinner=False)
+def load_keyframe_tiles(sprite_path, modified_at, boxes):
+    """Cuts the keyframe tiles out of the sprite (cached until the sprite changes)."""
+    from PIL import Image
+    with Image.open(sprite_path) as sprite:
+        return [sprite.crop(box).copy() for box in boxes]
+
+
+# video player: the web rendition is streamed with range requests, the original file otherwise
+def get_browser_host():
+    """The host name the browser opened the app on (None if unknown)."""
+    host = st.context.headers.get("Host")
+    return urlparse(f"//{host}").hostname if host else None
+
+
+def render_player(placeholder, video_path, video_name, username, start_time=0):
+    url = media_server.get_media_url(username, video_name, get_browser_host())
+    if url is None:
+        placeholder.video(video_path, start_time=int(start_time))
+        return
+
+    # the page only carries the URL, so a jump re-requests just the bytes around the new position;
+    # jumps from the chat and the timeline arrive over a browser channel (see seek_to)
+    autoplay = " autoplay" if start_time else ""
+    with placeholder.container():
+        components.html(
+            f'''<video id="player" src="{html.escape(url)}#t={int(start_time)}" controls preload="metadata"{autoplay}
+                       style="width: 100%; border-radius: 8px; background: black;"></video>
+            <script>
+                const player = document.getElementById("player");
+                new BroadcastChannel("{PLAYER_CHANNEL}").onmessage = (event) => {{
+                    if (event.data.video !== {json.dumps(video_name)}) return;
+                    player.currentTime = event.data.time;
+                    player.play();
+                }};
+            </script>''',
+            height=PLAYER_HEIGHT
+        )
+
+
+def seek_to(video_name, username, start_time):
+    """Jumps the player from inside a fragment, without rerunning the page when the rendition is streamed."""
+    st.session_state['start_time'] = start_time
+    if media_server.get_media_url(username, video_name, get_browser_host()) is None:
+        # st.video can only seek by being rendered again
+        st.rerun()
+
+    st.session_state['seek_nonce'] = st.session_state.get('seek_nonce', 0) + 1
+    message = {"video": video_name, "time": start_time, "nonce": st.session_state['seek_nonce']}
+    components.html(f"<script>new BroadcastChannel('{PLAYER_CHANNEL}').postMessage({json.dumps(message)});</script>",
+                    height=0)
+
+
+# scrubbable keyframe timeline under the player (scrubbing only reruns the timeline)
+@st.fragment
+def render_timeline(video_name, username):
+    index = video_processor.load_json_cache(video_processor.get_video_cache_path(username, "keyframes", video_name))
+    sprite_path = video_processor.get_keyframe_sprite_path(username, video_name)
+    if not index or not index['frames'] or not os.path.exists(sprite_path): return
+
+    frames = index['frames']
+    boxes = tuple([keyframes.get_tile_box(index, i) for i in range(len(frames))])
+    tiles = load_keyframe_tiles(sprite_path, os.path.getmtime(sprite_path), boxes)
+
+    position = st.select_slider(
+        "🎞️ Scenes", options=list(range(len(frames))),
+        format_func=lambda i: query_engine.format_timestamp(frames[i]['time']),
+        key=f"timeline_{video_name}"
+    )
+
+    # the selected scene with its neighbours
+    window = range(max(0, position - 2), min(len(frames), position + 3))
+    for col, i in zip(st.columns(5), window):
+        with col:
+            st.image(tiles[i], use_container_width=True)
+            label = query_engine.format_timestamp(frames[i]['time'])
+            button_type = "primary" if i == position else "secondary"
+            if st.button(f"▶ {label}", key=f"scene_{video_name}_{i}", type=button_type, use_container_width=True):
+                seek_to(video_name, username, frames[i]['time'])
+
+
+# chat history: the session keeps a window of the stored conversation
+def get_chat_window(state_key, username, video_name=None):
+    conversation = chat_store.get_conversation_id(username, video_name)
+    window = st.session_state.get(state_key)
+    if window is None or window['key'] != (username, conversation):
+        messages, has_older = chat_store.load_messages(username, conversation)
+        window = {"key": (username, conversation), "conversation": conversation,
+                  "messages": messages, "has_older": has_older}
+        st.session_state[state_key] = window
+    return window
+
+
+def add_chat_message(window, username, role, content, sources=None, query=None, is_quiz=False, source_window=0):
+    """Stores a message and appends it to the window (sources are stored as chunk references)."""
+    refs = None
+    if sources:
+        video_ids = {}
+        refs = [chat_store.make_source_ref(username, match, video_ids, source_window) for match in sources]
+        sources = [{k: match.get(k) for k in SOURCE_FIELDS} for match in sources]
+    message_id = chat_store.add_message(username, window['conversation'], role, content, refs, query, is_quiz)
+
+    message = {"id": message_id, "role": role, "content": content}
+    if sources is not None: message['sources'] = sources
+    if query: message['query'] = query
+    if is_quiz: message['is_quiz'] = True
+    window['messages'].append(message)
+
+    # older turns stay in the store only
+    if len(window['messages']) > chat_store.CHAT_WINDOW_SIZE:
+        del window['messages'][:-chat_store.CHAT_WINDOW_SIZE]
+        window['has_older'] = True
+
+
+def render_earlier_button(window, username, key):
+    if not window['has_older']: return
+    if st.button("⬆ Show earlier messages", key=key, use_container_width=True):
+        first_id = window['messages'][0]['id'] if window['messages'] else None
+        older, window['has_older'] = chat_store.load_messages(username, window['conversation'], before_id=first_id,
+                                                              limit=chat_store.CHAT_PAGE_SIZE)
+        window['messages'][:0] = older
+        st.rerun(scope="fragment")
+
+
+# library-wide chat (a question or an answer only reruns this pane)
+@st.fragment
+def render_library_chat(username, api_key):
+    window = get_chat_window('chat_history', username)
+    if not window['messages']:
+        st.markdown("""
+                <div style="text-align: center; padding: 40px 0;">
+                    <h1 style="font-size: 3rem; background: -webkit-linear-gradient(left, #FF4B4B, #FF914D); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">
+                        Ask your videos anything.
+                    </h1>
+                    <p style="color: #8B949E; font-size: 1.2rem;">
+                        Your personal video intelligence hub.
+                    </p>
+                </div>
+                """, unsafe_allow_html=True)
+
+    # render history
+    render_earlier_button(window, username, "chat_earlier")
+    for msg in window['messages']:
+        with st.chat_message(msg['role'], avatar="⚡" if msg['role'] == "assistant" else None):
+            st.write(msg['content'])
+            if "sources" in msg and msg['sources']:
+                with st.expander("📚 Sources"):
+                    for idx, match in enumerate(msg['sources']):
+                        c1, c2 = st.columns([4, 1])
+                        with c1:
+                            # Safe text truncation to avoid errors
+                            txt = match.get('text', '')[:100]
+                            st.caption(f"**{match['video_name']}**: *{txt}...*")
+                        with c2:
+                            if st.button("Play", key=f"hist_{msg['id']}_{idx}"):
+                                st.session_state['selected_video'] = match['video_name']
+                                st.session_state['start_time'] = match['start_time']
+                                # opening a video changes the page
+                                st.rerun()
+
+    # search videos across library (a new question supersedes one still running)
+    user_query = st.chat_input("Search across your entire library...")
+
+    if user_query:
+        # append user message to history
+        add_chat_message(window, username, "user", user_query)
+        with st.chat_message("user"):
+            st.write(user_query)
+
+        query_start = time.perf_counter()
+        future, token = query_engine.submit_query(user_query, username, api_key)
+        st.session_state['active_query'] = token
+        finished = False
+        try:
+            with st.chat_message("assistant", avatar="⚡"):
+                with st.spinner("🧠 Thinking..."):
+                    # each status update is a point where streamlit can interrupt this run
+                    status = st.empty()
+                    while not future.done():
+                        status.caption(f"{token.stage}...")
+                        time.sleep(0.1)
+                    status.empty()
+                    ai_response, matches = future.result()
+                    warmup.record_timing("first_query", time.perf_counter() - query_start, first_only=True)
+
+                # generate answer
+                if matches:
+                    add_chat_message(window, username, "assistant", ai_response, sources=matches, query=user_query,
+                                     source_window=query_engine.CONTEXT_WINDOW)
+                    st.write(ai_response)  # show answer immediately
+                else:
+                    msg = "I couldn't find any relevant information in your library."
+                    add_chat_message(window, username, "assistant", msg)
+                    st.write(msg)
+            finished = True
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+            finished = True
+        finally:
+            st.session_state.pop('active_query', None)
+            if not finished:
+                # the run was interrupted (new question or navigation): stop the old work
+                token.cancel()
+                future.cancel()
+                add_chat_message(window, username, "assistant", "⏹️ Stopped - a newer request took over.")
+        st.rerun(scope="fragment")
+
+
+# UI for the video chat (questions and jumps only rerun this pane)
+@st.fragment
+def render_search_ui(selected_video_name, video_path, video_player_placeholder, username, api_key):
+    st.markdown("### 💬 Chat with Video")
+
+    # the stored conversation of this video (switching videos loads the other one)
+    window = get_chat_window('video_chat_history', username, selected_video_name)
+
+    # lock state for this specific component
+    if 'processing_video' not in st.session_state:
+        st.session_state['processing_video'] = False
+
+    if st.button("🧠 Challenge me with a question!", use_container_width=True):
+        with st.spinner("Analyzing video..."):
+            quiz_content = query_engine.get_quiz_question(selected_video_name, username, api_key)
+            # append quiz message with a special flag
+            add_chat_message(window, username, "assistant", quiz_content, is_quiz=True)
+            st.rerun(scope="fragment")
+
+    # scrollable container
+    chat_container = st.container(height=500)
+    with chat_container:
+        render_earlier_button(window, username, "video_chat_earlier")
+        for msg in window['messages']:
+            avatar_style = "assistant" if msg['role'] == "assistant" else "user"
+            with st.chat_message(msg['role'], avatar=avatar_style):
+
+                # rendering logic for quiz messages
+                if msg.get('is_quiz') and "Solution:" in msg['content']:
+                    q_part, s_part = msg['content'].split("Solution:")
+                    st.markdown(f"**Challenge Question:**\n\n{q_part}")
+                    with st.expander("Check the Answer"):
+                        st.success(s_part.strip())
+                else:
+                    # text message rendering
+                    st.write(msg['content'])
+
+                if msg.get('sources'):
+                    st.divider()
+                    st.caption(f"Top {len(msg['sources'])} most relevant moments:")
+
+                    for idx, res in enumerate(msg['sources']):
+                        with st.container(border=True):
+                            # time calculation for playback control
+                            minutes = int(res['start_time'] // 60)
+                            seconds = int(res['start_time'] % 60)
+                            time_str = f"{minutes:02d}:{seconds:02d}"
+
+                            if st.button(f"Jump to {time_str}", key=f"vhist_{msg['id']}_{idx}"):
+                                seek_to(selected_video_name, username, res['start_time'])
+
+                            # render text with grey subtext styling
+                            st.markdown(
+                                f"<div style='margin-top: 10px; color: #CCCCCC;'>... {highlight_text(res['text'], msg.get('query'))} ...</div>",
+                                unsafe_allow_html=True)
+
+    # locked chat input
+    query = st.chat_input(
+        "Ask about this video...",
+        on_submit=lock_video_chat,
+        disabled=st.session_state['processing_video']
+    )
+
+    if query and selected_video_name:
+        add_chat_message(window, username, "user", query)
+
+        col_name = video_processor.get_collection_name(username, selected_video_name)
+        results = query_engine.search_single_video(col_name, query, username)
+
+        if results and results['documents']:
+            found_any = True
+            valid_results = []
+            # process and highlight results
+            for i in range(len(results['documents'][0])):
+                doc_text = results['documents'][0][i]
+                meta = results['metadatas'][0][i]
+                valid_results.append({
+                    'text': doc_text,
+                    'chunk_id': results['ids'][0][i],
+                    'video_name': selected_video_name,
+                    'start_time': meta['start_time'],
+                    'end_time': meta['end_time'],
+                    'score': -results['distances'][0][i]
+                })
+
+            if found_any:
+                with st.spinner("Analyzing..."):
+                    ai_answer = query_engine.ask_gemini(query, valid_results, api_key)
+                    add_chat_message(window, username, "assistant", ai_answer, sources=valid_results, query=query)
+        else:
+            add_chat_message(window, username, "assistant", "No matches found.")
+
+        st.session_state['processing_video'] = False
+        st.rerun(scope="fragment")
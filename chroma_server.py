@@ -0,0 +1,71 @@
+"""
+Local launcher for the shared vector-store server (optional client-server mode).
+With PINPOINT_CHROMA_MODE=server every app session and ingest worker talks to one
+Chroma server over pooled HTTP connections, and each user gets their own database,
+so the index can live on another machine and scale apart from the UI.
+
+    python chroma_server.py                      # serve Database/chroma_server on port 8000
+    PINPOINT_CHROMA_MODE=server streamlit run app.py
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import http.client
+import video_processor
+
+# configurations
+CHROMA_SERVER_PATH = os.path.join(video_processor.BASE_DB_FOLDER, "chroma_server")
+STARTUP_TIMEOUT = 30  # seconds to wait for a launched server to answer
+
+
+def is_server_alive(host=video_processor.CHROMA_HOST, port=video_processor.CHROMA_PORT):
+    conn = http.client.HTTPConnection(host, port, timeout=2)
+    try:
+        conn.request("GET", "/api/v2/heartbeat")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def get_server_command(path, host, port):
+    chroma = shutil.which("chroma")
+    if chroma:
+        return [chroma, "run", "--path", path, "--host", host, "--port", str(port)]
+    # same entry point as the "chroma" script, for environments without it on PATH
+    return [sys.executable, "-c", "from chromadb.cli.cli import app; app()",
+            "run", "--path", path, "--host", host, "--port", str(port)]
+
+
+def ensure_server_running(path=CHROMA_SERVER_PATH, host=video_processor.CHROMA_HOST,
+                          port=video_processor.CHROMA_PORT):
+    """Starts a detached local server if none answers (remote hosts are never launched). Returns True if up."""
+    if is_server_alive(host, port): return True
+    if host not in ("localhost", "127.0.0.1"):
+        print(f"⚠️ Vector store server {host}:{port} is not reachable")
+        return False
+
+    os.makedirs(path, exist_ok=True)
+    subprocess.Popen(get_server_command(path, host, port), cwd=os.getcwd(), start_new_session=True,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if is_server_alive(host, port): return True
+        time.sleep(0.5)
+    print(f"⚠️ Vector store server did not start within {STARTUP_TIMEOUT}s")
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PinPoint vector store server")
+    parser.add_argument("--path", default=CHROMA_SERVER_PATH)
+    parser.add_argument("--host", default=video_processor.CHROMA_HOST)
+    parser.add_argument("--port", type=int, default=video_processor.CHROMA_PORT)
+    args = parser.parse_args()
+    os.makedirs(args.path, exist_ok=True)
+    # run in the foreground, so the server stops with this process
+    sys.exit(subprocess.call(get_server_command(args.path, args.host, args.port)))
@@ -0,0 +1,84 @@
+import os
+import time
+import streamlit as st
+import answer_cache
+import metrics
+import model_manager
+
+# configurations
+ADMIN_USERS = [u.strip() for u in os.environ.get("PINPOINT_ADMIN_USERS", "").split(",") if u.strip()]
+MAX_TRACES_SHOWN = 20
+
+
+def is_admin(username):
+    return username in ADMIN_USERS
+
+
+def render_trace(spans):
+    """Shows one trace as an indented list of stages with their durations."""
+    depth = {}
+    for span in spans:
+        depth[span['span_id']] = depth.get(span['parent_id'], -1) + 1
+        level = depth[span['span_id']]
+        indent = "\u00a0" * 4 * level + ("↳ " if level else "")
+        attrs = ", ".join([f"{k}={v}" for k, v in span['attrs'].items()])
+        error = f" ❌ {span['error']}" if span['error'] else ""
+        st.caption(f"{indent}**{span['name']}** {span['seconds'] * 1000:.1f} ms{error}"
+                   + (f" · {attrs}" if attrs else ""))
+
+
+def group_traces(spans):
+    """Groups logged spans into traces (by root), newest first."""
+    traces = {}
+    for span in spans:
+        traces.setdefault(span['trace_id'], []).append(span)
+    finished = [sorted(t, key=lambda s: s['start']) for t in traces.values()
+                if any([s['parent_id'] is None for s in t])]
+    return sorted(finished, key=lambda t: t[0]['start'], reverse=True)
+
+
+def render_debug_page():
+    st.title("🩺 Debug")
+    st.caption(f"Spans are logged to `{metrics.SPANS_LOG_FILE}` and exported to "
+               f"`{metrics.METRICS_FOLDER}/*.prom` every {metrics.EXPORT_INTERVAL}s.")
+    if not metrics.METRICS_ENABLED:
+        st.warning("Instrumentation is disabled (PINPOINT_METRICS=0).")
+
+    # per-stage totals of this server process
+    st.subheader("Stages (this server)")
+    aggregates = metrics.get_aggregates()
+    if aggregates:
+        st.dataframe([{"stage": name, "count": stats['count'], "errors": stats['errors'],
+                       "avg ms": round(stats['avg_ms'], 1), "total s": round(stats['seconds'], 2),
+                       **{k: v for k, v in stats['attrs'].items()}}
+                      for name, stats in sorted(aggregates.items())], use_container_width=True)
+    else:
+        st.caption("Nothing recorded yet.")
+
+    st.subheader("Recent queries")
+    for spans in metrics.get_recent_traces()[:MAX_TRACES_SHOWN]:
+        root = spans[0]
+        started = time.strftime("%H:%M:%S", time.localtime(root['start']))
+        with st.expander(f"{started} · {root['name']} · {root['seconds'] * 1000:.0f} ms"):
+            render_trace(spans)
+
+    # ingestion runs in the worker processes, so it is read back from the log
+    st.subheader("Recent ingestion")
+    ingest_traces = [t for t in group_traces(metrics.read_log_tail()) if t[0]['name'] == "ingest"]
+    if not ingest_traces:
+        st.caption("No ingestion in the recent log.")
+    for spans in ingest_traces[:MAX_TRACES_SHOWN]:
+        root = spans[0]
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root['start']))
+        with st.expander(f"{started} · {root['process']} · {root['seconds']:.1f} s"):
+            render_trace(spans)
+
+    st.subheader("Answer cache")
+    st.caption("Library questions answered from the semantic cache instead of a new search and LLM call.")
+    st.json(answer_cache.get_stats(), expanded=False)
+
+    st.subheader("Models")
+    st.json(model_manager.manager.get_stats(), expanded=False)
+
+    with st.expander("Prometheus export"):
+        st.code(metrics.render_prometheus(), language="text")
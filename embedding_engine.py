@@ -0,0 +1,94 @@
+"""
+Embedding engine used by ingestion and queries. Texts are encoded in EMBEDDING_BATCH_SIZE
+batches by the shared model, with at most EMBEDDING_CONCURRENCY encodes running at once so
+concurrent sessions don't oversubscribe the CPU. The model runs on PyTorch (fp32) by default,
+or on ONNX Runtime (fp32 or int8-quantized) on CPU:
+
+    PINPOINT_EMBEDDING_BACKEND=onnx-int8 streamlit run app.py
+
+The ONNX backends need `pip install "sentence-transformers[onnx]"`; without it the engine
+falls back to PyTorch. `python benchmark.py embed` compares the backends' throughput and
+latency and checks their vectors against the PyTorch ones (cosine agreement).
+"""
+import os
+import platform
+import threading
+import numpy as np
+import model_manager
+
+# configurations
+EMBEDDING_BACKEND = os.environ.get("PINPOINT_EMBEDDING_BACKEND", "torch")  # "torch", "onnx" or "onnx-int8"
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+EMBEDDING_BATCH_SIZE = int(os.environ.get("PINPOINT_EMBEDDING_BATCH", 64))  # texts per forward pass
+EMBEDDING_THREADS = int(os.environ.get("PINPOINT_EMBEDDING_THREADS", 0))  # ONNX intra-op threads, 0 = library default
+TORCH_THREADS = int(os.environ.get("PINPOINT_TORCH_THREADS", 0))  # process-wide, see set_torch_threads
+EMBEDDING_CONCURRENCY = int(os.environ.get("PINPOINT_EMBEDDING_CONCURRENCY", 2))  # encodes running at once
+# quantized weights shipped with the model on the Hugging Face hub
+ONNX_INT8_FILE = os.environ.get("PINPOINT_EMBEDDING_ONNX_FILE") or (
+    "onnx/model_qint8_arm64.onnx" if platform.machine().lower() in ("arm64", "aarch64")
+    else "onnx/model_quint8_avx2.onnx")
+
+# what indexes record as their embedding model: another backend's vectors (e.g. int8) differ slightly
+EMBEDDING_MODEL_VERSION = model_manager.EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" \
+    else f"{model_manager.EMBEDDING_MODEL_NAME}+{EMBEDDING_BACKEND}"
+
+_slots = threading.BoundedSemaphore(EMBEDDING_CONCURRENCY)
+
+
+def set_torch_threads(threads=TORCH_THREADS):
+    """Caps PyTorch's intra-op threads. This is global to the process: Whisper and the reranker share them."""
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def load_model(backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS):
+    """
+    Loads the embedding model on a backend (the model manager calls this with the configured one).
+    threads only limits the embedder's own ONNX session; PyTorch follows set_torch_threads.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if backend == "torch" or model_manager.get_device() == "cuda":
+        set_torch_threads()
+        return SentenceTransformer(model_manager.EMBEDDING_MODEL_NAME, device=model_manager.get_device())
+
+    try:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+        if backend == "onnx-int8":
+            model_kwargs['file_name'] = ONNX_INT8_FILE
+        return SentenceTransformer(model_manager.EMBEDDING_MODEL_NAME, device="cpu", backend="onnx",
+                                   model_kwargs=model_kwargs)
+    except Exception as e:
+        print(f"⚠️ ONNX embedding backend unavailable ({e}), using PyTorch")
+        return load_model("torch", threads)
+
+
+def encode_with(model, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """Encodes texts with a given model. Returns a float32 array (one row per text)."""
+    embeddings = model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def encode(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """Encodes texts with the shared model, waiting for a free slot if EMBEDDING_CONCURRENCY encodes are running."""
+    texts = list(texts)
+    if not texts: return np.zeros((0, 0), dtype=np.float32)
+    with _slots, model_manager.manager.use("embedder") as model:
+        return encode_with(model, texts, batch_size)
+
+
+def cosine_agreement(reference, candidate):
+    """Row-wise cosine similarity of two embedding matrices. Returns {"mean", "min", "p1"}."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    cosines = (reference * candidate).sum(axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1), 1e-12)
+    return {"mean": round(float(cosines.mean()), 5), "min": round(float(cosines.min()), 5),
+            "p1": round(float(np.percentile(cosines, 1)), 5)}
@@ -0,0 +1,399 @@
+"""
+Out-of-process ingestion. The web server only enqueues jobs in a local SQLite queue;
+a supervisor process runs a pool of worker processes (each with its own models) that
+claim and process them. Progress, cancellation and completion keep flowing through the
+files in Database/processing, so the server never runs Whisper itself. Idle workers
+rebuild indexes made with an older INDEX_VERSION or embedding model in the background,
+and the supervisor also feeds bulk imports (see bulk_ingest.py) into the queue.
+
+    python ingest_worker.py --workers 2
+"""
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import tomllib
+import argparse
+import threading
+import subprocess
+import multiprocessing
+import catalog
+import metrics
+import embedding_engine
+import video_processor
+
+# configurations
+JOBS_DB_FILE = os.path.join(video_processor.BASE_DB_FOLDER, "jobs.db")
+INGEST_WORKERS = int(os.environ.get("PINPOINT_INGEST_WORKERS", 1))
+POLL_INTERVAL = 2  # seconds between queue polls of an idle worker
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 30  # a worker silent for this long is considered dead
+MAX_ATTEMPTS = 3  # a job that crashed its worker this many times is failed
+SUPERVISOR_ID = "supervisor"
+# API keys handed to a job are kept out of the queue, in owner-only files deleted on claim
+JOB_KEYS_FOLDER = os.path.join(video_processor.BASE_DB_FOLDER, "job_keys")
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+# idle workers rebuild indexes made with an older schema or embedding model
+INDEX_MIGRATIONS_ENABLED = os.environ.get("PINPOINT_INDEX_MIGRATIONS", "1") == "1"
+
+_janitor_lock = threading.Lock()
+_janitor_done = False
+
+
+# job queue
+def get_jobs_connection():
+    conn = sqlite3.connect(JOBS_DB_FILE, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_job_queue():
+    conn = get_jobs_connection()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            video_name TEXT,
+            file_path TEXT,
+            chroma_path TEXT,
+            state TEXT,
+            attempts INTEGER DEFAULT 0,
+            worker_id TEXT,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, id)")
+    # queues created before keys moved out of the database
+    if "api_key" in [column[1] for column in conn.execute("PRAGMA table_info(jobs)")]:
+        conn.execute("UPDATE jobs SET api_key=NULL WHERE api_key IS NOT NULL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            pid INTEGER,
+            heartbeat_at REAL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+# API keys
+def get_default_api_key():
+    """The installation's key: $GEMINI_API_KEY, then the Streamlit secrets file."""
+    if os.environ.get("GEMINI_API_KEY"): return os.environ["GEMINI_API_KEY"]
+    try:
+        with open(SECRETS_FILE, "rb") as f:
+            return tomllib.load(f).get("GEMINI_API_KEY", "")
+    except (OSError, tomllib.TOMLDecodeError):
+        return ""
+
+
+def store_api_key(name, api_key):
+    """Keeps a key for a queued item in a file only the owner can read."""
+    if not api_key: return
+    os.makedirs(JOB_KEYS_FOLDER, mode=0o700, exist_ok=True)
+    fd = os.open(os.path.join(JOB_KEYS_FOLDER, name), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(api_key)
+
+
+def take_api_key(name):
+    """Reads and deletes a stored key. Returns "" if there is none."""
+    path = os.path.join(JOB_KEYS_FOLDER, name)
+    try:
+        with open(path) as f:
+            api_key = f.read()
+        os.remove(path)
+        return api_key
+    except OSError:
+        return ""
+
+
+# job queue
+def enqueue_job(username, video_name, file_path, chroma_path, api_key=""):
+    """Queues a video for ingestion and shows it as queued in the progress panel."""
+    init_job_queue()
+    now = time.time()
+    conn = get_jobs_connection()
+    # workers only claim 'queued' jobs, so none starts before its key and catalog row are in place
+    cur = conn.execute(
+        "INSERT INTO jobs(username, video_name, file_path, chroma_path, state, created_at, updated_at) "
+        "VALUES (?,?,?,?,'new',?,?)",
+        (username, video_name, file_path, chroma_path, now, now))
+    conn.commit()
+    job_id = cur.lastrowid
+    try:
+        store_api_key(f"job_{job_id}", api_key)
+        video_processor.update_progress(username, video_name, 0, "Queued...")
+        catalog.add_video(username, video_name, state="queued", size_bytes=os.path.getsize(file_path))
+        conn.execute("UPDATE jobs SET state='queued', updated_at=? WHERE id=?", (time.time(), job_id))
+    except Exception:
+        conn.execute("UPDATE jobs SET state='failed', updated_at=? WHERE id=?", (time.time(), job_id))
+        take_api_key(f"job_{job_id}")
+        raise
+    finally:
+        conn.commit()
+        conn.close()
+    return job_id
+
+
+def cancel_queued_jobs(username, video_name):
+    """Drops jobs of this video that no worker has picked up yet. Returns how many were dropped."""
+    init_job_queue()
+    conn = get_jobs_connection()
+    job_ids = [row[0] for row in conn.execute("SELECT id FROM jobs WHERE username=? AND video_name=? "
+                                              "AND state='queued'", (username, video_name))]
+    cur = conn.execute("UPDATE jobs SET state='cancelled', updated_at=? "
+                       "WHERE username=? AND video_name=? AND state='queued'", (time.time(), username, video_name))
+    conn.commit()
+    conn.close()
+    for job_id in job_ids:
+        take_api_key(f"job_{job_id}")
+    return cur.rowcount
+
+
+def claim_job(worker_id):
+    """Atomically moves the oldest queued job to 'running' for this worker."""
+    conn = get_jobs_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT id, username, video_name, file_path, chroma_path FROM jobs "
+                           "WHERE state='queued' ORDER BY id LIMIT 1").fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET state='running', worker_id=?, attempts=attempts+1, updated_at=? "
+                         "WHERE id=?", (worker_id, time.time(), row[0]))
+        conn.commit()
+        return row
+    finally:
+        conn.close()
+
+
+def finish_job(job_id, state, error=None):
+    conn = get_jobs_connection()
+    conn.execute("UPDATE jobs SET state=?, error=?, updated_at=? WHERE id=?",
+                 (state, error, time.time(), job_id))
+    conn.commit()
+    conn.close()
+
+
+def heartbeat(worker_id):
+    conn = get_jobs_connection()
+    conn.execute("INSERT OR REPLACE INTO workers(worker_id, pid, heartbeat_at) VALUES (?,?,?)",
+                 (worker_id, os.getpid(), time.time()))
+    conn.commit()
+    conn.close()
+
+
+def start_heartbeat(worker_id):
+    """
+    Heartbeats from a side thread, so a long transcription doesn't look like a dead worker.
+    Returns an event that stops them.
+    """
+    stop = threading.Event()
+    heartbeat(worker_id)
+
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                heartbeat(worker_id)
+            except sqlite3.Error:
+                pass
+
+    threading.Thread(target=beat, daemon=True, name="heartbeat").start()
+    return stop
+
+
+def requeue_orphaned_jobs():
+    """Puts running jobs of dead workers back in the queue (or fails them after MAX_ATTEMPTS)."""
+    cutoff = time.time() - HEARTBEAT_TIMEOUT
+    conn = get_jobs_connection()
+    orphaned = conn.execute('''
+        SELECT jobs.id, jobs.attempts FROM jobs LEFT JOIN workers ON jobs.worker_id = workers.worker_id
+        WHERE jobs.state='running' AND (workers.heartbeat_at IS NULL OR workers.heartbeat_at < ?)
+    ''', (cutoff,)).fetchall()
+    for job_id, attempts in orphaned:
+        state = 'queued' if attempts < MAX_ATTEMPTS else 'failed'
+        conn.execute("UPDATE jobs SET state=?, worker_id=NULL, updated_at=? WHERE id=? AND state='running'",
+                     (state, time.time(), job_id))
+        print(f"Job {job_id} lost its worker, now {state}")
+    # jobs whose enqueueing process died before it finished
+    conn.execute("UPDATE jobs SET state='failed', error='Enqueueing interrupted', updated_at=? "
+                 "WHERE state='new' AND updated_at < ?", (time.time(), cutoff))
+    conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+    conn.commit()
+    conn.close()
+
+
+def get_pending_videos():
+    """Returns {(username, video_name)} of queued or running jobs (or ones being enqueued)."""
+    init_job_queue()
+    conn = get_jobs_connection()
+    rows = conn.execute("SELECT username, video_name FROM jobs "
+                        "WHERE state IN ('new', 'queued', 'running')").fetchall()
+    conn.close()
+    return set(rows)
+
+
+def clean_up_orphans():
+    """
+    Once per process: cleans up after a crash. Videos left queued/processing and progress files
+    without a queued or running job (headless ingests have one too) are failed and cleared.
+    """
+    global _janitor_done
+    with _janitor_lock:
+        if _janitor_done: return
+        _janitor_done = True
+    pending_videos = get_pending_videos()
+    catalog.fail_orphaned_videos(pending_videos)
+    video_processor.clear_stale_progress(pending_videos)
+
+
+def count_pending_jobs(username):
+    """Queued or running jobs of one user."""
+    init_job_queue()
+    conn = get_jobs_connection()
+    row = conn.execute("SELECT COUNT(*) FROM jobs WHERE username=? AND state IN ('new', 'queued', 'running')",
+                       (username,)).fetchone()
+    conn.close()
+    return row[0]
+
+
+def has_pending_jobs():
+    init_job_queue()
+    conn = get_jobs_connection()
+    row = conn.execute("SELECT 1 FROM jobs WHERE state IN ('new', 'queued', 'running') LIMIT 1").fetchone()
+    conn.close()
+    return row is not None
+
+
+def workers_alive():
+    """True if a supervisor has sent a heartbeat recently."""
+    init_job_queue()
+    conn = get_jobs_connection()
+    row = conn.execute("SELECT heartbeat_at FROM workers WHERE worker_id=?", (SUPERVISOR_ID,)).fetchone()
+    conn.close()
+    return bool(row) and row[0] > time.time() - HEARTBEAT_TIMEOUT
+
+
+def ensure_workers_running(num_workers=INGEST_WORKERS):
+    """Starts the worker pool as a detached process if no supervisor is alive."""
+    if workers_alive(): return
+    script = os.path.abspath(__file__)
+    subprocess.Popen([sys.executable, script, "--workers", str(num_workers)], cwd=os.getcwd(),
+                     start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # claim the supervisor slot right away so parallel sessions don't spawn a second pool
+    heartbeat(SUPERVISOR_ID)
+
+
+# index migrations
+def has_outdated_videos():
+    """True if idle workers have indexes to rebuild (and migrations are on)."""
+    return INDEX_MIGRATIONS_ENABLED and bool(
+        catalog.list_outdated_videos(video_processor.INDEX_VERSION, embedding_engine.EMBEDDING_MODEL_VERSION))
+
+
+def migrate_next_video():
+    """
+    Rebuilds the next video whose index predates the current INDEX_VERSION or embedding model.
+    Runs in idle workers, one video at a time, so uploads always go first. Returns True if a video was claimed.
+    """
+    row = catalog.claim_outdated_video(video_processor.INDEX_VERSION, embedding_engine.EMBEDDING_MODEL_VERSION)
+    if row is None: return False
+
+    username, video_name = row['username'], row['display_name']
+    print(f"Rebuilding the index of {video_name} for {username}")
+    try:
+        if video_processor.reindex_video(username, video_name) is None:
+            # renamed or re-uploaded meanwhile; try again with the current entry
+            catalog.release_migration_claim(username, video_name)
+    except Exception as e:
+        # the claim is left to expire, so a broken video doesn't block the others
+        print(f"Index migration of {video_name} failed: {e}")
+    return True
+
+
+# worker processes
+def worker_main(slot=0):
+    worker_id = f"worker-{uuid.uuid4().hex[:8]}"
+    metrics.set_process_name(f"ingest_{slot}")
+    start_heartbeat(worker_id)
+
+    while True:
+        job = claim_job(worker_id)
+        if not job:
+            video_processor.drop_retired_collections()
+            if not (INDEX_MIGRATIONS_ENABLED and migrate_next_video()):
+                time.sleep(POLL_INTERVAL)
+            continue
+
+        job_id, username, video_name, file_path, chroma_path = job
+        # the uploader's key, else the installation's (a requeued job's key was taken by its first run)
+        api_key = take_api_key(f"job_{job_id}") or get_default_api_key()
+        print(f"[{worker_id}] processing {video_name} for {username}")
+        try:
+            success = video_processor.process_video_in_background(file_path, video_name, chroma_path, username,
+                                                                   api_key)
+            finish_job(job_id, {True: 'done', False: 'failed'}.get(success, 'cancelled'))
+        except Exception as e:
+            finish_job(job_id, 'failed', str(e))
+        metrics.flush()
+
+
+def run_job_here(username, video_name, file_path, chroma_path, api_key=""):
+    """
+    Ingests a video in the calling process (headless imports). It is recorded as a running job
+    with its own heartbeat, like a worker's, so the janitors leave it alone and the supervisor
+    requeues it if this process dies. Returns what process_video_in_background returns.
+    """
+    init_job_queue()
+    worker_id = f"inline-{uuid.uuid4().hex[:8]}"
+    stop = start_heartbeat(worker_id)
+    now = time.time()
+    conn = get_jobs_connection()
+    cur = conn.execute(
+        "INSERT INTO jobs(username, video_name, file_path, chroma_path, state, attempts, worker_id, created_at, "
+        "updated_at) VALUES (?,?,?,?,'running',1,?,?,?)",
+        (username, video_name, file_path, chroma_path, worker_id, now, now))
+    conn.commit()
+    conn.close()
+    try:
+        success = video_processor.process_video_in_background(file_path, video_name, chroma_path, username,
+                                                               api_key)
+        finish_job(cur.lastrowid, {True: 'done', False: 'failed'}.get(success, 'cancelled'))
+        return success
+    except Exception as e:
+        finish_job(cur.lastrowid, 'failed', str(e))
+        raise
+    finally:
+        stop.set()
+
+
+def run_pool(num_workers):
+    """Supervisor: keeps num_workers worker processes alive and recovers jobs of crashed ones."""
+    init_job_queue()
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}  # slot -> process; a replacement worker takes over the slot (and its metrics file)
+    print(f"Ingestion supervisor started with {num_workers} worker(s)")
+
+    # drop folders and folder imports are fed into the queue by a throttled scheduler
+    import bulk_ingest
+    threading.Thread(target=bulk_ingest.run_scheduler, daemon=True, name="bulk-scheduler").start()
+
+    while True:
+        heartbeat(SUPERVISOR_ID)
+        for slot in range(num_workers):
+            if slot not in processes or not processes[slot].is_alive():
+                processes[slot] = ctx.Process(target=worker_main, args=(slot,), daemon=True)
+                processes[slot].start()
+        requeue_orphaned_jobs()
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PinPoint ingestion worker pool")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+    run_pool(args.workers)
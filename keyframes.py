@@ -0,0 +1,139 @@
+"""
+Single-pass visual index of a video. The file is decoded once at a reduced frame rate;
+colour histograms of the sampled frames are compared in vectorized batches, and frames
+where the picture changes (e.g. a new slide) are kept as small keyframes. Keyframes are
+stored as one sprite image (a grid of tiles) plus a JSON index of their timestamps, and
+the first frame that decodes doubles as the library thumbnail.
+"""
+import math
+
+# configurations
+SAMPLE_FPS = 1.0  # frames per second that are looked at
+SCENE_CHANGE_THRESHOLD = 0.35  # histogram distance (0-1) that counts as a new scene
+MIN_KEYFRAME_GAP = 2.0  # seconds between two keyframes
+MAX_KEYFRAMES = 200  # the strongest changes are kept beyond this
+BATCH_FRAMES = 64  # sampled frames compared per vectorized step
+HIST_BINS = 16  # bins per colour channel
+TILE_SIZE = (160, 90)  # keyframe size in the sprite (histograms are computed on it too)
+SPRITE_COLUMNS = 10
+THUMBNAIL_SIZE = (640, 360)
+JPEG_QUALITY = 80
+
+
+def batch_histograms(frames):
+    """Normalized per-channel colour histograms of a (N, H, W, 3) uint8 batch, computed in one bincount."""
+    import numpy as np
+
+    n = frames.shape[0]
+    bins = (frames >> (8 - int(math.log2(HIST_BINS)))).astype(np.int64)  # 0..HIST_BINS-1
+    offsets = (np.arange(n)[:, None, None, None] * 3 + np.arange(3)[None, None, None, :]) * HIST_BINS
+    counts = np.bincount((bins + offsets).ravel(), minlength=n * 3 * HIST_BINS)
+    hist = counts.reshape(n, 3 * HIST_BINS).astype(np.float32)
+    return hist / (frames.shape[1] * frames.shape[2] * 3)
+
+
+def histogram_distances(hists, previous=None):
+    """Half the L1 distance between each histogram and the one before it (0 = same, 1 = disjoint)."""
+    import numpy as np
+
+    if previous is None:
+        previous = hists[:1]
+    stacked = np.concatenate([previous[None, :] if previous.ndim == 1 else previous, hists])
+    return 0.5 * np.abs(np.diff(stacked, axis=0)).sum(axis=1)
+
+
+def extract_keyframes(video_path, thumbnail_path, sprite_path, should_stop=None):
+    """
+    Decodes the video once, writing the thumbnail and the keyframe sprite. Returns the sprite
+    index ({"tile_width", "tile_height", "columns", "frames": [{"time", "score"}]}), or None
+    if should_stop() (polled between batches) asked to abandon the pass.
+    """
+    import cv2
+    import numpy as np
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(1, int(round(fps / SAMPLE_FPS)))
+
+    candidates = []  # (time, score, encoded tile)
+    previous_hist = None
+    last_keyframe_time = -MIN_KEYFRAME_GAP
+    frame_idx = 0
+    finished = False
+    thumbnail_written = False
+
+    try:
+        while not finished:
+            if should_stop and should_stop():
+                return None
+
+            # decode the next batch of sampled frames; the frames in between are only grabbed
+            times, tiles = [], []
+            while len(tiles) < BATCH_FRAMES:
+                if not cap.grab():
+                    finished = True
+                    break
+                if frame_idx % step == 0:
+                    ok, frame = cap.retrieve()
+                    if ok:
+                        # frame 0 doesn't always decode: the first frame that does is the thumbnail
+                        if not thumbnail_written:
+                            thumbnail_written = cv2.imwrite(thumbnail_path, cv2.resize(frame, THUMBNAIL_SIZE))
+                        times.append(frame_idx / fps)
+                        tiles.append(cv2.resize(frame, TILE_SIZE, interpolation=cv2.INTER_AREA))
+                frame_idx += 1
+            if not tiles: break
+
+            hists = batch_histograms(np.stack(tiles))
+            distances = histogram_distances(hists, previous_hist)
+            if previous_hist is None:
+                distances[0] = 1.0  # the first frame always opens the timeline
+            previous_hist = hists[-1]
+
+            for t, distance, tile in zip(times, distances, tiles):
+                if distance >= SCENE_CHANGE_THRESHOLD and t - last_keyframe_time >= MIN_KEYFRAME_GAP:
+                    ok, encoded = cv2.imencode(".jpg", tile, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                    if ok:
+                        candidates.append((t, float(distance), encoded))
+                        last_keyframe_time = t
+    finally:
+        cap.release()
+
+    # keep the strongest changes (the first frame always stays), in time order
+    if len(candidates) > MAX_KEYFRAMES:
+        first, rest = candidates[0], sorted(candidates[1:], key=lambda c: c[1], reverse=True)
+        candidates = sorted([first] + rest[:MAX_KEYFRAMES - 1], key=lambda c: c[0])
+
+    return write_sprite(candidates, sprite_path)
+
+
+def write_sprite(candidates, sprite_path):
+    import cv2
+    import numpy as np
+
+    width, height = TILE_SIZE
+    columns = max(1, min(SPRITE_COLUMNS, len(candidates)))
+    if candidates:
+        rows = math.ceil(len(candidates) / columns)
+        sprite = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+        for i, (_, _, encoded) in enumerate(candidates):
+            row, col = divmod(i, columns)
+            tile = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+            sprite[row * height:(row + 1) * height, col * width:(col + 1) * width] = tile
+        cv2.imwrite(sprite_path, sprite, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+
+    return {
+        "tile_width": width,
+        "tile_height": height,
+        "columns": columns,
+        "frames": [{"time": round(t, 2), "score": round(score, 3)} for t, score, _ in candidates]
+    }
+
+
+def get_tile_box(index, position):
+    """Pixel box (left, top, right, bottom) of a keyframe inside the sprite."""
+    row, col = divmod(position, index['columns'])
+    w, h = index['tile_width'], index['tile_height']
+    return col * w, row * h, (col + 1) * w, (row + 1) * h
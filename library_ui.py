@@ -0,0 +1,309 @@
+import os
+import time
+import base64
+import streamlit as st
+import bulk_ingest
+import catalog
+import video_processor
+import query_engine
+import ingest_worker
+
+# configurations
+STORAGE_QUOTA_GB = 10
+PROGRESS_REFRESH_SECONDS = 1
+BULK_REFRESH_SECONDS = 3
+BULK_LABELS = {"waiting": "⏳ waiting", "queued": "📥 queued", "processing": "⚙️ processing", "done": "✅ done",
+               "duplicate": "♻️ duplicates", "failed": "⚠️ failed", "cancelled": "❌ cancelled"}
+LIBRARY_PAGE_SIZE = 12  # cards per library page
+THUMBNAIL_CACHE_ENTRIES = 256
+STATE_LABELS = {"ready": "✅ Ready", "processing": "⚙️ Processing", "queued": "⏳ Queued", "error": "⚠️ Error"}
+SORT_LABELS = {"name": "Name", "date": "Date added", "status": "Status", "duration": "Duration"}
+
+
+@st.dialog("📊 Video Intelligence Summary", width="large")
+def show_summary_popup(video_name, username, api_key):
+    # manage state to prevent re-running AI on every interaction
+    state_key = f"summary_{video_name}"
+    if state_key not in st.session_state:
+        with st.spinner("Generating summary..."):
+            summary_text = query_engine.generate_video_summary(video_name, username, api_key)
+            st.session_state[state_key] = summary_text
+
+    summary_text = st.session_state[state_key]
+    st.markdown(summary_text)
+    st.divider()
+
+    #  TXT download option 
+    st.download_button(
+        label="📄 Download TXT",
+        data=summary_text,
+        file_name=f"{video_name}_summary.txt",
+        mime="text/plain",
+        use_container_width=True
+    )
+
+
+# background jobs, refreshed on their own interval instead of rerunning the whole page
+def progress_panel(username, polling):
+    active_jobs = video_processor.get_active_progress(username)
+    if not active_jobs:
+        # the last job ended: rerun the page, which stops the refresh
+        if polling: st.rerun()
+        return
+
+    st.info("🔄 Processing in background...")
+    for job in active_jobs:
+        c_text, c_btn = st.columns([5, 1])
+        with c_text:
+            st.write(f"**{job['video']}**: {job['stage']}")
+            st.progress(job['progress'])
+        with c_btn:
+            st.write("")
+            if st.button("❌", key=f"cancel_{job['video']}", help="Cancel Processing"):
+                if ingest_worker.cancel_queued_jobs(username, job['video']):
+                    # no worker picked it up yet, so there is nothing to interrupt
+                    video_processor.delete_video(username, job['video'])
+                else:
+                    video_processor.request_cancellation(username, job['video'])
+                video_processor.clear_progress(username, job['video'])
+
+                st.toast(f"Cancelling {job['video']}...")
+                st.rerun(scope="fragment")
+
+
+def render_progress_panel(username):
+    """Refreshes every PROGRESS_REFRESH_SECONDS while the user has background jobs."""
+    polling = bool(video_processor.get_active_progress(username))
+    st.fragment(progress_panel, run_every=PROGRESS_REFRESH_SECONDS if polling else None)(username, polling)
+
+
+def has_pending_imports(progress):
+    return progress['waiting'] + progress['queued'] + progress['processing'] > 0
+
+
+# aggregate progress of bulk imports
+def bulk_progress(username, polling):
+    progress = bulk_ingest.get_progress(username)
+    if polling and not has_pending_imports(progress):
+        # every file is handled: rerun the page, which stops the refresh
+        st.rerun()
+    total = sum(progress.values())
+    if not total: return
+
+    handled = sum([progress[k] for k in ("done", "duplicate", "failed", "cancelled")])
+    st.progress(handled / total, text=f"Bulk import: {handled} of {total} files handled")
+    c_counts, c_clear = st.columns([5, 1])
+    with c_counts:
+        st.caption(" · ".join([f"{label} {progress[k]}" for k, label in BULK_LABELS.items() if progress[k]]))
+    with c_clear:
+        if handled == total and st.button("Clear", key="bulk_clear", use_container_width=True):
+            bulk_ingest.clear_finished(username)
+            st.rerun(scope="fragment")
+
+
+def render_bulk_progress(username):
+    """Refreshes every BULK_REFRESH_SECONDS while imports are waiting or running."""
+    polling = has_pending_imports(bulk_ingest.get_progress(username))
+    st.fragment(bulk_progress, run_every=BULK_REFRESH_SECONDS if polling else None)(username, polling)
+
+
+def render_upload_page(username):
+    st.title("📥 Import Content")
+    render_progress_panel(username)
+    videos_dir, chroma_dir, _ = video_processor.get_user_paths(username)
+
+    # storage status bar (sizes come from the catalog)
+    used_gb = catalog.get_storage_bytes(username) / 1024 ** 3
+    col_stat1, col_stat2 = st.columns([3, 1])
+    with col_stat1:
+        st.progress(min(int(used_gb / STORAGE_QUOTA_GB * 100), 100), text="Cloud Storage Usage")
+    with col_stat2:
+        st.caption(f"{used_gb:.1f}GB / {STORAGE_QUOTA_GB}GB Used")
+
+    st.divider()
+
+    # upload area 
+    with st.container(border=True):
+        st.markdown("### 📤 Drag & Drop Video")
+        uploaded_file = st.file_uploader("", type=["mp4", "mov", "avi"], label_visibility="collapsed")
+
+        if uploaded_file:
+            st.info(f"Ready to process: **{uploaded_file.name}**")
+
+            if st.button("Start Processing ⚡", type="primary", use_container_width=True):
+                file_path = os.path.join(videos_dir, uploaded_file.name)
+                with open(file_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+
+                st.toast("Upload Complete! AI Processing started.")
+                # transcription runs in the worker processes, never in the web server
+                ingest_worker.enqueue_job(username, uploaded_file.name, file_path, chroma_dir,
+                                          st.session_state.get('gemini_api_key', ""))
+                ingest_worker.ensure_workers_running()
+                time.sleep(1)
+                st.rerun()
+
+    # bulk import through the drop folder
+    with st.expander("📦 Bulk Import"):
+        inbox_dir = bulk_ingest.get_inbox_dir(username)
+        st.caption(f"Copy any number of videos into `{os.path.abspath(inbox_dir)}` and they are imported "
+                   f"one after another in the background. Files already in your library are skipped.")
+        if bulk_ingest.find_video_files(inbox_dir):
+            # the supervisor is the one watching the folder
+            ingest_worker.ensure_workers_running()
+    render_bulk_progress(username)
+
+
+@st.cache_data(show_spinner=False, max_entries=THUMBNAIL_CACHE_ENTRIES)
+def load_thumbnail(thumb_path, modified_at):
+    """Base64 thumbnail (cached until the file changes)."""
+    with open(thumb_path, "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode()
+
+
+# one library card; renaming only reruns the card, while open/rename/delete change the page
+@st.fragment
+def render_video_card(vid, username, thumbnails_dir, details=""):
+    thumb_path = os.path.join(thumbnails_dir, f"{vid}.jpg")
+    style_settings = "width: 100%; height: 180px; object-fit: cover; border-radius: 4px; margin-bottom: 10px;"
+
+    if os.path.exists(thumb_path):
+        try:
+            b64_data = load_thumbnail(thumb_path, os.path.getmtime(thumb_path))
+            st.markdown(
+                f'<img src="data:image/jpeg;base64,{b64_data}" style="{style_settings}">',
+                unsafe_allow_html=True
+            )
+        except Exception:
+            st.markdown(f'<div style="{style_settings} background-color: #262730;">Error</div>',
+                        unsafe_allow_html=True)
+    else:
+        st.markdown(f'<div style="{style_settings} background-color: #262730;">No Preview</div>',
+                    unsafe_allow_html=True)
+
+    # rename mode is kept per card, since only this card's fragment reruns
+    if st.session_state.get(f'renaming_{vid}'):
+        base_name = os.path.splitext(vid)[0]
+        new_name_input = st.text_input("New Name", value=base_name, key=f"input_{vid}",
+                                       label_visibility="collapsed")
+
+        c_save, c_cancel = st.columns(2)
+        with c_save:
+            if st.button("💾 Save", key=f"save_{vid}", use_container_width=True):
+                if new_name_input and new_name_input != base_name:
+                    success, msg = video_processor.rename_video(username, vid, new_name_input)
+                    if success:
+                        st.session_state.pop(f'renaming_{vid}', None)
+                        st.toast(f"Renamed to {msg}")
+                        st.rerun()
+                    else:
+                        st.error(msg)
+                else:
+                    st.session_state[f'renaming_{vid}'] = False
+                    st.rerun(scope="fragment")
+        with c_cancel:
+            if st.button("❌", key=f"cancel_{vid}", use_container_width=True):
+                st.session_state[f'renaming_{vid}'] = False
+                st.rerun(scope="fragment")
+    else:
+        c_text, c_edit = st.columns([5, 1])
+        with c_text:
+            display_name = vid if len(vid) < 20 else vid[:17] + "..."
+            st.markdown(f"**{display_name}**")
+            if details:
+                st.caption(details)
+        with c_edit:
+            if st.button("✏️", key=f"edit_{vid}"):
+                st.session_state[f'renaming_{vid}'] = True
+                st.rerun(scope="fragment")
+
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        if st.button("Open", key=f"open_{vid}", use_container_width=True):
+            st.session_state['selected_video'] = vid
+            st.session_state['current_page'] = "✨ AI Chat"
+            st.rerun()
+    with c2:
+        if st.button("Summarize", key=f"sum_{vid}", use_container_width=True):
+            show_summary_popup(vid, username, st.session_state.get('gemini_api_key', ""))
+    with c3:
+        if st.button("🗑️", key=f"del_{vid}", use_container_width=True):
+            video_processor.delete_video(username, vid)
+            st.rerun()
+
+
+def reset_library_page():
+    st.session_state['library_page'] = 0
+
+
+def describe_video(row):
+    """Short status line of a library card."""
+    parts = [STATE_LABELS.get(row['state'], row['state'] or "")]
+    if row['duration_sec']:
+        parts.append(query_engine.format_timestamp(row['duration_sec']))
+    return " · ".join([p for p in parts if p])
+
+
+# library page (one page of cards; filtering, sorting and paging are answered by the catalog)
+def render_library_page(username):
+    st.title("🎬 My Studio")
+    _, _, thumbnails_dir = video_processor.get_user_paths(username)
+
+    if 'library_page' not in st.session_state:
+        st.session_state['library_page'] = 0
+
+    c_search, c_state, c_sort, c_order = st.columns([3, 2, 2, 1])
+    with c_search:
+        search = st.text_input("Search", placeholder="🔍 Search by name", key="library_search",
+                               label_visibility="collapsed", on_change=reset_library_page)
+    with c_state:
+        states = st.multiselect("Status", list(STATE_LABELS), format_func=STATE_LABELS.get, key="library_states",
+                                placeholder="Any status", label_visibility="collapsed", on_change=reset_library_page)
+    with c_sort:
+        sort = st.selectbox("Sort by", list(SORT_LABELS), format_func=SORT_LABELS.get, key="library_sort",
+                            label_visibility="collapsed", on_change=reset_library_page)
+    with c_order:
+        descending = st.toggle("↓", key="library_descending", help="Descending order", on_change=reset_library_page)
+
+    page = st.session_state['library_page']
+    videos, total = video_processor.get_videos_page(username, search=search.strip() or None, states=states,
+                                                    sort=sort, descending=descending,
+                                                    limit=LIBRARY_PAGE_SIZE, offset=page * LIBRARY_PAGE_SIZE)
+    page_count = max(1, -(-total // LIBRARY_PAGE_SIZE))
+    if page >= page_count:
+        # the page emptied (e.g. its last video was deleted)
+        st.session_state['library_page'] = page_count - 1
+        st.rerun()
+
+    # handle empty library
+    if not total:
+        if search or states:
+            st.info("No videos match these filters.")
+        else:
+            st.info("Your library is empty. Go to 'Import' to add videos.")
+        return
+
+    cols_per_row = 3
+    rows = [videos[i:i + cols_per_row] for i in range(0, len(videos), cols_per_row)]
+
+    # display videos in grid
+    for row_videos in rows:
+        cols = st.columns(cols_per_row)
+        for idx, video in enumerate(row_videos):
+            with cols[idx]:
+                with st.container(border=True):
+                    render_video_card(video['display_name'], username, thumbnails_dir, describe_video(video))
+
+    # pager
+    if page_count > 1:
+        c_prev, c_info, c_next = st.columns([1, 3, 1])
+        with c_prev:
+            if st.button("⬅ Previous", disabled=page == 0, use_container_width=True):
+                st.session_state['library_page'] = page - 1
+                st.rerun()
+        with c_info:
+            st.caption(f"Page {page + 1} of {page_count} · {total} videos")
+        with c_next:
+            if st.button("Next ➡", disabled=page >= page_count - 1, use_container_width=True):
+                st.session_state['library_page'] = page + 1
+                st.rerun()
@@ -0,0 +1,189 @@
+import os
+import time
+import json
+import random
+import queue
+import threading
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# configurations
+LLM_BACKEND = os.environ.get("PINPOINT_LLM_BACKEND", "gemini")  # "gemini" or "stub"
+LLM_STUB_URL = os.environ.get("PINPOINT_LLM_STUB_URL", "http://127.0.0.1:8765")
+# primary first, then the model hedges and failovers go to; with a single model there are none
+GEMINI_MODELS = [m.strip() for m in os.environ.get("PINPOINT_GEMINI_MODELS",
+                                                    "gemini-2.5-flash,gemini-2.5-flash-lite").split(",") if m.strip()]
+DEFAULT_TIMEOUT = 60  # seconds per call, including retries
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+MAX_CONCURRENT_REQUESTS = 16
+STUB_POOL_SIZE = 8  # kept-alive HTTP connections to the stub server
+CANCEL_POLL_INTERVAL = 0.1  # seconds between cancellation checks
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """Raised when no model produced an answer before the deadline."""
+
+
+# backends
+class GeminiBackend:
+    """Google Gemini through the google-genai SDK, with a client of its own per API key."""
+
+    def __init__(self, api_key):
+        from google import genai
+        from google.genai import types
+        # the key belongs to this client only: requests of users with other keys can run alongside
+        self._client = genai.Client(api_key=api_key)
+        self._types = types
+
+    def generate(self, model_name, prompt, timeout):
+        config = self._types.GenerateContentConfig(
+            http_options=self._types.HttpOptions(timeout=int(timeout * 1000)))  # milliseconds
+        response = self._client.models.generate_content(model=model_name, contents=prompt, config=config)
+        return response.text
+
+
+class StubBackend:
+    """The local stand-in server from llm_stub_server.py, over a pool of kept-alive connections."""
+
+    def __init__(self, base_url=LLM_STUB_URL):
+        parsed = urlparse(base_url)
+        self._host = parsed.hostname
+        self._port = parsed.port or 80
+        self._pool = queue.LifoQueue(maxsize=STUB_POOL_SIZE)
+
+    def generate(self, model_name, prompt, timeout):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = http.client.HTTPConnection(self._host, self._port)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+        try:
+            body = json.dumps({"model": model_name, "prompt": prompt})
+            conn.request("POST", "/v1/generate", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+        if response.status != 200:
+            raise LLMError(f"Stub server returned HTTP {response.status}")
+        return json.loads(data)['text']
+
+
+class LLMClient:
+    """
+    Single entry point for text generation.
+    Every call has a deadline; failed attempts are retried with exponential backoff, and
+    each attempt falls back to the next model as soon as the previous one fails. With a
+    hedge delay, the fallback model is also fired when the primary is merely slow, and the
+    first answer wins.
+    """
+
+    def __init__(self, backend, models=None, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES):
+        self.backend = backend
+        # a repeated model is no fallback, it would only send the same request twice
+        self.models = list(dict.fromkeys(models or GEMINI_MODELS))
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="llm")
+
+    def generate(self, prompt, timeout=None, hedge_delay=None, cancel_token=None):
+        """
+        Returns the generated text or raises LLMError.
+        cancel_token is any object with a check() method that raises once the caller has
+        given up; it is polled while waiting so abandoned calls stop retrying and hedging.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try:
+                return self._attempt(prompt, deadline, hedge_delay, cancel_token)
+            except LLMError as e:
+                last_error = e
+
+            # back off before the next attempt (with jitter), but never past the deadline
+            backoff = BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+            wake_at = time.monotonic() + max(0, min(backoff, deadline - time.monotonic()))
+            while time.monotonic() < wake_at:
+                if cancel_token is not None: cancel_token.check()
+                time.sleep(min(CANCEL_POLL_INTERVAL, max(0, wake_at - time.monotonic())))
+
+        raise last_error or LLMError("Deadline exceeded")
+
+    def _attempt(self, prompt, deadline, hedge_delay, cancel_token):
+        pending = set()
+        next_model = 0
+        errors = []
+
+        def launch():
+            nonlocal next_model
+            model_name = self.models[min(next_model, len(self.models) - 1)]
+            next_model += 1
+            remaining = max(0.1, deadline - time.monotonic())
+            pending.add(self._executor.submit(self.backend.generate, model_name, prompt, remaining))
+
+        try:
+            launch()
+            hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+            while pending:
+                if cancel_token is not None: cancel_token.check()
+                now = time.monotonic()
+                if now >= deadline: break
+
+                # primary is slow: hedge with the next model
+                if hedge_at is not None and now >= hedge_at:
+                    if next_model < len(self.models): launch()
+                    hedge_at = None
+
+                wake_at = min([t for t in (deadline, hedge_at) if t is not None])
+                timeout = wake_at - now
+                if cancel_token is not None: timeout = min(timeout, CANCEL_POLL_INTERVAL)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    pending.discard(future)
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        errors.append(str(e))
+
+                # a failure falls over to the next model straight away
+                if done and not pending and next_model < len(self.models):
+                    launch()
+        finally:
+            # requests still running are abandoned; the backend's own timeout stops them
+            for future in pending:
+                future.cancel()
+        raise LLMError("; ".join(errors) or "Deadline exceeded")
+
+
+def is_available(api_key):
+    """True if generation can work at all (the stub backend needs no key)."""
+    return LLM_BACKEND == "stub" or bool(api_key)
+
+
+def get_llm_client(api_key):
+    """Returns the shared client for this backend/key, creating it on first use."""
+    client_key = (LLM_BACKEND, api_key if LLM_BACKEND == "gemini" else None)
+    with _clients_lock:
+        if client_key not in _clients:
+            backend = StubBackend() if LLM_BACKEND == "stub" else GeminiBackend(api_key)
+            _clients[client_key] = LLMClient(backend)
+        return _clients[client_key]
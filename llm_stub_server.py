@@ -0,0 +1,83 @@
+"""
+Local stand-in for the Gemini API, used for offline load tests and benchmarks.
+
+Run it, then point the app at it:
+    python llm_stub_server.py --port 8765 --latency 0.8
+    PINPOINT_LLM_BACKEND=stub streamlit run app.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_stub_reply(prompt):
+    """Returns a canned reply shaped like what the real model returns for this kind of prompt."""
+    if "JSON list" in prompt:
+        match = re.search(r"create (\d+) different", prompt)
+        count = int(match.group(1)) if match else 1
+        return json.dumps([{
+            "question": f"Stub question {i + 1} ({random.randint(0, 10 ** 6)})?",
+            "options": {"A": "First option", "B": "Second option", "C": "Third option", "D": "Fourth option"},
+            "answer": "A",
+            "explanation": "The stub server always picks A."
+        } for i in range(count)])
+
+    words = re.findall(r"\w+", prompt)
+    return f"Stub answer based on a prompt of {len(words)} words: " + " ".join(words[-30:])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API client
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        settings = self.server.settings
+
+        # simulated model latency and failures
+        time.sleep(max(0, random.gauss(settings['latency'], settings['latency'] * 0.25)))
+        if random.random() < settings['error_rate']:
+            self._reply(503, {"error": "stub overloaded"})
+            return
+
+        prompt = json.loads(body).get('prompt', '')
+        self._reply(200, {"text": build_stub_reply(prompt)})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=8765, latency=0.5, error_rate=0.0):
+    """Starts the stub server in a daemon thread and returns it (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.settings = {"latency": latency, "error_rate": error_rate}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    start_stub_server(args.port, args.latency, args.error_rate)
+    print(f"LLM stub listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,317 @@
+"""
+Load test of the library chat path with N simulated users. Each user is a thread doing what
+a chat session does: store the question, run the query pipeline (embed, route, search,
+rerank, LLM answer), store the answer and reload the history as the rerun does. Answers
+come from the local LLM stub and the library is synthetic (see benchmark.py), so no API
+key or Whisper is needed. Everything is written to a scratch folder.
+
+    python loadtest.py --users 1,4,8,16 --duration 60 --library 20x100 --output load.json
+
+Every user count is run in turn. Per level it reports throughput, p50/p95/p99 of each chat
+step and pipeline stage (from the metrics spans), the slowdown of each stage against the
+first level, time spent waiting on the model manager, and thread counts. Contention starts
+at the first level whose throughput per user drops below SATURATION_EFFICIENCY.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import benchmark
+
+# configurations
+DEFAULT_USERS = "1,4,8"
+DEFAULT_DURATION = 30  # seconds per level
+DEFAULT_LIBRARY = "20x100"  # videos x transcript segments
+LOAD_USER = "load"
+THINK_SECONDS = (1.0, 3.0)  # pause of a simulated user between two questions
+ANSWER_TIMEOUT = 120
+STUB_PORT = 8799
+STUB_LATENCY = 0.8
+SAMPLE_INTERVAL = 0.2  # seconds between thread count samples
+SATURATION_EFFICIENCY = 0.8  # throughput per user, relative to the first level
+PERCENTILES = (50, 95, 99)
+
+# chat steps timed by the harness, then the pipeline stages read from the span log
+CHAT_STEPS = ["chat.turn", "chat.store_question", "chat.answer", "chat.store_answer", "chat.load_history"]
+PIPELINE_STAGES = ["query.answer", "query.answer_cache", "query.embed", "query.search", "query.route", "query.ann",
+                   "query.expand_context", "query.rerank", "llm.answer"]
+
+
+# simulated sessions
+class Recorder:
+    """Collects step durations (ms) and errors from the user threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.errors = {}
+
+    def add(self, step, ms):
+        with self.lock:
+            self.durations.setdefault(step, []).append(ms)
+
+    def fail(self, step, error):
+        with self.lock:
+            key = f"{step}: {type(error).__name__}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def timed_step(recorder, step, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    except Exception as e:
+        recorder.fail(step, e)
+        raise
+    finally:
+        recorder.add(step, (time.perf_counter() - start) * 1000)
+
+
+def ask_question(query_text):
+    import query_engine
+    future, token = query_engine.submit_query(query_text, LOAD_USER, "")
+    try:
+        return future.result(timeout=ANSWER_TIMEOUT)
+    except BaseException:
+        token.cancel()
+        raise
+
+
+def store_answer(conversation, answer, matches, query_text):
+    import chat_store
+    import query_engine
+    video_ids = {}
+    refs = [chat_store.make_source_ref(LOAD_USER, match, video_ids, query_engine.CONTEXT_WINDOW) for match in matches]
+    chat_store.add_message(LOAD_USER, conversation, "assistant", answer or "", refs or None, query_text)
+
+
+def run_session(slot, queries, deadline, recorder, seed):
+    """One simulated user asking questions until the deadline."""
+    import chat_store
+
+    rng = random.Random(seed * 1000 + slot)
+    conversation = f"loadtest_{slot}"
+    # users don't all start at the same instant
+    time.sleep(rng.uniform(0, THINK_SECONDS[1]))
+    while time.time() < deadline:
+        query_text, _ = rng.choice(queries)
+        start = time.perf_counter()
+        try:
+            timed_step(recorder, "chat.store_question", chat_store.add_message, LOAD_USER, conversation, "user",
+                       query_text)
+            answer, matches = timed_step(recorder, "chat.answer", ask_question, query_text)
+            timed_step(recorder, "chat.store_answer", store_answer, conversation, answer, matches, query_text)
+            timed_step(recorder, "chat.load_history", chat_store.load_messages, LOAD_USER, conversation)
+            recorder.add("chat.turn", (time.perf_counter() - start) * 1000)
+        except Exception:
+            pass
+        time.sleep(rng.uniform(*THINK_SECONDS))
+
+
+def sample_threads(stop, samples):
+    while not stop.is_set():
+        samples.append(threading.active_count())
+        stop.wait(SAMPLE_INTERVAL)
+
+
+def read_spans(log_path, offset):
+    """Span durations (ms) by name, logged after the given byte offset."""
+    durations = {}
+    if not os.path.exists(log_path): return durations
+    if os.path.getsize(log_path) < offset:
+        offset = 0  # the log was rotated meanwhile
+    with open(log_path) as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            durations.setdefault(span['name'], []).append(span['seconds'] * 1000)
+    return durations
+
+
+def summarize(values):
+    summary = {f"p{pct}_ms": round(benchmark.percentile(values, pct), 1) for pct in PERCENTILES}
+    summary['count'] = len(values)
+    return summary
+
+
+def get_model_waits():
+    import model_manager
+    return {name: stats['wait_seconds'] for name, stats in model_manager.manager.get_stats()['models'].items()}
+
+
+def run_level(num_users, duration, queries, seed):
+    import metrics
+    import answer_cache
+
+    # a level must not be answered from the previous level's cache
+    answer_cache.clear()
+    log_offset = os.path.getsize(metrics.SPANS_LOG_FILE) if os.path.exists(metrics.SPANS_LOG_FILE) else 0
+    waits_before = get_model_waits()
+    recorder, thread_samples, stop = Recorder(), [], threading.Event()
+    sampler = threading.Thread(target=sample_threads, args=(stop, thread_samples), daemon=True)
+    sampler.start()
+
+    start = time.time()
+    deadline = start + duration
+    sessions = [threading.Thread(target=run_session, args=(slot, queries, deadline, recorder, seed), daemon=True)
+                for slot in range(num_users)]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    elapsed = time.time() - start
+    stop.set()
+    sampler.join()
+
+    spans = read_spans(metrics.SPANS_LOG_FILE, log_offset)
+    turns = len(recorder.durations.get("chat.turn", []))
+    waits_after = get_model_waits()
+    return {
+        "users": num_users,
+        "seconds": round(elapsed, 1),
+        "turns": turns,
+        "turns_per_sec": round(turns / elapsed, 3),
+        "errors": recorder.errors,
+        "steps": {step: summarize(recorder.durations[step]) for step in CHAT_STEPS if recorder.durations.get(step)},
+        "stages": {stage: summarize(spans[stage]) for stage in PIPELINE_STAGES if spans.get(stage)},
+        "model_wait_ms": {name: round((waits_after[name] - waits_before.get(name, 0)) * 1000, 1)
+                          for name in waits_after},
+        "threads_peak": max(thread_samples, default=threading.active_count()),
+        "threads_mean": round(sum(thread_samples) / len(thread_samples), 1) if thread_samples else None,
+    }
+
+
+def find_contention(levels):
+    """Slowdown of each step/stage against the first level, and the first saturated level."""
+    if not levels: return {}
+    base = levels[0]
+    base_rate = base['turns_per_sec'] / base['users']
+    report = {"saturated_at_users": None, "slowdown_p95": {}}
+    for level in levels[1:]:
+        slowdown = {}
+        for group in ("steps", "stages"):
+            for name, stats in level[group].items():
+                base_stats = base[group].get(name)
+                if base_stats and base_stats['p95_ms']:
+                    slowdown[name] = round(stats['p95_ms'] / base_stats['p95_ms'], 2)
+        report['slowdown_p95'][str(level['users'])] = dict(sorted(slowdown.items(), key=lambda x: -x[1]))
+        efficiency = (level['turns_per_sec'] / level['users']) / base_rate if base_rate else 0
+        if report['saturated_at_users'] is None and efficiency < SATURATION_EFFICIENCY:
+            report['saturated_at_users'] = level['users']
+    return report
+
+
+def print_level(level):
+    print(f"  {level['users']} users: {level['turns']} turns, {level['turns_per_sec']} turns/s, "
+          f"threads peak {level['threads_peak']}, errors {sum(level['errors'].values())}")
+    for group in ("steps", "stages"):
+        for name, stats in level[group].items():
+            print(f"    {name:<22} p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+                  f"p99 {stats['p99_ms']:>8} ms  (n={stats['count']})")
+    waits = ", ".join([f"{name} {ms} ms" for name, ms in level['model_wait_ms'].items() if ms])
+    if waits:
+        print(f"    model manager waits: {waits}")
+
+
+# commands
+def cmd_run(args):
+    output = os.path.abspath(args.output)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pinpoint_load_")
+    os.makedirs(workdir, exist_ok=True)
+    # every module resolves "Database/..." relative to the working directory
+    os.chdir(workdir)
+    # read when the modules are imported
+    os.environ['PINPOINT_LLM_BACKEND'] = "stub"
+    os.environ['PINPOINT_LLM_STUB_URL'] = f"http://127.0.0.1:{args.stub_port}"
+    os.environ['PINPOINT_ANSWER_CACHE'] = "1" if args.answer_cache else "0"
+    os.environ['PINPOINT_METRICS'] = "1"
+
+    import llm_stub_server
+    import model_manager
+
+    stub = llm_stub_server.start_stub_server(args.stub_port, args.stub_latency, args.stub_error_rate)
+    for name in ["embedder", "reranker"]:
+        model_manager.manager.preload(name)
+
+    rng = random.Random(args.seed)
+    num_videos, num_segments = benchmark.parse_scales(args.library)[0]
+    print(f"Building a {args.library} library...")
+    library, _, _ = benchmark.build_library(LOAD_USER, num_videos, num_segments, rng)
+    queries = benchmark.make_queries(rng, library, args.queries)
+
+    results = {
+        "meta": {
+            "commit": benchmark.get_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "library": args.library,
+            "duration": args.duration,
+            "think_seconds": THINK_SECONDS,
+            "stub_latency": args.stub_latency,
+            "answer_cache": args.answer_cache,
+            "cpu_count": os.cpu_count(),
+            # asyncio.to_thread runs every pipeline stage on this many threads
+            "query_threads": min(32, (os.cpu_count() or 1) + 4),
+            "device": model_manager.get_device(),
+        },
+        "levels": []
+    }
+
+    try:
+        for num_users in [int(n) for n in args.users.split(",") if n]:
+            print(f"Running {num_users} users for {args.duration}s...")
+            level = run_level(num_users, args.duration, queries, args.seed)
+            results['levels'].append(level)
+            print_level(level)
+    finally:
+        stub.shutdown()
+        os.chdir(os.path.dirname(output))
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results['contention'] = find_contention(results['levels'])
+    saturated = results['contention'].get('saturated_at_users')
+    print(f"Throughput per user falls below {SATURATION_EFFICIENCY:.0%} at {saturated} users" if saturated
+          else "No saturation in the levels run")
+    for users, slowdown in results['contention'].get('slowdown_p95', {}).items():
+        worst = ", ".join([f"{name} x{factor}" for name, factor in list(slowdown.items())[:3]])
+        print(f"  {users} users, slowest to scale: {worst}")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PinPoint concurrent chat load test")
+    parser.add_argument("--users", default=DEFAULT_USERS, help="comma separated simulated user counts")
+    parser.add_argument("--duration", type=int, default=DEFAULT_DURATION, help="seconds per user count")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY, help="synthetic library, NxM (videos x segments)")
+    parser.add_argument("--queries", type=int, default=50, help="distinct questions drawn from the library")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    parser.add_argument("--stub-port", type=int, default=STUB_PORT)
+    parser.add_argument("--stub-latency", type=float, default=STUB_LATENCY, help="mean LLM stub seconds")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_results.json")
+    parser.add_argument("--workdir", help="where to build the library (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary library")
+    parser.set_defaults(func=cmd_run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
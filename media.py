@@ -0,0 +1,71 @@
+"""
+Web-optimized renditions of uploaded videos. Browsers can only seek quickly in an MP4
+whose index (moov atom) comes first; uploads often have it at the end, or use codecs
+browsers don't play. Ingestion writes a faststart H.264/AAC MP4 next to the original:
+a stream copy when the codecs already fit, a transcode otherwise.
+"""
+import os
+import json
+import time
+import tempfile
+import subprocess
+
+# configurations
+WEB_VIDEO_CODECS = {"h264"}
+WEB_AUDIO_CODECS = {"aac", "mp3"}
+TRANSCODE_PRESET = "veryfast"
+TRANSCODE_CRF = 23
+MAX_HEIGHT = 1080  # larger videos are scaled down when transcoded
+POLL_INTERVAL = 0.5  # seconds between cancellation checks while ffmpeg runs
+
+
+def probe_codecs(path):
+    """Returns (video codec, audio codec) of a file via ffprobe (None for a missing stream)."""
+    output = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,codec_name",
+                             "-of", "json", path], capture_output=True, text=True, check=True).stdout
+    codecs = {}
+    for stream in json.loads(output).get("streams", []):
+        codecs.setdefault(stream.get("codec_type"), stream.get("codec_name"))
+    return codecs.get("video"), codecs.get("audio")
+
+
+def get_rendition_command(source_path, target_path):
+    video_codec, audio_codec = probe_codecs(source_path)
+    command = ["ffmpeg", "-y", "-v", "error", "-i", source_path, "-map", "0:v:0", "-map", "0:a:0?"]
+    if video_codec in WEB_VIDEO_CODECS:
+        command += ["-c:v", "copy"]
+    else:
+        command += ["-c:v", "libx264", "-preset", TRANSCODE_PRESET, "-crf", str(TRANSCODE_CRF),
+                    "-pix_fmt", "yuv420p", "-vf", f"scale=-2:'min({MAX_HEIGHT},ih)'"]
+    command += ["-c:a", "copy"] if audio_codec in WEB_AUDIO_CODECS else ["-c:a", "aac", "-b:a", "128k"]
+    return command + ["-movflags", "+faststart", "-f", "mp4", target_path]
+
+
+def make_web_rendition(source_path, target_path, should_stop=None):
+    """
+    Writes the faststart MP4. Returns True when done, None if should_stop() (polled while
+    ffmpeg runs) asked to abandon it. The target only appears once it is complete.
+    """
+    tmp_path = f"{target_path}.part"
+    # errors go to a file: a full stderr pipe that nobody reads would block ffmpeg
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(get_rendition_command(source_path, tmp_path), stdout=subprocess.DEVNULL,
+                               stderr=stderr_file)
+    try:
+        while process.poll() is None:
+            if should_stop and should_stop():
+                process.kill()
+                return None
+            time.sleep(POLL_INTERVAL)
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {stderr_file.read().decode(errors='ignore')[-500:]}")
+        os.replace(tmp_path, target_path)
+        return True
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        stderr_file.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
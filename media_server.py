@@ -0,0 +1,195 @@
+"""
+Small HTTP server for the web renditions, so the browser streams and seeks videos with
+byte-range requests instead of Streamlit re-sending the whole file on every rerun.
+URLs are signed per user and expire, and responses carry ETag/Cache-Control headers so
+the browser can reuse what it already downloaded. It runs as a thread of the app.
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from urllib.parse import quote, unquote, urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import video_processor
+
+# configurations
+MEDIA_SERVER_ENABLED = os.environ.get("PINPOINT_MEDIA_SERVER", "1") == "1"
+MEDIA_HOST = os.environ.get("PINPOINT_MEDIA_HOST", "127.0.0.1")  # set to 0.0.0.0 to serve other machines
+MEDIA_PORT = int(os.environ.get("PINPOINT_MEDIA_PORT", 8766))
+MEDIA_BASE_URL = os.environ.get("PINPOINT_MEDIA_URL", "")  # as seen by the browser; unset: localhost only
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+SECRET_FILE = os.path.join(video_processor.BASE_DB_FOLDER, "media_secret")
+URL_LIFETIME = 6 * 3600  # signed URLs stay valid (and identical) for this long
+CACHE_MAX_AGE = 3600
+
+_server = None
+_server_lock = threading.Lock()
+_secret = None
+
+
+def _get_secret():
+    """The signing key, created once per installation (the first process to write it wins)."""
+    global _secret
+    if _secret is None:
+        try:
+            fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        # re-read in any case: another process may have won the race
+        for _ in range(50):
+            with open(SECRET_FILE) as f:
+                key = f.read().strip()
+            if key: break
+            time.sleep(0.01)  # created but not written yet
+        else:
+            raise RuntimeError(f"Empty media key file: {SECRET_FILE}")
+        _secret = key.encode()
+    return _secret
+
+
+def _sign(username, file_name, expires):
+    message = f"{username}/{file_name}/{expires}".encode()
+    return base64.urlsafe_b64encode(hmac.new(_get_secret(), message, hashlib.sha256).digest()[:18]).decode()
+
+
+def get_base_url(browser_host=None):
+    """
+    Where the browser reaches this server, or None if it can't. Without PINPOINT_MEDIA_URL that is
+    localhost, which only works for a browser on this machine (browser_host is the host it opened the app on).
+    """
+    if MEDIA_BASE_URL: return MEDIA_BASE_URL.rstrip("/")
+    if browser_host and browser_host not in LOOPBACK_HOSTS: return None
+    return f"http://localhost:{MEDIA_PORT}"
+
+
+def get_media_url(username, video_name, browser_host=None):
+    """
+    Signed URL of the web rendition, or None if there is none, the server isn't running in this
+    process or the browser can't reach it (the player then streams through Streamlit).
+    """
+    if not MEDIA_SERVER_ENABLED or not _server: return None
+    base_url = get_base_url(browser_host)
+    if base_url is None: return None
+    path = video_processor.get_web_rendition_path(username, video_name)
+    if not os.path.exists(path): return None
+
+    # expiry is rounded, so the URL (and the player showing it) stays the same across reruns
+    expires = (int(time.time()) // URL_LIFETIME + 2) * URL_LIFETIME
+    file_name = os.path.basename(path)
+    sig = _sign(username, file_name, expires)
+    return f"{base_url}/media/{quote(username)}/{file_name}?exp={expires}&sig={sig}"
+
+
+def parse_range(header, size):
+    """Returns (start, end) inclusive for a 'bytes=a-b' header, None for no range, False if unsatisfiable."""
+    if not header or not header.startswith("bytes=") or "," in header: return None
+    start_text, _, end_text = header[len("bytes="):].partition("-")
+    try:
+        if start_text == "":
+            # suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0: return False
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start: return False
+    return start, min(end, size - 1)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def resolve(self):
+        """Checks the signature and returns the file path, or None."""
+        url = urlparse(self.path)
+        parts = url.path.split("/")
+        if len(parts) != 4 or parts[1] != "media": return None
+        username, file_name = unquote(parts[2]), parts[3]
+        query = parse_qs(url.query)
+        try:
+            expires = int(query['exp'][0])
+            sig = query['sig'][0]
+        except (KeyError, ValueError):
+            return None
+        if expires < time.time() or not hmac.compare_digest(sig, _sign(username, file_name, expires)):
+            return None
+        path = os.path.join(video_processor.get_user_cache_dir(username, "web"), os.path.basename(file_name))
+        return path if os.path.exists(path) else None
+
+    def serve(self, send_body):
+        path = self.resolve()
+        if path is None:
+            self.send_error(404)
+            return
+
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        byte_range = parse_range(self.headers.get("Range"), size)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"private, max-age={CACHE_MAX_AGE}")
+        self.end_headers()
+        if not send_body: return
+
+        try:
+            with open(path, "rb") as f:
+                self.wfile.flush()
+                self.connection.sendfile(f, offset=start, count=end - start + 1)
+        except (BrokenPipeError, ConnectionResetError):
+            # the browser dropped the request (e.g. it seeked elsewhere)
+            self.close_connection = True
+
+
+def start_media_server():
+    """Starts the media server thread once per process. Returns False if disabled or the port is taken."""
+    global _server
+    if not MEDIA_SERVER_ENABLED: return False
+    with _server_lock:
+        if _server is not None: return True
+        try:
+            _server = ThreadingHTTPServer((MEDIA_HOST, MEDIA_PORT), MediaHandler)
+        except OSError as e:
+            # another app process on this machine already serves the same files
+            print(f"Media server not started on port {MEDIA_PORT}: {e}")
+            _server = False
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True, name="media-server").start()
+        return True
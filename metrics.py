@@ -0,0 +1,235 @@
+"""
+Lightweight span instrumentation. Wrap a stage in `with metrics.span("query.rerank", pairs=n):`
+and its duration, attributes (counts, sizes) and parent stage are recorded. Finished spans are
+appended to a JSONL log, aggregated into a Prometheus textfile (for node_exporter's textfile
+collector or a quick `cat`), and the last traces are kept in memory for the debug page.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+import paths
+
+# configurations
+METRICS_ENABLED = os.environ.get("PINPOINT_METRICS", "1") == "1"
+METRICS_FOLDER = os.path.join(paths.BASE_DB_FOLDER, "metrics")
+SPANS_LOG_FILE = os.path.join(METRICS_FOLDER, "spans.jsonl")
+SPANS_LOG_MAX_BYTES = int(os.environ.get("PINPOINT_SPANS_LOG_MB", 50)) * 1024 * 1024  # rotated above this size
+SPANS_LOG_BACKUPS = 3  # rotated logs kept: spans.jsonl.1 (newest) to spans.jsonl.3
+EXPORT_INTERVAL = 10  # seconds between Prometheus textfile rewrites
+RECENT_TRACES = 50  # finished traces kept in memory for the debug page
+MAX_OPEN_TRACES = 500  # bound for traces whose root never finishes in this process
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+_aggregates = {}  # span name -> {"count", "errors", "seconds", "buckets", "attrs"}
+_open_traces = {}  # trace id -> finished spans of a trace whose root is still running
+_recent_traces = deque(maxlen=RECENT_TRACES)
+_last_export = 0.0
+process_name = os.environ.get("PINPOINT_PROCESS_NAME", "app")
+
+
+def set_process_name(name):
+    """Names this process in exported metrics (one Prometheus textfile per process name)."""
+    global process_name
+    process_name = name
+
+
+class Span:
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:12]
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.error = None
+        self.start = time.time()
+        self.seconds = 0.0
+
+    def set(self, **attrs):
+        """Adds attributes known only once the stage has run (e.g. result counts)."""
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": self.start, "seconds": round(self.seconds, 6),
+                "error": self.error, "process": process_name, "attrs": self.attrs}
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a stage of the current trace (or starts a new trace)."""
+    if not METRICS_ENABLED:
+        yield _NoopSpan()
+        return
+
+    current = Span(name, _current_span.get(), attrs)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        _record(current)
+
+
+def _record(finished):
+    with _lock:
+        stats = _aggregates.setdefault(finished.name, {"count": 0, "errors": 0, "seconds": 0.0,
+                                                       "buckets": [0] * len(DURATION_BUCKETS), "attrs": {}})
+        stats['count'] += 1
+        stats['errors'] += finished.error is not None
+        stats['seconds'] += finished.seconds
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if finished.seconds <= bound:
+                stats['buckets'][i] += 1
+        for key, value in finished.attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats['attrs'][key] = stats['attrs'].get(key, 0) + value
+
+        # spans of a trace are collected until its root finishes
+        trace = _open_traces.setdefault(finished.trace_id, [])
+        trace.append(finished.to_dict())
+        if len(_open_traces) > MAX_OPEN_TRACES:
+            _open_traces.pop(next(iter(_open_traces)))
+        if finished.parent_id is None:
+            _recent_traces.append(sorted(_open_traces.pop(finished.trace_id), key=lambda s: s['start']))
+
+    _append_log(finished)
+    _maybe_export()
+
+
+def _append_log(finished):
+    try:
+        os.makedirs(METRICS_FOLDER, exist_ok=True)
+        with _log_lock:
+            with open(SPANS_LOG_FILE, "a") as f:
+                f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+                size = f.tell()
+            if size >= SPANS_LOG_MAX_BYTES:
+                _rotate_log()
+    except OSError as e:
+        print(f"Metrics log error: {e}")
+
+
+def _rotate_log():
+    """Moves the log to spans.jsonl.1, shifting the older ones and dropping the oldest."""
+    for i in range(SPANS_LOG_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{SPANS_LOG_FILE}.{i}"):
+            os.replace(f"{SPANS_LOG_FILE}.{i}", f"{SPANS_LOG_FILE}.{i + 1}")
+    try:
+        os.replace(SPANS_LOG_FILE, f"{SPANS_LOG_FILE}.1")
+    except FileNotFoundError:
+        pass  # another process rotated it first
+
+
+def _maybe_export():
+    if time.time() - _last_export >= EXPORT_INTERVAL:
+        flush()
+
+
+def flush():
+    """Exports right away (e.g. after a long job, instead of waiting for the next span)."""
+    global _last_export
+    _last_export = time.time()
+    try:
+        export_prometheus()
+    except OSError as e:
+        print(f"Metrics export error: {e}")
+
+
+def _metric_name(text):
+    return "".join([c if c.isalnum() else "_" for c in text])
+
+
+def render_prometheus():
+    """Returns the aggregates in the Prometheus text exposition format."""
+    lines = [
+        "# HELP pinpoint_span_seconds Duration of instrumented stages.",
+        "# TYPE pinpoint_span_seconds histogram",
+    ]
+    with _lock:
+        aggregates = {name: dict(stats, buckets=list(stats['buckets']), attrs=dict(stats['attrs']))
+                      for name, stats in _aggregates.items()}
+
+    for name, stats in sorted(aggregates.items()):
+        labels = f'span="{name}",process="{process_name}"'
+        for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+            lines.append(f'pinpoint_span_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'pinpoint_span_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+        lines.append(f'pinpoint_span_seconds_sum{{{labels}}} {stats["seconds"]:.6f}')
+        lines.append(f'pinpoint_span_seconds_count{{{labels}}} {stats["count"]}')
+
+    lines += ["# HELP pinpoint_span_errors_total Instrumented stages that raised.",
+              "# TYPE pinpoint_span_errors_total counter"]
+    for name, stats in sorted(aggregates.items()):
+        lines.append(f'pinpoint_span_errors_total{{span="{name}",process="{process_name}"}} {stats["errors"]}')
+
+    lines += ["# HELP pinpoint_span_attr_total Sum of numeric span attributes (items, bytes, tokens...).",
+              "# TYPE pinpoint_span_attr_total counter"]
+    for name, stats in sorted(aggregates.items()):
+        for key, value in sorted(stats['attrs'].items()):
+            lines.append(f'pinpoint_span_attr_total{{span="{name}",attr="{_metric_name(key)}",'
+                         f'process="{process_name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus():
+    """Rewrites this process's textfile atomically, so a scraper never reads half of it."""
+    os.makedirs(METRICS_FOLDER, exist_ok=True)
+    path = os.path.join(METRICS_FOLDER, f"pinpoint_{_metric_name(process_name)}.prom")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+# read side (debug page)
+def get_recent_traces():
+    """Finished traces, newest first; each is a list of span dicts ordered by start time."""
+    with _lock:
+        return list(reversed(_recent_traces))
+
+
+def get_aggregates():
+    with _lock:
+        return {name: {"count": stats['count'], "errors": stats['errors'], "seconds": stats['seconds'],
+                       "avg_ms": stats['seconds'] / stats['count'] * 1000 if stats['count'] else 0.0,
+                       "attrs": dict(stats['attrs'])}
+                for name, stats in _aggregates.items()}
+
+
+def read_log_tail(max_bytes=256 * 1024):
+    """Last spans of the JSONL log, from every process (ingest workers included)."""
+    try:
+        with open(SPANS_LOG_FILE, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            offset = max(0, f.tell() - max_bytes)
+            f.seek(offset)
+            lines = f.read().decode("utf-8", errors="ignore").splitlines()
+    except OSError:
+        return []
+    if offset:
+        lines = lines[1:]  # the first line is cut in the middle
+    spans = []
+    for line in lines:
+        try:
+            spans.append(json.loads(line))
+        except ValueError:
+            continue
+    return spans
@@ -0,0 +1,155 @@
+import os
+import gc
+import time
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# configurations
+MODEL_RAM_BUDGET_MB = int(os.environ.get("PINPOINT_MODEL_RAM_MB", 2048))
+WHISPER_MODEL_SIZE = "small"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+@functools.lru_cache(maxsize=None)
+def get_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# loaders (heavy libraries are imported here, on first load)
+def _load_whisper():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL_SIZE, device=get_device())
+
+
+def _load_embedder():
+    # PyTorch or ONNX Runtime, see embedding_engine.py
+    import embedding_engine
+    return embedding_engine.load_model()
+
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    if get_device() == "cuda":
+        print("\n✅ GPU DETECTED: RUNNING IN FAST MODE\n")
+    else:
+        print("\n⚠️ GPU NOT FOUND: RUNNING IN SLOW CPU MODE\n")
+    return CrossEncoder(RERANKER_MODEL_NAME, device=get_device())
+
+
+class ModelManager:
+    """
+    Owns every model in the process. Each model is loaded once and shared by all sessions,
+    threads and jobs; when loading another model would exceed the RAM budget, the least
+    recently used models that are not currently in use are unloaded first.
+    """
+
+    def __init__(self, budget_mb=MODEL_RAM_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self._specs = {}  # name -> (loader, estimated size in MB)
+        self._models = OrderedDict()  # loaded models, least recently used first
+        self._in_use = {}
+        self._loading = set()
+        self._stats = {}
+        self._cond = threading.Condition()
+
+    def register(self, name, loader, size_mb):
+        self._specs[name] = (loader, size_mb)
+        self._in_use[name] = 0
+        self._stats[name] = {"loads": 0, "uses": 0, "evictions": 0, "load_seconds": 0.0, "wait_seconds": 0.0,
+                             "last_used": None}
+
+    @contextmanager
+    def use(self, name):
+        """Pins the model while the block runs, so it can't be unloaded mid-inference."""
+        model = self._acquire(name)
+        try:
+            yield model
+        finally:
+            with self._cond:
+                self._in_use[name] -= 1
+
+    def get(self, name):
+        """Returns the model without pinning it (for warm-up and short one-off calls)."""
+        with self.use(name) as model:
+            return model
+
+    def preload(self, name):
+        self.get(name)
+
+    def _acquire(self, name):
+        loader, size_mb = self._specs[name]
+        wait_start = time.perf_counter()
+        with self._cond:
+            # another thread is loading it: wait instead of loading a second copy
+            while name in self._loading:
+                self._cond.wait()
+
+            stats = self._stats[name]
+            # time blocked on the manager lock or another thread's load (contention under load)
+            stats['wait_seconds'] += time.perf_counter() - wait_start
+            self._in_use[name] += 1
+            stats['uses'] += 1
+            stats['last_used'] = time.time()
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+
+            self._loading.add(name)
+            self._make_room(size_mb)
+
+        start = time.perf_counter()
+        try:
+            model = loader()
+        except BaseException:
+            with self._cond:
+                self._loading.discard(name)
+                self._in_use[name] -= 1
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._models[name] = model
+            self._loading.discard(name)
+            stats['loads'] += 1
+            stats['load_seconds'] += time.perf_counter() - start
+            self._cond.notify_all()
+        return model
+
+    def _resident_mb(self):
+        return sum([self._specs[name][1] for name in self._models])
+
+    def _make_room(self, needed_mb):
+        # called with the lock held; only idle models can be unloaded
+        evicted = False
+        for name in list(self._models):
+            if self._resident_mb() + needed_mb <= self.budget_mb: break
+            if self._in_use[name] > 0: continue
+            del self._models[name]
+            self._stats[name]['evictions'] += 1
+            evicted = True
+            print(f"Model manager: unloaded {name} to stay within {self.budget_mb} MB")
+
+        if self._resident_mb() + needed_mb > self.budget_mb:
+            print(f"⚠️ Model manager: over the {self.budget_mb} MB budget, all resident models are in use")
+        if evicted:
+            gc.collect()
+            if get_device() == "cuda":
+                import torch
+                torch.cuda.empty_cache()
+
+    def get_stats(self):
+        with self._cond:
+            models = {name: dict(self._stats[name], loaded=name in self._models, in_use=self._in_use[name],
+                                 size_mb=self._specs[name][1]) for name in self._specs}
+            return {"budget_mb": self.budget_mb, "resident_mb": self._resident_mb(), "models": models}
+
+
+# the process-wide manager (approximate fp32 footprints)
+manager = ModelManager()
+manager.register("whisper", _load_whisper, size_mb=1000)
+manager.register("embedder", _load_embedder, size_mb=100)
+manager.register("reranker", _load_reranker, size_mb=100)
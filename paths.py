@@ -0,0 +1,3 @@
+"""Root folder of PinPoint's data (databases, vector stores, caches), shared by every module."""
+
+BASE_DB_FOLDER = "Database"
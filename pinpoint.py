@@ -0,0 +1,231 @@
+"""
+Headless command line for PinPoint (no Streamlit needed). Run from the project root:
+
+    python pinpoint.py ingest alice lecture1.mp4 lecture2.mp4
+    python pinpoint.py bulk alice /archive/semester1 --wait
+    python pinpoint.py search alice "what is entropy" "define enthalpy" --answer
+    python pinpoint.py summarize alice lecture1.mp4
+    python pinpoint.py reindex alice
+    python pinpoint.py migrate --list
+    python pinpoint.py bench alice --repeat 5
+"""
+import sys
+import json
+import time
+import argparse
+import catalog
+import bulk_ingest
+import ingest_worker
+import chroma_server
+import embedding_engine
+import video_processor
+import query_engine
+
+DEFAULT_BENCH_QUERIES = [
+    "what is the main topic of the lecture",
+    "give an example that was discussed",
+    "what is the definition mentioned",
+    "which conclusion was reached",
+]
+
+
+def load_api_key(cli_key):
+    """Uses --api-key, then $GEMINI_API_KEY, then the Streamlit secrets file."""
+    return cli_key or ingest_worker.get_default_api_key()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# commands
+def cmd_ingest(args):
+    failures = 0
+    for path in args.paths:
+        print(f"Ingesting {path}...")
+        success, msg = video_processor.ingest_video(args.user, path, load_api_key(args.api_key),
+                                                    overwrite=args.overwrite)
+        print(f"  {'OK' if success else 'FAILED'}: {msg}")
+        failures += not success
+    return 1 if failures else 0
+
+
+def format_bulk_progress(progress):
+    return ", ".join([f"{count} {state}" for state, count in progress.items() if count]) or "nothing imported"
+
+
+def cmd_bulk(args):
+    if args.folder:
+        batch_id, added = bulk_ingest.import_folder(args.user, args.folder, recursive=not args.no_recursive,
+                                                    move=args.move, api_key=load_api_key(args.api_key))
+        print(f"Batch {batch_id}: {added} video(s) will be imported in the background")
+    # the worker pool's supervisor feeds the files to the queue at a throttled rate
+    ingest_worker.ensure_workers_running()
+
+    progress = bulk_ingest.get_progress(args.user)
+    while args.wait and progress['waiting'] + progress['queued'] + progress['processing']:
+        print(f"  {format_bulk_progress(progress)}")
+        time.sleep(10)
+        progress = bulk_ingest.get_progress(args.user)
+    print(format_bulk_progress(progress))
+    return 1 if progress['failed'] else 0
+
+
+def cmd_search(args):
+    api_key = load_api_key(args.api_key)
+    video_names = [args.video] if args.video else None
+    results = query_engine.search_many(args.queries, args.user, video_names=video_names, top_k=args.top_k)
+
+    output = []
+    for query, matches in zip(args.queries, results):
+        item = {"query": query, "matches": [{
+            "video_name": m['video_name'],
+            "start_time": m['start_time'],
+            "score": m['score'],
+            "text": m['text']
+        } for m in matches]}
+        if args.answer and matches:
+            item['answer'] = query_engine.ask_gemini(query, matches, api_key)
+        output.append(item)
+
+    if args.json:
+        print(json.dumps(output, indent=2))
+        return 0
+
+    for item in output:
+        print(f"\n? {item['query']}")
+        for m in item['matches']:
+            print(f"  [{m['score']:.2f}] {m['video_name']} @ {query_engine.format_timestamp(m['start_time'])}: "
+                  f"{m['text'][:100]}...")
+        if item.get('answer'):
+            print(f"\n{item['answer']}")
+    return 0
+
+
+def cmd_summarize(args):
+    print(query_engine.generate_video_summary(args.video, args.user, load_api_key(args.api_key)))
+    return 0
+
+
+def rebuild(username, video_name):
+    try:
+        chunk_count = video_processor.reindex_video(username, video_name)
+    except Exception as e:
+        print(f"{video_name}: FAILED ({e})")
+        return False
+    if chunk_count is None:
+        print(f"{video_name}: skipped (changed while rebuilding)")
+    else:
+        print(f"{video_name}: rebuilt with {chunk_count} chunks")
+    return True
+
+
+def cmd_reindex(args):
+    failures = 0
+    for video_name in args.videos or video_processor.get_videos_list(args.user, states=("ready",)):
+        failures += not rebuild(args.user, video_name)
+    return 1 if failures else 0
+
+
+def cmd_migrate(args):
+    outdated = catalog.list_outdated_videos(video_processor.INDEX_VERSION, embedding_engine.EMBEDDING_MODEL_VERSION,
+                                            username=args.user)
+    print(f"{len(outdated)} video(s) indexed with an older schema or model "
+          f"(current: v{video_processor.INDEX_VERSION}, {embedding_engine.EMBEDDING_MODEL_VERSION})")
+    if args.list:
+        for row in outdated:
+            print(f"  {row['username']}/{row['display_name']}: v{row['index_version'] or '?'}, "
+                  f"{row['model_version'] or 'unknown model'}")
+        return 0
+
+    failures = 0
+    for row in outdated:
+        failures += not rebuild(row['username'], row['display_name'])
+    video_processor.drop_retired_collections()
+    return 1 if failures else 0
+
+
+def cmd_bench(args):
+    queries = args.queries or DEFAULT_BENCH_QUERIES
+
+    # warm up models so the first timing isn't a model load
+    query_engine.search_many(queries[:1], args.user)
+
+    single, batched = [], []
+    for _ in range(args.repeat):
+        for query in queries:
+            start = time.perf_counter()
+            query_engine.search_all_collections(query, args.user)
+            single.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query_engine.search_many(queries, args.user)
+        batched.append((time.perf_counter() - start) / len(queries))
+
+    for label, values in [("single query", single), ("batched, per query", batched)]:
+        print(f"{label:>20}: p50 {percentile(values, 50) * 1000:.0f} ms, "
+              f"p95 {percentile(values, 95) * 1000:.0f} ms (n={len(values)})")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pinpoint", description="PinPoint AI headless tools")
+    parser.add_argument("--api-key", help="Gemini API key (defaults to $GEMINI_API_KEY or secrets.toml)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", help="import and index video files")
+    p.add_argument("user")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--overwrite", action="store_true", help="replace videos with the same name")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("bulk", help="import a whole folder in the background (duplicates are skipped)")
+    p.add_argument("user")
+    p.add_argument("folder", nargs="?", help="without a folder, only shows the import progress")
+    p.add_argument("--move", action="store_true", help="move the files into the library instead of copying")
+    p.add_argument("--no-recursive", action="store_true", help="skip subfolders")
+    p.add_argument("--wait", action="store_true", help="wait until every file is processed")
+    p.set_defaults(func=cmd_bulk)
+
+    p = sub.add_parser("search", help="search the library (several queries are batched)")
+    p.add_argument("user")
+    p.add_argument("queries", nargs="+")
+    p.add_argument("--video", help="restrict the search to one video")
+    p.add_argument("--top-k", type=int, default=query_engine.FINAL_TOP_K)
+    p.add_argument("--answer", action="store_true", help="also generate an AI answer per query")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("summarize", help="print the AI summary of a video")
+    p.add_argument("user")
+    p.add_argument("video")
+    p.set_defaults(func=cmd_summarize)
+
+    p = sub.add_parser("reindex", help="rebuild indexes with the current chunking and embedding model")
+    p.add_argument("user")
+    p.add_argument("videos", nargs="*")
+    p.set_defaults(func=cmd_reindex)
+
+    p = sub.add_parser("migrate", help="rebuild every index made with an older schema or model")
+    p.add_argument("user", nargs="?", help="only this user's library")
+    p.add_argument("--list", action="store_true", help="only list the outdated videos")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("bench", help="time single vs. batched search on a user's library")
+    p.add_argument("user")
+    p.add_argument("queries", nargs="*")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if video_processor.CHROMA_MODE == "server" and not chroma_server.ensure_server_running():
+        return 1
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,115 +1,406 @@
-import streamlit as st
 import video_processor
-import torch
 import re
-from sentence_transformers import CrossEncoder
-import google.generativeai as genai
+import html
+import json
+import hashlib
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import answer_cache
+import embedding_engine
+import llm_client
+import metrics
+import model_manager
+import routing
 
 # configurations
-GEMINI_MODEL_NAME = "gemini-2.5-flash"
 INITIAL_TOP_K = 10
 FINAL_TOP_K = 3
+RETRIEVAL_CONCURRENCY = 8  # videos searched in parallel
+RERANK_BATCH_SIZE = 16  # cross-encoder pairs between cancellation checks
+CONTEXT_WINDOW = 1  # neighbouring chunks added on each side of a retrieved chunk
 
+# LLM context packing
+CONTEXT_TOKEN_BUDGET = 2000  # max estimated tokens of transcript in a prompt
+CONTEXT_MIN_BLOCK_TOKENS = 60  # don't bother adding a truncated block smaller than this
 
-# load reranker model with caching
-@st.cache_resource(show_spinner=False)
-def load_reranker():
-    if torch.cuda.is_available():
-        device = "cuda"
-        print("\n✅ GPU DETECTED: RUNNING IN FAST MODE\n")
-    else:
-        device = "cpu"
-        print("\n⚠️ GPU NOT FOUND: RUNNING IN SLOW CPU MODE\n")
-    return CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', device=device)
+LOCAL_FALLBACK_HEADER = "**⚠️ Cloud AI Unavailable"  # answers starting with it are never cached
 
+# LLM call deadlines (seconds)
+ANSWER_TIMEOUT = 45
+ANSWER_HEDGE_DELAY = 6  # fire the fallback model if the primary hasn't answered by then
+SUMMARY_TIMEOUT = 120
+QUIZ_TIMEOUT = 90
 
-def expand_context(collection, center_id, window=1):
-    """Fetches surrounding segments to provide expanded context."""
+# summarization (map-reduce for long transcripts)
+SUMMARY_SECTION_SIZE = 40  # transcript chunks per section
+SUMMARY_REDUCE_FAN_IN = 12  # max section notes merged in one prompt
+SUMMARY_MAX_WORKERS = 4  # concurrent section summaries
+
+# pre-generated quiz questions
+QUIZ_POOL_SIZE = 12  # questions kept ready per video
+QUIZ_POOL_LOW_WATER = 4  # refill in the background below this
+QUIZ_SECTION_SIZE = 30  # transcript chunks per question batch
+QUIZ_BATCH_SIZE = 3  # questions per batch
+
+_quiz_pool_lock = threading.Lock()
+_quiz_refills_running = set()
+
+_query_loop = None
+_query_loop_lock = threading.Lock()
+
+
+def format_timestamp(seconds):
+    minutes = int(seconds // 60)
+    return f"{minutes:02d}:{int(seconds % 60):02d}"
+
+
+def fetch_context_segments(collection, center_id, window=1):
+    """Fetches a chunk and its neighbours as time-stamped segments, in chronological order."""
     try:
         base_name, index_str = center_id.rsplit('_', 1)
         current_idx = int(index_str)
+        step = video_processor.GROUP_SIZE
         ids_to_fetch = []
-        for i in range(current_idx - window, current_idx + window + 1):
+        for i in range(current_idx - window * step, current_idx + window * step + 1, step):
             if i >= 0: ids_to_fetch.append(f"{base_name}_{i}")
         data = collection.get(ids=ids_to_fetch)
-        sorted_docs = sorted(zip(data['ids'], data['documents']), key=lambda x: int(x[0].rsplit('_', 1)[1]))
-        full_text = " ".join([doc for _, doc in sorted_docs])
-        return full_text
+        segments = [{
+            "index": int(doc_id.rsplit('_', 1)[1]),
+            "text": doc,
+            "start_time": meta['start_time'],
+            "end_time": meta['end_time']
+        } for doc_id, doc, meta in zip(data['ids'], data['documents'], data['metadatas'])]
+        return sorted(segments, key=lambda seg: seg['index'])
     except Exception:
-        return ""
+        return []
+
+
+def expand_context(collection, center_id, window=1):
+    """Fetches surrounding segments to provide expanded context."""
+    return " ".join([seg['text'] for seg in fetch_context_segments(collection, center_id, window)])
+
+
+def embed_queries(query_texts):
+    """Embeds the queries once, so every collection can be searched with the same vectors."""
+    with metrics.span("query.embed", queries=len(query_texts)):
+        return list(embedding_engine.encode(query_texts))
 
 
 def search_single_video(collection_name, query_text, username, n_results=5):
     """Searches a single video's collection for relevant segments."""
-    _, chroma_dir, _ = video_processor.get_user_paths(username)
-    client = video_processor.get_db_client(chroma_dir)
-    try:
-        collection = client.get_collection(collection_name)
-        return collection.query(query_texts=[query_text], n_results=n_results)
-    except ValueError:
-        return None
+    with metrics.span("query.single", n_results=n_results) as span:
+        _, chroma_dir, _ = video_processor.get_user_paths(username)
+        client = video_processor.get_db_client(chroma_dir)
+        try:
+            collection = video_processor.open_collection(client, collection_name)
+            query_embeddings = embed_queries([query_text])
+            with metrics.span("query.ann"):
+                results = collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        except ValueError:
+            return None
+        span.set(results=len(results['ids'][0]) if results['ids'] else 0)
+        return results
+
+
+class QueryCancelled(Exception):
+    """Raised inside a query pipeline once its CancellationToken has been cancelled."""
+
+
+class CancellationToken:
+    """Shared between a running query and its owner; cancel() makes every stage stop at its next check."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.stage = "Queued"
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise QueryCancelled()
+
+
+def build_candidate(collection, video_name, doc_id, meta):
+    """Expands a retrieved chunk with its neighbours into a rerankable candidate."""
+    with metrics.span("query.expand_context") as span:
+        segments = fetch_context_segments(collection, doc_id, window=CONTEXT_WINDOW)
+        span.set(segments=len(segments))
+    return {
+        "video_name": video_name,
+        "chunk_id": doc_id,
+        "text": " ".join([seg['text'] for seg in segments]),
+        "segments": segments,
+        "start_time": meta['start_time'],
+        "end_time": segments[-1]['end_time'] if segments else meta['end_time']
+    }
 
 
-def search_all_collections(query_text, username):
-    """Searches all video collections for the user and reranks results."""
-    videos_dir, chroma_dir, _ = video_processor.get_user_paths(username)
-    client = video_processor.get_db_client(chroma_path=chroma_dir)
-    videos = video_processor.get_videos_list(username)
-    reranker = load_reranker()
-    initial_candidates = []
-
-    for video_name in videos:
-        col_name = video_processor.get_safe_collection_name(video_name)
-        try:
-            collection = client.get_collection(col_name)
-            results = collection.query(query_texts=[query_text], n_results=2)
-            if results['documents']:
-                for i in range(len(results['documents'][0])):
-                    doc_id = results['ids'][0][i]
-                    expanded_text = expand_context(collection, doc_id, window=1)
-                    meta = results['metadatas'][0][i]
-                    initial_candidates.append({
-                        "video_name": video_name,
-                        "text": expanded_text,
-                        "start_time": meta['start_time']
-                    })
-        except Exception:
-            continue
+def query_video_candidates(client, video_name, col_name, query_embedding, token):
+    """Retrieves and expands the top chunks of one video (runs in a worker thread)."""
+    token.check()
+    candidates = []
+    try:
+        collection = video_processor.open_collection(client, col_name)
+        with metrics.span("query.ann"):
+            results = collection.query(query_embeddings=[query_embedding], n_results=2)
+        if results['documents']:
+            for i in range(len(results['documents'][0])):
+                token.check()
+                candidates.append(build_candidate(collection, video_name, results['ids'][0][i],
+                                                  results['metadatas'][0][i]))
+    except QueryCancelled:
+        raise
+    except Exception:
+        return []
+    return candidates
 
-    if not initial_candidates: return []
 
-    # rerank candidates
-    rerank_pairs = [[query_text, candidate['text']] for candidate in initial_candidates]
-    scores = reranker.predict(rerank_pairs)
+def rerank_candidates(query_text, candidates, token):
+    """Scores candidates with the cross-encoder in small batches, stopping early if cancelled."""
+    scores = []
+    with metrics.span("query.rerank", pairs=len(candidates)), model_manager.manager.use("reranker") as reranker:
+        for i in range(0, len(candidates), RERANK_BATCH_SIZE):
+            token.check()
+            batch = candidates[i: i + RERANK_BATCH_SIZE]
+            scores.extend(reranker.predict([[query_text, candidate['text']] for candidate in batch]))
 
     # attach scores and reasons
-    for i, candidate in enumerate(initial_candidates):
-        candidate['score'] = scores[i]
+    for candidate, score in zip(candidates, scores):
+        candidate['score'] = float(score)
         candidate['reason'] = candidate['text']
 
-    initial_candidates.sort(key=lambda x: x['score'], reverse=True)
-    return initial_candidates[:FINAL_TOP_K]
+    candidates.sort(key=lambda x: x['score'], reverse=True)
+    return candidates[:FINAL_TOP_K]
+
+
+async def search_all_collections_async(query_text, username, token, query_embedding=None):
+    """Async retrieve + rerank: videos are searched concurrently while the reranker loads."""
+    with metrics.span("query.search") as span:
+        _, chroma_dir, _ = video_processor.get_user_paths(username)
+        client = video_processor.get_db_client(chroma_path=chroma_dir)
+        videos = video_processor.get_video_collections(username, states=("ready",))
+        limiter = asyncio.Semaphore(RETRIEVAL_CONCURRENCY)
+        span.set(videos=len(videos))
+
+        token.stage = "Searching your library"
+        reranker_task = asyncio.create_task(asyncio.to_thread(model_manager.manager.preload, "reranker"))
+        try:
+            if query_embedding is None:
+                query_embedding = (await asyncio.to_thread(embed_queries, [query_text]))[0]
+            # only the videos closest to the question get the fine-grained search
+            videos = await asyncio.to_thread(routing.route_videos, username, videos, query_embedding)
+            span.set(searched_videos=len(videos))
+
+            async def retrieve(video_name, col_name):
+                async with limiter:
+                    return await asyncio.to_thread(query_video_candidates, client, video_name, col_name,
+                                                   query_embedding, token)
+
+            per_video = await asyncio.gather(*[retrieve(name, col_name) for name, col_name in videos.items()])
+        except BaseException:
+            reranker_task.cancel()
+            raise
+        initial_candidates = [candidate for candidates in per_video for candidate in candidates]
+        span.set(candidates=len(initial_candidates))
+        token.check()
+
+        if not initial_candidates: return []
+
+        token.stage = "Ranking the best moments"
+        await reranker_task
+        return await asyncio.to_thread(rerank_candidates, query_text, initial_candidates, token)
+
+
+async def answer_query_async(query_text, username, api_key, token):
+    """Full retrieve -> rerank -> generate pipeline. Returns (answer, matches); answer is None without matches."""
+    with metrics.span("query.answer") as span:
+        # a near-duplicate of an earlier question on the same library reuses its answer
+        query_embedding = (await asyncio.to_thread(embed_queries, [query_text]))[0]
+        scope = await asyncio.to_thread(answer_cache.get_scope, username)
+        cached = answer_cache.lookup(scope, query_embedding)
+        span.set(cached=int(cached is not None))
+        if cached: return cached
+
+        matches = await search_all_collections_async(query_text, username, token, query_embedding)
+        if not matches: return None, []
+
+        token.check()
+        token.stage = "Writing the answer"
+        answer = await asyncio.to_thread(ask_gemini, query_text, matches, api_key, token)
+        if not answer.startswith(LOCAL_FALLBACK_HEADER):
+            answer_cache.store(scope, query_embedding, answer, matches)
+        return answer, matches
+
+
+def search_all_collections(query_text, username):
+    """Searches all video collections for the user and reranks results."""
+    return asyncio.run(search_all_collections_async(query_text, username, CancellationToken()))
+
+
+def search_many(queries, username, video_names=None, top_k=FINAL_TOP_K):
+    """
+    Batched search for offline workloads: each collection is queried once for all queries
+    and every (query, candidate) pair is reranked in a single pass.
+    Returns one ranked result list per query.
+    """
+    with metrics.span("query.batch", queries=len(queries)):
+        _, chroma_dir, _ = video_processor.get_user_paths(username)
+        client = video_processor.get_db_client(chroma_path=chroma_dir)
+        videos = video_processor.get_video_collections(username, states=("ready",))
+        if video_names:
+            videos = {name: col_name for name, col_name in videos.items() if name in video_names}
+        query_embeddings = embed_queries(queries)
+        per_query = [[] for _ in queries]
+
+        for video_name, col_name in videos.items():
+            try:
+                collection = video_processor.open_collection(client, col_name)
+                with metrics.span("query.ann", queries=len(queries)):
+                    results = collection.query(query_embeddings=query_embeddings, n_results=2)
+            except Exception:
+                continue
+            for q_idx in range(len(queries)):
+                for doc_id, meta in zip(results['ids'][q_idx], results['metadatas'][q_idx]):
+                    per_query[q_idx].append(build_candidate(collection, video_name, doc_id, meta))
+
+        pairs = [[queries[q_idx], candidate['text']] for q_idx, candidates in enumerate(per_query)
+                 for candidate in candidates]
+        scores = iter([])
+        # without candidates there is nothing to rerank, so the model isn't loaded (or pinned) at all
+        if pairs:
+            with metrics.span("query.rerank", pairs=len(pairs)), model_manager.manager.use("reranker") as reranker:
+                scores = iter(reranker.predict(pairs))
+
+    ranked = []
+    for candidates in per_query:
+        for candidate in candidates:
+            candidate['score'] = float(next(scores))
+            candidate['reason'] = candidate['text']
+        ranked.append(sorted(candidates, key=lambda x: x['score'], reverse=True)[:top_k])
+    return ranked
+
+
+def get_query_loop():
+    """Returns the background event loop that runs submitted queries, starting it on first use."""
+    global _query_loop
+    with _query_loop_lock:
+        if _query_loop is None:
+            _query_loop = asyncio.new_event_loop()
+            threading.Thread(target=_query_loop.run_forever, daemon=True, name="query-loop").start()
+        return _query_loop
+
+
+def submit_query(query_text, username, api_key):
+    """
+    Starts the answer pipeline in the background and returns (future, token).
+    Cancelling the token stops retrieval, reranking and the LLM call at their next check,
+    so a superseded or abandoned query stops consuming CPU and API quota.
+    """
+    token = CancellationToken()
+    future = asyncio.run_coroutine_threadsafe(
+        answer_query_async(query_text, username, api_key, token), get_query_loop())
+    return future, token
+
+
+def strip_markup(text):
+    """Removes HTML tags/entities and display ellipses so only transcript words reach the LLM."""
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', text))
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'^\.\.\.\s*|\s*\.\.\.$', '', text)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def pack_context(hits, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turns ranked hits into non-overlapping context blocks that fit the token budget.
+    Hits of the same video whose time ranges overlap are merged (their segments are
+    de-duplicated), markup is stripped, and blocks are then taken by score until the
+    budget is full. Hits without a 'score' are assumed to be in rank order.
+    """
+    blocks = []
+    for rank, hit in enumerate(hits):
+        segments = hit.get('segments') or [{
+            "index": None,
+            "text": hit['text'],
+            "start_time": hit['start_time'],
+            "end_time": hit.get('end_time', hit['start_time'])
+        }]
+        blocks.append({
+            "video_name": hit.get('video_name', 'video'),
+            "score": float(hit.get('score', -rank)),
+            "start_time": min([seg['start_time'] for seg in segments]),
+            "end_time": max([seg['end_time'] for seg in segments]),
+            "segments": segments
+        })
+
+    # merge overlapping time ranges per video
+    merged = []
+    blocks.sort(key=lambda b: (b['video_name'], b['start_time']))
+    for block in blocks:
+        last = merged[-1] if merged else None
+        if last and last['video_name'] == block['video_name'] and block['start_time'] <= last['end_time']:
+            last['segments'] = last['segments'] + block['segments']
+            last['end_time'] = max(last['end_time'], block['end_time'])
+            last['score'] = max(last['score'], block['score'])
+        else:
+            merged.append(dict(block))
+
+    # fill the budget by score
+    packed = []
+    remaining = token_budget
+    for block in sorted(merged, key=lambda b: b['score'], reverse=True):
+        unique_segments = {}
+        for seg in sorted(block['segments'], key=lambda seg: seg['start_time']):
+            key = seg['index'] if seg['index'] is not None else (seg['start_time'], seg['text'])
+            unique_segments.setdefault(key, seg)
+        text = " ".join([strip_markup(seg['text']) for seg in unique_segments.values()])
+
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if remaining < CONTEXT_MIN_BLOCK_TOKENS: continue
+            text = text[:remaining * 4].rsplit(' ', 1)[0] + " ..."
+            tokens = estimate_tokens(text)
+        remaining -= tokens
+        packed.append({
+            "video_name": block['video_name'],
+            "start_time": block['start_time'],
+            "end_time": block['end_time'],
+            "score": block['score'],
+            "text": text
+        })
+    return packed
 
 
 def format_local_fallback(query, context_results, error_msg):
     """Formats a fallback response when cloud AI is unavailable."""
-    response = f"**⚠️ Cloud AI Unavailable ({error_msg})**\n\n"
+    response = f"{LOCAL_FALLBACK_HEADER} ({error_msg})**\n\n"
     response += "Using **Local Fallback Mode**. Matches found:\n\n"
     for i, item in enumerate(context_results):
         response += f"**{i + 1}. {item.get('video_name', 'Video')}**\n> *\"{item['text']}\"*\n\n"
     return response
 
 
-def ask_gemini(query, context_results, api_key):
+def ask_gemini(query, context_results, api_key, cancel_token=None):
     """Sends the user query and context to Gemini API and retrieves the answer."""
-    if not api_key: return format_local_fallback(query, context_results, "No API Key")
+    if not llm_client.is_available(api_key): return format_local_fallback(query, context_results, "No API Key")
     try:
-        genai.configure(api_key=api_key)
-
-        # build a cleaner context string
+        # build a cleaner context string within the token budget
         context_text = ""
-        for item in context_results:
-            context_text += f"--- Snippet from {item.get('video_name', 'video')} ---\n{item['text']}\n\n"
+        packed = pack_context(context_results)
+        for item in packed:
+            time_range = f"{format_timestamp(item['start_time'])}-{format_timestamp(item['end_time'])}"
+            context_text += f"--- Snippet from {item['video_name']} ({time_range}) ---\n{item['text']}\n\n"
 
         prompt = f"""
         You are a smart AI study assistant. Your goal is to help the user understand the video content.
@@ -128,42 +419,124 @@ def ask_gemini(query, context_results, api_key):
         """
 
         try:
-            model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-            return model.generate_content(prompt).text
-        except Exception:
-            try:
-                model = genai.GenerativeModel('gemini-pro')
-                return model.generate_content(prompt).text
-            except Exception as e:
-                return format_local_fallback(query, context_results, "Connection Failed")
+            client = llm_client.get_llm_client(api_key)
+            with metrics.span("llm.answer", context_blocks=len(packed), prompt_tokens=estimate_tokens(prompt)) as span:
+                answer = client.generate(prompt, timeout=ANSWER_TIMEOUT, hedge_delay=ANSWER_HEDGE_DELAY,
+                                         cancel_token=cancel_token)
+                span.set(answer_tokens=estimate_tokens(answer))
+            return answer
+        except llm_client.LLMError:
+            return format_local_fallback(query, context_results, "Connection Failed")
+    except QueryCancelled:
+        raise
     except Exception as e:
         return format_local_fallback(query, context_results, str(e))
 
 
+def get_ordered_chunks(collection):
+    """Returns all (text, metadata) chunks of a collection in chronological order."""
+    all_data = collection.get()
+    sorted_indices = sorted(range(len(all_data['ids'])),
+                            key=lambda k: int(all_data['ids'][k].rsplit('_', 1)[1]))
+    return [(all_data['documents'][i], all_data['metadatas'][i]) for i in sorted_indices]
+
+
+def summarize_section(llm, section_text, time_range):
+    """Map step: condenses one time-ordered transcript section into short notes."""
+    prompt = f"""
+        Summarize the following section ({time_range}) of a video transcript as concise notes.
+
+        RULES:
+        1. Use ONLY standard ASCII characters and simple dashes '-' for bullets.
+        2. Keep every concept, definition, example and conclusion that is mentioned.
+        3. Keep the original order. Do not add information that is not in the text.
+
+        TRANSCRIPT SECTION:
+        {section_text}
+        """
+    with metrics.span("llm.summary_section", prompt_tokens=estimate_tokens(prompt)):
+        return llm.generate(prompt, timeout=SUMMARY_TIMEOUT)
+
+
+def map_sections(llm, sections, cache):
+    """Summarizes (text, time_range) sections concurrently, reusing cached notes by content hash."""
+    keys = [hashlib.sha256(f"{llm_client.GEMINI_MODELS[0]}|{text}".encode()).hexdigest() for text, _ in sections]
+    todo = [i for i, key in enumerate(keys) if key not in cache]
+
+    if todo:
+        with metrics.span("summary.map", sections=len(sections), cache_misses=len(todo)), \
+                ThreadPoolExecutor(max_workers=min(SUMMARY_MAX_WORKERS, len(todo))) as pool:
+            # each thread runs in a copy of our context, so its spans join the summary trace
+            futures = {i: pool.submit(contextvars.copy_context().run, summarize_section, llm, *sections[i])
+                       for i in todo}
+            for i, future in futures.items():
+                cache[keys[i]] = future.result()
+
+    return [cache[key] for key in keys], keys
+
+
 def generate_video_summary(video_name, username, api_key):
-    """Retrieves the full transcript and generates a structured AI summary."""
-    if not api_key:
+    """
+    Generates a structured AI summary of the video.
+    Long transcripts are map-reduced: time-ordered sections are summarized concurrently
+    and the notes are reduced into the final summary. Section notes are cached by content,
+    so a re-summary only pays for sections that changed.
+    """
+    with metrics.span("summary"):
+        return _generate_video_summary(video_name, username, api_key)
+
+
+def _generate_video_summary(video_name, username, api_key):
+    if not llm_client.is_available(api_key):
         return "Please provide a Gemini API Key in the sidebar."
 
     # get DB paths
     _, chroma_dir, _ = video_processor.get_user_paths(username)
     client = video_processor.get_db_client(chroma_dir)
-    col_name = video_processor.get_safe_collection_name(video_name)
+    col_name = video_processor.get_collection_name(username, video_name)
 
     try:
         collection = client.get_collection(col_name)
-        all_data = collection.get()  # Fetch all segments
-
-        # reconstruct transcript chronologically based on the ID suffix
-        sorted_indices = sorted(range(len(all_data['ids'])),
-                                key=lambda k: int(all_data['ids'][k].rsplit('_', 1)[1]))
-        full_transcript = " ".join([all_data['documents'][i] for i in sorted_indices])
-
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        chunks = get_ordered_chunks(collection)
+        llm = llm_client.get_llm_client(api_key)
+
+        if len(chunks) <= SUMMARY_SECTION_SIZE:
+            # short video: the transcript itself fits in a single prompt
+            intro = "Analyze the following video transcript"
+            source_label = "TRANSCRIPT"
+            source_text = " ".join([text for text, _ in chunks])
+        else:
+            cache_path = video_processor.get_video_cache_path(username, "summaries", video_name)
+            cache = video_processor.load_json_cache(cache_path, default={})
+            used_keys = []
+
+            # map: summarize each time-ordered section
+            sections = []
+            for i in range(0, len(chunks), SUMMARY_SECTION_SIZE):
+                group = chunks[i: i + SUMMARY_SECTION_SIZE]
+                time_range = f"{format_timestamp(group[0][1]['start_time'])}-{format_timestamp(group[-1][1]['end_time'])}"
+                sections.append((" ".join([text for text, _ in group]), time_range))
+            notes, keys = map_sections(llm, sections, cache)
+            used_keys += keys
+
+            # intermediate reduce: merge notes until they fit into one final prompt
+            while len(notes) > SUMMARY_REDUCE_FAN_IN:
+                merged = []
+                for i in range(0, len(notes), SUMMARY_REDUCE_FAN_IN):
+                    group = notes[i: i + SUMMARY_REDUCE_FAN_IN]
+                    merged.append(("\n\n".join(group), f"part {i // SUMMARY_REDUCE_FAN_IN + 1}"))
+                notes, keys = map_sections(llm, merged, cache)
+                used_keys += keys
+
+            # keep only the entries of the current transcript
+            video_processor.save_json_cache(cache_path, {key: cache[key] for key in used_keys})
+
+            intro = "Analyze the following notes, taken section by section from a video transcript,"
+            source_label = "SECTION NOTES (in chronological order)"
+            source_text = "\n\n".join(notes)
 
         prompt = f"""
-            Analyze the following video transcript and provide a structured summary.
+            {intro} and provide a structured summary.
 
             CRITICAL FORMATTING RULES:
             1. Use ONLY standard ASCII characters. 
@@ -176,24 +549,24 @@ def generate_video_summary(video_name, username, api_key):
             - Key Takeaways: Bulleted list (using '-').
             - Detailed Narrative: Explanation of the content.
 
-            TRANSCRIPT:
-            {full_transcript}
+            {source_label}:
+            {source_text}
             """
 
-        response = model.generate_content(prompt)
-        return response.text
+        with metrics.span("llm.summary", chunks=len(chunks), prompt_tokens=estimate_tokens(prompt)):
+            return llm.generate(prompt, timeout=SUMMARY_TIMEOUT)
     except Exception as e:
         return f"Summary failed: {str(e)}"
 
 
 def generate_quiz_question(video_name, username, api_key):
     """Generates a high-quality multiple-choice question from the video's transcript."""
-    if not api_key:
+    if not llm_client.is_available(api_key):
         return "Please provide an API Key."
 
     _, chroma_dir, _ = video_processor.get_user_paths(username)
     client = video_processor.get_db_client(chroma_dir)
-    col_name = video_processor.get_safe_collection_name(video_name)
+    col_name = video_processor.get_collection_name(username, video_name)
 
     # fetch full transcript
     try:
@@ -201,9 +574,6 @@ def generate_quiz_question(video_name, username, api_key):
         all_data = collection.get()
         full_transcript = " ".join(all_data['documents'])
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)  #
-
         prompt = f"""
                 Analyze the following transcript and create one high-quality multiple-choice question.
 
@@ -229,179 +599,140 @@ def generate_quiz_question(video_name, username, api_key):
                 {full_transcript}
                 """
 
-        return model.generate_content(prompt).text
+        with metrics.span("llm.quiz_question", prompt_tokens=estimate_tokens(prompt)):
+            return llm_client.get_llm_client(api_key).generate(prompt, timeout=QUIZ_TIMEOUT)
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-# locking mechanism for video chat input
-def lock_video_chat():
-    st.session_state['processing_video'] = True
+def parse_quiz_batch(raw_text):
+    """Parses the JSON list of questions returned by the model, dropping malformed entries."""
+    start, end = raw_text.find('['), raw_text.rfind(']')
+    if start == -1 or end == -1: return []
+    try:
+        items = json.loads(raw_text[start:end + 1])
+    except ValueError:
+        return []
+
+    questions = []
+    for item in items:
+        if not isinstance(item, dict): continue
+        options = item.get('options') or {}
+        answer = str(item.get('answer', '')).strip().upper()[:1]
+        if not item.get('question') or sorted(options) != ["A", "B", "C", "D"] or answer not in options:
+            continue
+        questions.append({
+            "question": str(item['question']).strip(),
+            "options": {letter: str(options[letter]).strip() for letter in "ABCD"},
+            "answer": answer,
+            "explanation": str(item.get('explanation', '')).strip()
+        })
+    return questions
+
+
+def format_quiz_question(item):
+    """Renders a pooled question in the 'Question: ... Solution: ...' layout used by the chat UI."""
+    options = "\n\n".join([f"{letter}) {item['options'][letter]}" for letter in "ABCD"])
+    return (f"Question: {item['question']} *(covers {item['time_range']})*\n\n{options}\n\n"
+            f"Solution: {item['answer']}) {item['options'][item['answer']]}\n\n{item['explanation']}")
+
+
+def generate_quiz_batch(llm, section_text, time_range):
+    """Asks the model for a batch of multiple-choice questions about one transcript section."""
+    prompt = f"""
+        Analyze the following transcript section ({time_range}) and create {QUIZ_BATCH_SIZE} different
+        high-quality multiple-choice questions about it.
+
+        FORMATTING RULES:
+        1. Use ONLY standard ASCII characters (No emojis, no special bullets).
+        2. Reply with a JSON list only, no extra text.
+        3. Every item must have exactly this shape:
+           {{"question": "...", "options": {{"A": "...", "B": "...", "C": "...", "D": "..."}},
+             "answer": "A", "explanation": "..."}}
+
+        TRANSCRIPT SECTION:
+        {section_text}
+        """
+    with metrics.span("llm.quiz_batch", prompt_tokens=estimate_tokens(prompt)) as span:
+        questions = parse_quiz_batch(llm.generate(prompt, timeout=QUIZ_TIMEOUT))
+        span.set(questions=len(questions))
+    for item in questions:
+        item['time_range'] = time_range
+    return questions
 
 
-def highlight_text(text, query):
-    """Highlights relevant keywords in the text based on the query."""
-    if not query: return text[:100] + "..."
+def refill_quiz_pool(video_name, username, api_key):
+    """Tops up the video's question pool, one batch per transcript section, rotating through the video."""
+    _, chroma_dir, _ = video_processor.get_user_paths(username)
+    client = video_processor.get_db_client(chroma_dir)
+    collection = client.get_collection(video_processor.get_collection_name(username, video_name))
+    chunks = get_ordered_chunks(collection)
+    if not chunks: return
+
+    sections = []
+    for i in range(0, len(chunks), QUIZ_SECTION_SIZE):
+        group = chunks[i: i + QUIZ_SECTION_SIZE]
+        time_range = f"{format_timestamp(group[0][1]['start_time'])}-{format_timestamp(group[-1][1]['end_time'])}"
+        sections.append((" ".join([text for text, _ in group]), time_range))
+
+    llm = llm_client.get_llm_client(api_key)
+    pool_path = video_processor.get_video_cache_path(username, "quizzes", video_name)
+
+    # at most one pass over the video per refill, so a failing model can't loop forever
+    for _ in range(len(sections)):
+        with _quiz_pool_lock:
+            pool = video_processor.load_json_cache(pool_path, default={"questions": [], "next_section": 0})
+        if len(pool['questions']) >= QUIZ_POOL_SIZE: break
+
+        section_idx = pool['next_section'] % len(sections)
+        batch = generate_quiz_batch(llm, *sections[section_idx])
+
+        # re-read under the lock: questions may have been served while the model was busy
+        with _quiz_pool_lock:
+            pool = video_processor.load_json_cache(pool_path, default={"questions": [], "next_section": 0})
+            known = {item['question'] for item in pool['questions']}
+            pool['questions'] += [item for item in batch if item['question'] not in known]
+            pool['next_section'] = section_idx + 1
+            video_processor.save_json_cache(pool_path, pool)
+
+
+def start_quiz_pool_refill(video_name, username, api_key):
+    """Refills the question pool in a background thread (no-op if a refill is already running)."""
+    if not llm_client.is_available(api_key): return
+    job_key = (username, video_name)
+    with _quiz_pool_lock:
+        if job_key in _quiz_refills_running: return
+        _quiz_refills_running.add(job_key)
+
+    def run():
+        try:
+            with metrics.span("quiz.refill"):
+                refill_quiz_pool(video_name, username, api_key)
+        except Exception as e:
+            print(f"Quiz pool refill failed for {video_name}: {e}")
+        finally:
+            with _quiz_pool_lock:
+                _quiz_refills_running.discard(job_key)
 
-    # stopwords list
-    STOP_WORDS = {
-        "what", "where", "when", "how", "who", "why", "which",
-        "the", "is", "are", "was", "were", "be", "been", "being",
-        "and", "or", "but", "if", "because", "as", "until", "while",
-        "of", "at", "by", "for", "with", "about", "against", "between",
-        "into", "through", "during", "before", "after", "above", "below",
-        "to", "from", "up", "down", "in", "out", "on", "off", "over", "under",
-        "again", "further", "then", "once", "here", "there", "all", "any",
-        "can", "will", "just", "don", "should", "now"
-    }
+    threading.Thread(target=run, daemon=True).start()
 
-    raw_words = query.lower().split()
-
-    # keep words that are NOT stop words AND are > 2 chars
-    keywords = [w for w in raw_words if w not in STOP_WORDS and len(w) > 2]
-
-    # if filtering removed everything, we keep the original words to avoid breaking the logic
-    if not keywords:
-        keywords = [w for w in raw_words if len(w) > 2]
-
-    # we create a pattern that matches the keyword + any suffix (like 's', 'ing', 'ed')
-    if keywords:
-        pattern_str = r'\b(?:' + '|'.join([re.escape(w) + r'\w*' for w in keywords]) + r')'
-        regex = re.compile(pattern_str, re.IGNORECASE)
-    else:
-        regex = None
-
-    # find the first occurrence of ANY of our smart keywords
-    first_match_index = -1
-    if regex:
-        match = regex.search(text)
-        if match:
-            first_match_index = match.start()
-
-    if first_match_index != -1:
-        start = max(0, first_match_index - 30)
-        end = min(len(text), first_match_index + 60)
-        snippet = "..." + text[start:end] + "..."
-    else:
-        snippet = text[:80] + "..."
-
-    # apply highlight to all occurrences in the snippet
-    if regex:
-        highlighted = regex.sub(
-            lambda
-                m: f'<span style="background-color: rgba(255, 215, 0, 0.3); color: inherit; padding: 0px 2px; border-radius: 4px;">{m.group(0)}</span>',
-            snippet
-        )
-    else:
-        highlighted = snippet
-
-    return highlighted
-
-
-# UI for the video chat
-def render_search_ui(selected_video_name, video_path, video_player_placeholder, username, api_key):
-    st.markdown("### 💬 Chat with Video")
-
-    # initialize state
-    if 'video_chat_history' not in st.session_state:
-        st.session_state['video_chat_history'] = []
-
-    # check for video switch
-    if 'last_video_name' not in st.session_state:
-        st.session_state['last_video_name'] = selected_video_name
-    elif st.session_state['last_video_name'] != selected_video_name:
-        st.session_state['video_chat_history'] = []
-        st.session_state['last_video_name'] = selected_video_name
-
-    # lock state for this specific component
-    if 'processing_video' not in st.session_state:
-        st.session_state['processing_video'] = False
-
-    if st.button("🧠 Challenge me with a question!", use_container_width=True):
-        with st.spinner("Analyzing video..."):
-            quiz_content = generate_quiz_question(selected_video_name, username, api_key)
-            # append quiz message with a special flag
-            st.session_state['video_chat_history'].append({
-                "role": "assistant",
-                "content": quiz_content,
-                "is_quiz": True
-            })
-            st.rerun()
-
-    # scrollable container
-    chat_container = st.container(height=500)
-    with chat_container:
-        for i, msg in enumerate(st.session_state['video_chat_history']):
-            avatar_style = "assistant" if msg['role'] == "assistant" else "user"
-            with st.chat_message(msg['role'], avatar=avatar_style):
-
-                # rendering logic for quiz messages
-                if msg.get('is_quiz') and "Solution:" in msg['content']:
-                    q_part, s_part = msg['content'].split("Solution:")
-                    st.markdown(f"**Challenge Question:**\n\n{q_part}")
-                    with st.expander("Check the Answer"):
-                        st.success(s_part.strip())
-                else:
-                    # text message rendering
-                    st.write(msg['content'])
-
-                if msg.get('sources'):
-                    st.divider()
-                    st.caption(f"Top {len(msg['sources'])} most relevant moments:")
-
-                    for idx, res in enumerate(msg['sources']):
-                        with st.container(border=True):
-                            # time calculation for playback control
-                            minutes = int(res['start_time'] // 60)
-                            seconds = int(res['start_time'] % 60)
-                            time_str = f"{minutes:02d}:{seconds:02d}"
-
-                            if st.button(f"Jump to {time_str}", key=f"vhist_{i}_{idx}"):
-                                st.session_state['start_time'] = res['start_time']
-                                st.rerun()
-
-                            # render text with grey subtext styling
-                            st.markdown(
-                                f"<div style='margin-top: 10px; color: #CCCCCC;'>... {res['text']} ...</div>",
-                                unsafe_allow_html=True)
-
-    # locked chat input
-    query = st.chat_input(
-        "Ask about this video...",
-        on_submit=lock_video_chat,
-        disabled=st.session_state['processing_video']
-    )
-
-    if query and selected_video_name:
-        st.session_state['video_chat_history'].append({"role": "user", "content": query})
-
-        col_name = video_processor.get_safe_collection_name(selected_video_name)
-        results = search_single_video(col_name, query, username)
-
-        if results and results['documents']:
-            found_any = True
-            valid_results = []
-            # process and highlight results
-            for i in range(len(results['documents'][0])):
-                doc_text = results['documents'][0][i]
-                start_time = results['metadatas'][0][i]['start_time']
-                styled_text = highlight_text(doc_text, query)
-                valid_results.append({'text': styled_text, 'start_time': start_time})
-
-            if found_any:
-                with st.spinner("Analyzing..."):
-                    ai_answer = ask_gemini(query, valid_results, api_key)
-                    st.session_state['video_chat_history'].append({
-                        "role": "assistant",
-                        "content": ai_answer,
-                        "sources": valid_results
-                    })
-        else:
-            st.session_state['video_chat_history'].append({
-                "role": "assistant",
-                "content": "No matches found.",
-                "sources": []
-            })
-
-        st.session_state['processing_video'] = False
-        st.rerun()
+
+def get_quiz_question(video_name, username, api_key):
+    """Serves a question from the pre-generated pool, refilling it in the background when it runs low."""
+    if not llm_client.is_available(api_key):
+        return "Please provide an API Key."
+
+    pool_path = video_processor.get_video_cache_path(username, "quizzes", video_name)
+    with _quiz_pool_lock:
+        pool = video_processor.load_json_cache(pool_path, default={"questions": [], "next_section": 0})
+        item = pool['questions'].pop(0) if pool['questions'] else None
+        if item:
+            video_processor.save_json_cache(pool_path, pool)
+
+    if len(pool['questions']) < QUIZ_POOL_LOW_WATER:
+        start_quiz_pool_refill(video_name, username, api_key)
+
+    # empty pool (e.g. first click on an old video): fall back to a direct request
+    if item is None:
+        return generate_quiz_question(video_name, username, api_key)
+    return format_quiz_question(item)
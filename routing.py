@@ -0,0 +1,162 @@
+"""
+Coarse routing index for library-wide questions. Every video is summarized at ingest by a
+few unit vectors (the centroid of each chapter of ROUTING_CHAPTER_CHUNKS chunks, plus the
+whole video), cached in the user's 'routing' folder. Per user they are stacked into one
+in-memory matrix, so a single NumPy product scores every video against the question and
+only the ROUTING_TOP_VIDEOS best go through vector search and reranking. Videos indexed
+before routing existed are searched unrouted until a background thread has built theirs.
+"""
+import os
+import threading
+import numpy as np
+import metrics
+import embedding_engine
+import video_processor
+
+# configurations
+ROUTING_ENABLED = os.environ.get("PINPOINT_ROUTING", "1") == "1"
+ROUTING_TOP_VIDEOS = int(os.environ.get("PINPOINT_ROUTING_TOP_VIDEOS", 8))  # videos searched per question
+ROUTING_CHAPTER_CHUNKS = 20  # chunks averaged into one chapter vector
+ROUTING_PRECISION = 5  # decimals kept in the cached vectors
+
+_matrices = {}  # username -> (library signature, matrix, owner video of each row, unrouted videos)
+_matrices_lock = threading.Lock()
+_backfilling = set()  # users whose missing routing vectors are being built
+
+
+# routing vectors of one video
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def build_routing_vectors(embeddings, chapter_chunks=ROUTING_CHAPTER_CHUNKS):
+    """Unit centroids of every chapter and of the whole video, from its chunk embeddings (in chunk order)."""
+    embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+    chapters = [embeddings[i:i + chapter_chunks].mean(axis=0) for i in range(0, len(embeddings), chapter_chunks)]
+    if len(chapters) > 1:
+        chapters.append(embeddings.mean(axis=0))
+    return normalize(np.stack(chapters))
+
+
+def get_chunk_embeddings(collection):
+    """Chunk embeddings of a collection, in transcript order."""
+    data = collection.get(include=["embeddings", "metadatas"])
+    order = sorted(range(len(data['ids'])), key=lambda i: data['metadatas'][i]['start_time'])
+    return np.asarray([data['embeddings'][i] for i in order], dtype=np.float32)
+
+
+def save_routing_vectors(username, video_name, collection):
+    """Builds and caches a video's routing vectors from its collection. Returns how many were saved."""
+    with metrics.span("ingest.routing") as span:
+        embeddings = get_chunk_embeddings(collection)
+        if not len(embeddings): return 0
+        vectors = build_routing_vectors(embeddings)
+        video_processor.save_json_cache(video_processor.get_video_cache_path(username, "routing", video_name), {
+            "collection": collection.name,
+            "embedding_model": embedding_engine.EMBEDDING_MODEL_VERSION,
+            "vectors": np.round(vectors, ROUTING_PRECISION).tolist()
+        })
+        span.set(vectors=len(vectors))
+        return len(vectors)
+
+
+def load_routing_vectors(username, video_name, collection_name):
+    """The cached vectors of the video's current collection (None if there are none yet)."""
+    cache = video_processor.load_json_cache(video_processor.get_video_cache_path(username, "routing", video_name))
+    if cache and cache['collection'] == collection_name \
+            and cache['embedding_model'] == embedding_engine.EMBEDDING_MODEL_VERSION:
+        return np.asarray(cache['vectors'], dtype=np.float32)
+    return None
+
+
+def backfill_routing_vectors(username, videos):
+    """Builds the missing vectors of {video_name: collection_name} in a background thread (one per user)."""
+    with _matrices_lock:
+        if username in _backfilling: return
+        _backfilling.add(username)
+
+    def backfill():
+        try:
+            _, chroma_dir, _ = video_processor.get_user_paths(username)
+            client = video_processor.get_db_client(chroma_dir)
+            for video_name, collection_name in videos.items():
+                try:
+                    save_routing_vectors(username, video_name, client.get_collection(collection_name))
+                except Exception as e:
+                    print(f"Routing vectors of {video_name} unavailable: {e}")
+        finally:
+            with _matrices_lock:
+                _backfilling.discard(username)
+
+    threading.Thread(target=backfill, daemon=True, name="routing-backfill").start()
+
+
+# per-user matrix
+def get_cache_mtime(username, video_name):
+    try:
+        return os.path.getmtime(video_processor.get_video_cache_path(username, "routing", video_name))
+    except OSError:
+        return None
+
+
+def get_library_signature(username, videos):
+    # the cache files are rewritten by the ingestion workers, so their mtimes are part of the key
+    return tuple(sorted([(video_name, collection_name, get_cache_mtime(username, video_name))
+                         for video_name, collection_name in videos.items()]))
+
+
+def get_routing_matrix(username, videos):
+    """
+    Returns (matrix, owners, unrouted) for {video_name: collection_name}, rebuilt when the
+    library changes (a backfilled cache file counts as a change).
+    """
+    with _matrices_lock:
+        cached = _matrices.get(username)
+    if cached and cached[0] == get_library_signature(username, videos):
+        return cached[1:]
+
+    blocks, owners, unrouted = [], [], []
+    for video_name, collection_name in videos.items():
+        vectors = load_routing_vectors(username, video_name, collection_name)
+        if vectors is None or not len(vectors):
+            unrouted.append(video_name)
+            continue
+        blocks.append(vectors)
+        owners.extend([video_name] * len(vectors))
+
+    if unrouted:
+        # the query doesn't wait for them: they stay unrouted until their vectors are built
+        backfill_routing_vectors(username, {name: videos[name] for name in unrouted})
+
+    matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    entry = (get_library_signature(username, videos), matrix, np.asarray(owners), unrouted)
+    with _matrices_lock:
+        _matrices[username] = entry
+    return entry[1:]
+
+
+def route_videos(username, videos, query_embedding, top_videos=None):
+    """
+    Keeps the top_videos videos (ROUTING_TOP_VIDEOS by default) whose best routing vector
+    is closest to the question. Videos without routing vectors are always kept.
+    """
+    top_videos = ROUTING_TOP_VIDEOS if top_videos is None else top_videos
+    if not ROUTING_ENABLED or len(videos) <= top_videos:
+        return videos
+
+    with metrics.span("query.route", videos=len(videos)) as span:
+        matrix, owners, unrouted = get_routing_matrix(username, videos)
+        if not len(owners):
+            return videos
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+        # best score per video (rows of a video are contiguous)
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        video_scores = np.maximum.reduceat(scores, starts)
+        keep = min(top_videos, len(starts))
+        best = np.argpartition(-video_scores, keep - 1)[:keep]
+        selected = set(owners[starts[best]].tolist()) | set(unrouted)
+        span.set(kept=len(selected))
+    return {name: col_name for name, col_name in videos.items() if name in selected}
@@ -2,18 +2,43 @@ import os
 import threading
 import time
 import json
-import streamlit as st
-import whisper
-import chromadb
-from chromadb.utils import embedding_functions
-import torch
+import shutil
+import functools
 import base64
-import cv2
+import uuid
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import paths
+import catalog
+import embedding_engine
+import keyframes
+import media
+import metrics
+import model_manager
 
 # configurations
-BASE_DB_FOLDER = "Database"
+BASE_DB_FOLDER = paths.BASE_DB_FOLDER
 PROCESSING_FOLDER = os.path.join(BASE_DB_FOLDER, "processing")
-device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# transcript segments per indexed chunk (chunk ids are "<collection>_<first segment index>")
+GROUP_SIZE = 3
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi')
+INDEX_VERSION = 1  # bump when the chunking / metadata layout changes; outdated videos are then rebuilt
+RETIRED_COLLECTION_GRACE = 300  # seconds a replaced collection is kept for searches still using it
+TRANSCRIBE_WINDOW_SECONDS = 600  # audio transcribed (and checkpointed) per step
+INDEX_BATCH_SIZE = 256  # chunks embedded (and checkpointed) per step
+
+# vector store: "embedded" (a PersistentClient per user folder) or "server" (one shared
+# Chroma server, a database per user, pooled HTTP connections; see chroma_server.py)
+CHROMA_MODE = os.environ.get("PINPOINT_CHROMA_MODE", "embedded")
+CHROMA_HOST = os.environ.get("PINPOINT_CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.environ.get("PINPOINT_CHROMA_PORT", 8000))
+CHROMA_TENANT = "pinpoint"
+CHROMA_POOL_SIZE = 32  # keep-alive HTTP connections per process
+
+# per-video cache folders, each holding one JSON file per video
+VIDEO_CACHE_KINDS = ["summaries", "quizzes", "transcripts", "keyframes", "checkpoints", "routing"]
 
 if not os.path.exists(PROCESSING_FOLDER):
     os.makedirs(PROCESSING_FOLDER)
@@ -33,22 +58,88 @@ def get_user_paths(username):
     return videos_dir, chroma_dir, thumbnails_dir
 
 
+def get_user_cache_dir(username, kind):
+    """Returns a per-user cache folder (e.g. 'summaries'), creating it if needed."""
+    cache_dir = os.path.join(BASE_DB_FOLDER, "users", username, kind)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
 def get_safe_collection_name(video_name):
     safe_hash = base64.b64encode(video_name.encode()).decode().replace("=", "").replace("/", "_").replace("+", "-")
     return f"vid_{safe_hash}"
 
 
-# thumbnail generator
-def generate_thumbnail(video_path, thumbnail_path):
+def get_video_cache_path(username, kind, video_name):
+    """Returns the cache file of a video inside one of the VIDEO_CACHE_KINDS folders."""
+    cache_dir = get_user_cache_dir(username, kind)
+    return os.path.join(cache_dir, f"{get_safe_collection_name(video_name)}.json")
+
+
+def load_json_cache(path, default=None):
+    """Reads a JSON cache file, returning the default if it is missing or corrupt."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+
+def save_json_cache(path, data):
+    """Writes a JSON cache file atomically so concurrent readers never see half a file."""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def get_keyframe_sprite_path(username, video_name):
+    """The keyframe sprite image, stored next to its JSON index in the 'keyframes' cache."""
+    return get_video_cache_path(username, "keyframes", video_name)[:-len(".json")] + ".jpg"
+
+
+def get_web_rendition_path(username, video_name):
+    """The faststart MP4 the player streams, kept in the user's 'web' folder."""
+    return os.path.join(get_user_cache_dir(username, "web"), f"{get_safe_collection_name(video_name)}.mp4")
+
+
+def get_audio_checkpoint_path(username, video_name):
+    """Decoded audio of an unfinished ingestion, next to its checkpoint."""
+    return get_video_cache_path(username, "checkpoints", video_name)[:-len(".json")] + ".npy"
+
+
+def get_video_file_caches(username, video_name):
+    """Every derived file of a video that is not a JSON cache (deleted and renamed with it)."""
+    return [get_keyframe_sprite_path(username, video_name), get_web_rendition_path(username, video_name),
+            get_audio_checkpoint_path(username, video_name)]
+
+
+# thumbnail and keyframes (one decode of the video)
+def build_visual_index(video_path, username, video_name, thumbnail_path, should_stop=None):
+    """Writes the thumbnail, keyframe sprite and keyframe index. Returns the keyframe count (None if stopped)."""
     try:
-        cap = cv2.VideoCapture(video_path)
-        success, frame = cap.read()
-        if success:
-            frame = cv2.resize(frame, (640, 360))
-            cv2.imwrite(thumbnail_path, frame)
-        cap.release()
+        with metrics.span("ingest.keyframes") as span:
+            index = keyframes.extract_keyframes(video_path, thumbnail_path,
+                                                get_keyframe_sprite_path(username, video_name), should_stop)
+            if index is None: return None
+            save_json_cache(get_video_cache_path(username, "keyframes", video_name), index)
+            span.set(keyframes=len(index['frames']))
+            return len(index['frames'])
     except Exception as e:
-        print(f"Thumbnail error: {e}")
+        print(f"Keyframe error: {e}")
+        return 0
+
+
+# web rendition (streamed by media_server)
+def build_web_rendition(video_path, username, video_name, should_stop=None):
+    """Writes the faststart MP4 for the player. Returns True when written (None if stopped)."""
+    try:
+        with metrics.span("ingest.web_rendition"):
+            return media.make_web_rendition(video_path, get_web_rendition_path(username, video_name), should_stop)
+    except Exception as e:
+        # the player falls back to streaming the original file
+        print(f"Web rendition error: {e}")
+        return False
 
 
 def request_cancellation(username, video_name):
@@ -112,6 +203,17 @@ def clear_progress(username, video_name):
         os.remove(status_file)
 
 
+def clear_stale_progress(pending_videos):
+    """Janitor: removes progress files of videos without a queued or running job ({(username, video_name)})."""
+    expected = {f"{username}_{get_safe_collection_name(video_name)}.json" for username, video_name in pending_videos}
+    for f in os.listdir(PROCESSING_FOLDER):
+        if f.endswith(".json") and f not in expected:
+            try:
+                os.remove(os.path.join(PROCESSING_FOLDER, f))
+            except OSError:
+                pass
+
+
 def get_active_progress(username):
     active_jobs = []
     for f in os.listdir(PROCESSING_FOLDER):
@@ -124,24 +226,129 @@ def get_active_progress(username):
     return active_jobs
 
 
-# backend
-@st.cache_resource
-def load_whisper():
-    return whisper.load_model("small", device=device)
+# backend (heavy libraries are imported on first use, so importing this module stays cheap)
+def get_device():
+    return model_manager.get_device()
 
 
 def get_db_client(chroma_path):
+    """
+    Returns the vector store of one user. chroma_path is the user's chroma folder; in server
+    mode it only names the user's database, and the HTTP client is shared by all callers.
+    """
+    if CHROMA_MODE == "server":
+        username = os.path.basename(os.path.dirname(os.path.normpath(chroma_path)))
+        return get_server_client(f"user_{hashlib.sha256(username.encode()).hexdigest()[:24]}")
+    import chromadb
     return chromadb.PersistentClient(path=chroma_path)
 
 
+@functools.lru_cache(maxsize=None)
+def get_server_client(database):
+    """One HTTP client per database for the whole process, reusing its keep-alive connection pool."""
+    import chromadb
+    from chromadb.config import Settings
+
+    admin = chromadb.AdminClient(Settings(chroma_api_impl="chromadb.api.fastapi.FastAPI",
+                                          chroma_server_host=CHROMA_HOST, chroma_server_http_port=CHROMA_PORT,
+                                          anonymized_telemetry=False))
+    try:
+        admin.get_tenant(CHROMA_TENANT)
+    except Exception:
+        admin.create_tenant(CHROMA_TENANT)
+    try:
+        admin.get_database(database, tenant=CHROMA_TENANT)
+    except Exception:
+        admin.create_database(database, tenant=CHROMA_TENANT)
+
+    pool_settings = Settings(anonymized_telemetry=False, chroma_http_max_connections=CHROMA_POOL_SIZE,
+                             chroma_http_max_keepalive_connections=CHROMA_POOL_SIZE)
+    return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT, tenant=CHROMA_TENANT, database=database,
+                               settings=pool_settings)
+
+
+@functools.lru_cache(maxsize=None)
 def get_embedding_function():
-    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+    """
+    Returns the process-wide embedding function. It holds no model itself: every call
+    goes through the embedding engine and its shared model.
+    """
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+    class ManagedEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+        def __init__(self):
+            # skip the parent constructor, which would load a private copy of the model;
+            # these attributes keep the persisted collection config identical
+            self.model_name = model_manager.EMBEDDING_MODEL_NAME
+            self.device = get_device()
+            self.normalize_embeddings = False
+            self.kwargs = {}
+
+        def __call__(self, input):
+            return list(embedding_engine.encode(input))
+
+    return ManagedEmbeddingFunction()
+
+
+def open_collection(client, collection_name):
+    """Opens an existing collection with the shared embedding function (needed for text queries)."""
+    return client.get_collection(collection_name, embedding_function=get_embedding_function())
+
+
+def get_collection_name(username, video_name):
+    """The collection currently serving a video (rebuilt indexes live under a new name)."""
+    row = catalog.get_video(username, video_name)
+    return (row and row['collection_name']) or get_safe_collection_name(video_name)
+
+
+def get_video_collections(username, states=None):
+    """Returns {video_name: collection_name} for the user's library."""
+    if catalog.needs_backfill(username):
+        backfill_catalog(username)
+    return {name: collection_name or get_safe_collection_name(name)
+            for name, collection_name in catalog.get_collection_names(username, states).items()}
+
+
+# index layout
+def get_index_stamp():
+    """Schema and model version stamped on every collection and chunk."""
+    return {"index_version": INDEX_VERSION, "embedding_model": embedding_engine.EMBEDDING_MODEL_VERSION}
+
+
+def build_chunks(segments, video_name):
+    """Groups transcript segments into indexed chunks. Returns (ids, documents, metadatas)."""
+    id_prefix = get_safe_collection_name(video_name)
+    stamp = get_index_stamp()
+    ids, documents, metadatas = [], [], []
+    for i in range(0, len(segments), GROUP_SIZE):
+        group = segments[i: i + GROUP_SIZE]
+        ids.append(f"{id_prefix}_{i}")
+        documents.append(" ".join([s['text'].strip() for s in group]))
+        metadatas.append({
+            "start_time": group[0]['start'],
+            "end_time": group[-1]['end'],
+            "video_name": video_name,
+            "source_collection": id_prefix,
+            **stamp
+        })
+    return ids, documents, metadatas
+
+
+def save_transcript(username, video_name, segments):
+    """Caches the Whisper segments so the index can be rebuilt without transcribing again."""
+    segments = [{"start": s['start'], "end": s['end'], "text": s['text']} for s in segments]
+    save_json_cache(get_video_cache_path(username, "transcripts", video_name), segments)
+    return segments
+
+
+def load_transcript(username, video_name):
+    return load_json_cache(get_video_cache_path(username, "transcripts", video_name))
 
 
 def delete_video(username, video_name):
     videos_dir, chroma_dir, thumbnails_dir = get_user_paths(username)
     client = get_db_client(chroma_dir)
-    col_name = get_safe_collection_name(video_name)
+    col_name = get_collection_name(username, video_name)
 
     # 1. delete Database Collection
     try:
@@ -166,8 +373,20 @@ def delete_video(username, video_name):
         except:
             pass
 
+    # drop cached summaries etc.
+    for cache_path in [get_video_cache_path(username, kind, video_name) for kind in VIDEO_CACHE_KINDS] + \
+                      get_video_file_caches(username, video_name):
+        if os.path.exists(cache_path):
+            try:
+                os.remove(cache_path)
+            except:
+                pass
+
     # clean Status
     clear_progress(username, video_name)
+    from chat_store import clear_conversation, get_conversation_id
+    clear_conversation(username, get_conversation_id(username, video_name))
+    catalog.remove_video(username, video_name)
     return True
 
 
@@ -198,10 +417,21 @@ def rename_video(username, old_name, new_name_base):
         if os.path.exists(old_thumb):
             os.rename(old_thumb, new_thumb)
 
+        # move cached summaries etc. along with the video
+        for kind in VIDEO_CACHE_KINDS:
+            old_cache = get_video_cache_path(username, kind, old_name)
+            if os.path.exists(old_cache):
+                os.replace(old_cache, get_video_cache_path(username, kind, new_full_name))
+        for old_file, new_file in zip(get_video_file_caches(username, old_name),
+                                      get_video_file_caches(username, new_full_name)):
+            if os.path.exists(old_file):
+                os.replace(old_file, new_file)
+
         # migrate chromaDB collection
         client = get_db_client(chroma_dir)
-        old_col_name = get_safe_collection_name(old_name)
+        old_col_name = get_collection_name(username, old_name)
         new_col_name = get_safe_collection_name(new_full_name)
+        catalog.rename_video(username, old_name, new_full_name, collection_name=new_col_name)
 
         try:
             collection = client.get_collection(old_col_name)
@@ -221,258 +451,340 @@ def rename_video(username, old_name, new_name_base):
         return False, str(e)
 
 
-def process_video_in_background(file_path, video_name, chroma_path, username):
+# checkpoints (a job requeued after a crash or restart resumes from its last finished step)
+class IngestCheckpoint:
+    """Progress of one ingestion, saved after every step. It only applies to the same source file."""
+
+    def __init__(self, username, video_name, file_path):
+        self.path = get_video_cache_path(username, "checkpoints", video_name)
+        self.audio_path = get_audio_checkpoint_path(username, video_name)
+        self.lock = threading.Lock()
+        stat = os.stat(file_path)
+        source = {"size": stat.st_size, "mtime": stat.st_mtime}
+        state = load_json_cache(self.path)
+        self.resumed = bool(state) and state.get('source') == source
+        if not self.resumed:
+            self.remove()
+        self.state = state if self.resumed else {"source": source}
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.state.get(key, default)
+
+    def update(self, **values):
+        with self.lock:
+            self.state.update(values)
+            save_json_cache(self.path, self.state)
+
+    def remove(self):
+        for path in [self.path, self.audio_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_audio_checkpointed(file_path, checkpoint):
+    """Decodes the audio once; a resumed job reads it back from the checkpoint (16-bit, as ffmpeg produced it)."""
+    import numpy as np
+    import whisper
+
+    if os.path.exists(checkpoint.audio_path):
+        return np.load(checkpoint.audio_path).astype(np.float32) / 32768.0
+
+    with metrics.span("ingest.decode_audio") as span:
+        audio = whisper.load_audio(file_path)
+        span.set(audio_seconds=round(len(audio) / whisper.audio.SAMPLE_RATE, 1))
+    tmp_path = f"{checkpoint.audio_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.clip(audio * 32768.0, -32768, 32767).astype(np.int16))
+    os.replace(tmp_path, checkpoint.audio_path)
+    return audio
+
+
+def transcribe_checkpointed(file_path, username, video_name, checkpoint, should_stop):
+    """Transcribes in TRANSCRIBE_WINDOW_SECONDS windows, checkpointing each one. Returns the segments (None if stopped)."""
+    import whisper
+
+    audio = load_audio_checkpointed(file_path, checkpoint)
+    window = TRANSCRIBE_WINDOW_SECONDS * whisper.audio.SAMPLE_RATE
+    windows = max(1, -(-len(audio) // window))
+    segments = checkpoint.get('segments', [])
+    done = checkpoint.get('windows_done', 0)
+
+    with metrics.span("ingest.transcribe", windows=windows, resumed_windows=done) as span, \
+            model_manager.manager.use("whisper") as model:
+        for w in range(done, windows):
+            if should_stop(): return None
+            offset = w * TRANSCRIBE_WINDOW_SECONDS
+            result = model.transcribe(audio[w * window:(w + 1) * window])
+            segments += [{"start": seg['start'] + offset, "end": seg['end'] + offset, "text": seg['text']}
+                         for seg in result['segments']]
+            checkpoint.update(segments=segments, windows_done=w + 1)
+            update_progress(username, video_name, 15 + int(45 * (w + 1) / windows),
+                            f"Transcribing Audio ({w + 1}/{windows})...")
+        span.set(segments=len(segments))
+    return segments
+
+
+def process_video_in_background(file_path, video_name, chroma_path, username, api_key=""):
+    """Transcribes and indexes a video. Returns True when done, False on error, None if cancelled."""
+    with metrics.span("ingest", size_bytes=os.path.getsize(file_path)) as span:
+        result = _process_video(file_path, video_name, chroma_path, username, api_key)
+        span.set(outcome={True: "done", False: "error"}.get(result, "cancelled"))
+        return result
+
+
+def _process_video(file_path, video_name, chroma_path, username, api_key):
     _, _, thumbnails_dir = get_user_paths(username)
+    previous_collection = get_collection_name(username, video_name)
+    catalog.add_video(username, video_name, state="processing", size_bytes=os.path.getsize(file_path),
+                      collection_name=get_safe_collection_name(video_name))
     thumb_path = os.path.join(thumbnails_dir, f"{video_name}.jpg")
-    generate_thumbnail(file_path, thumb_path)
     update_progress(username, video_name, 5, "Initializing AI Models...")
+    status_file = os.path.join(PROCESSING_FOLDER, f"{username}_{get_safe_collection_name(video_name)}.json")
 
     if check_if_cancelled(username, video_name):
         delete_video(username, video_name)
         return
 
+    checkpoint = IngestCheckpoint(username, video_name, file_path)
+    if checkpoint.resumed:
+        print(f"Resuming {video_name} from its checkpoint")
+
+    # the thumbnail and keyframes come from one video decode, and the web rendition from one ffmpeg run,
+    # both alongside transcription; they stop on their own once the status file is gone
+    should_stop = lambda: not os.path.exists(status_file)
+    visual_pool = ThreadPoolExecutor(max_workers=2)
+
+    def side_step(name, func, *args):
+        if checkpoint.get(name): return None
+
+        # marked inside the task, so it is saved before the main thread can remove the checkpoint
+        def run():
+            if func(*args):
+                checkpoint.update(**{name: True})
+
+        return visual_pool.submit(contextvars.copy_context().run, run)
+
+    side_steps = [side_step("keyframes_done", build_visual_index, file_path, username, video_name, thumb_path,
+                            should_stop),
+                  side_step("web_rendition_done", build_web_rendition, file_path, username, video_name, should_stop)]
     try:
-        model = load_whisper()
         client = get_db_client(chroma_path)
         ef = get_embedding_function()
         collection_name = get_safe_collection_name(video_name)
 
-        try:
-            client.delete_collection(collection_name)
-        except:
-            pass
-
-        collection = client.create_collection(name=collection_name, embedding_function=ef)
+        collection = None
+        if checkpoint.get('collection_created'):
+            try:
+                collection = open_collection(client, collection_name)
+            except Exception:
+                checkpoint.update(chunks_indexed=0)
+
+        if collection is None:
+            for old_collection in {collection_name, previous_collection}:
+                try:
+                    client.delete_collection(old_collection)
+                except:
+                    pass
+
+            collection = client.create_collection(name=collection_name, embedding_function=ef,
+                                                  metadata=get_index_stamp())
+
+            # questions pooled for a previous upload under this name are stale now
+            quiz_pool_path = get_video_cache_path(username, "quizzes", video_name)
+            if os.path.exists(quiz_pool_path):
+                os.remove(quiz_pool_path)
+            checkpoint.update(collection_created=True)
 
         if check_if_cancelled(username, video_name):
             delete_video(username, video_name)
             return
 
+        if not checkpoint.get('file_hash'):
+            with metrics.span("ingest.hash"):
+                checkpoint.update(file_hash=compute_file_hash(file_path))
+        catalog.update_video(username, video_name, file_hash=checkpoint.get('file_hash'))
         update_progress(username, video_name, 15, "Transcribing Audio...")
 
-        result = model.transcribe(file_path)
-        safe_name = get_safe_collection_name(video_name)
-        status_file = os.path.join(PROCESSING_FOLDER, f"{username}_{safe_name}.json")
+        if checkpoint.get('transcribed'):
+            segments = checkpoint.get('segments')
+        else:
+            segments = transcribe_checkpointed(file_path, username, video_name, checkpoint, should_stop)
 
         # if the status file is gone, the user clicked cancel, and it stops and cleanups
-        if not os.path.exists(status_file):
+        if segments is None or not os.path.exists(status_file):
             print(f"Job {video_name} was abandoned. Cleaning up.")
             delete_video(username, video_name)
             return
 
-        segments = result['segments']
-
-        GROUP_SIZE = 3
-        ids = []
-        documents = []
-        metadatas = []
-        total_groups = len(segments) // GROUP_SIZE + 1
-
-        for idx, i in enumerate(range(0, len(segments), GROUP_SIZE)):
-            if check_if_cancelled(username, video_name):
-                delete_video(username, video_name)
-                return
-
-            group = segments[i: i + GROUP_SIZE]
-            if not group: continue
-            combined_text = " ".join([s['text'].strip() for s in group])
-
-            ids.append(f"{collection_name}_{i}")
-            documents.append(combined_text)
-            metadatas.append({
-                "start_time": group[0]['start'],
-                "end_time": group[-1]['end'],
-                "video_name": video_name,
-                "source_collection": collection_name
-            })
+        segments = save_transcript(username, video_name, segments)
+        checkpoint.update(transcribed=True)
+        if os.path.exists(checkpoint.audio_path):
+            os.remove(checkpoint.audio_path)
+        if check_if_cancelled(username, video_name):
+            delete_video(username, video_name)
+            return
 
-            progress = 30 + int((idx / total_groups) * 60)
-            update_progress(username, video_name, progress, "Indexing Knowledge...")
+        update_progress(username, video_name, 60, "Indexing Knowledge...")
+        ids, documents, metadatas = build_chunks(segments, video_name)
+        indexed = checkpoint.get('chunks_indexed', 0)
+        with metrics.span("ingest.index", chunks=len(ids) - indexed,
+                          characters=sum([len(doc) for doc in documents[indexed:]])):
+            for start in range(indexed, len(ids), INDEX_BATCH_SIZE):
+                end = start + INDEX_BATCH_SIZE
+                # upsert, so a batch stored just before a crash is not added twice
+                collection.upsert(ids=ids[start:end], documents=documents[start:end], metadatas=metadatas[start:end],
+                                  embeddings=list(embedding_engine.encode(documents[start:end])))
+                checkpoint.update(chunks_indexed=min(end, len(ids)))
+        save_routing_index(username, video_name, collection)
+        for future in side_steps:
+            if future: future.result()
+        catalog.update_video(username, video_name, state="ready", chunk_count=len(ids),
+                             duration_sec=segments[-1]['end'] if segments else 0,
+                             index_version=INDEX_VERSION, model_version=embedding_engine.EMBEDDING_MODEL_VERSION)
+        checkpoint.remove()
+
+        # pre-generate quiz questions so the first "Challenge me" click is instant
+        from query_engine import start_quiz_pool_refill
+        start_quiz_pool_refill(video_name, username, api_key)
 
-        collection.add(ids=ids, documents=documents, metadatas=metadatas)
         update_progress(username, video_name, 100, "Done!")
         create_completion_notification(username, video_name)
         time.sleep(2)
+        return True
 
     except Exception as e:
         print(f"Error: {e}")
         update_progress(username, video_name, 0, "Error")
+        catalog.update_video(username, video_name, state="error")
+        return False
     finally:
         clear_progress(username, video_name)
+        visual_pool.shutdown(wait=False)
 
 
-@st.dialog("📊 Video Intelligence Summary", width="large")
-def show_summary_popup(video_name, username, api_key):
-    # manage state to prevent re-running AI on every interaction
-    state_key = f"summary_{video_name}"
-    if state_key not in st.session_state:
-        with st.spinner("Generating summary..."):
-            from query_engine import generate_video_summary
-            summary_text = generate_video_summary(video_name, username, api_key)
-            st.session_state[state_key] = summary_text
-
-    summary_text = st.session_state[state_key]
-    st.markdown(summary_text)
-    st.divider()
-
-    #  TXT download option 
-    st.download_button(
-        label="📄 Download TXT",
-        data=summary_text,
-        file_name=f"{video_name}_summary.txt",
-        mime="text/plain",
-        use_container_width=True
-    )
-
-
-# UI
-def get_videos_list(username):
-    videos_dir, _, _ = get_user_paths(username)
-    if not os.path.exists(videos_dir): return []
-    return [f for f in os.listdir(videos_dir) if f.endswith(('.mp4', '.mov', '.avi'))]
-
-
-def render_upload_page(username):
-    st.title("📥 Import Content")
-    active_jobs = get_active_progress(username)
-    if active_jobs:
-        st.info("🔄 Processing in background...")
-        for job in active_jobs:
-            c_text, c_btn = st.columns([5, 1])
-            with c_text:
-                st.write(f"**{job['video']}**: {job['stage']}")
-                st.progress(job['progress'])
-            with c_btn:
-                st.write("")
-                if st.button("❌", key=f"cancel_{job['video']}", help="Cancel Processing"):
-                    request_cancellation(username, job['video'])
-                    clear_progress(username, job['video'])
-
-                    st.toast(f"Cancelling {job['video']}...")
-                    time.sleep(0.5)
-                    st.rerun()
-
-        time.sleep(1)
-        st.rerun()
+def ingest_video(username, source_path, api_key="", video_name=None, overwrite=False):
+    """
+    Headless ingestion: copies a file into the user's library and indexes it in the calling thread.
+    Returns (success, message).
+    """
     videos_dir, chroma_dir, _ = get_user_paths(username)
+    video_name = video_name or os.path.basename(source_path)
+    if not video_name.lower().endswith(VIDEO_EXTENSIONS):
+        return False, f"Unsupported file type: {video_name}"
 
-    # fake storage status bar
-    col_stat1, col_stat2 = st.columns([3, 1])
-    with col_stat1:
-        st.progress(45, text="Cloud Storage Usage")
-    with col_stat2:
-        st.caption("4.5GB / 10GB Used")
-
-    st.divider()
+    file_path = os.path.join(videos_dir, video_name)
+    if os.path.exists(file_path) and not overwrite and os.path.abspath(source_path) != os.path.abspath(file_path):
+        return False, "A video with this name already exists."
+    if os.path.abspath(source_path) != os.path.abspath(file_path):
+        shutil.copy2(source_path, file_path)
 
-    # upload area 
-    with st.container(border=True):
-        st.markdown("### 📤 Drag & Drop Video")
-        uploaded_file = st.file_uploader("", type=["mp4", "mov", "avi"], label_visibility="collapsed")
+    # registered in the job queue, so other processes see the ingestion as in progress
+    import ingest_worker
+    if not ingest_worker.run_job_here(username, video_name, file_path, chroma_dir, api_key):
+        return False, "Indexing failed."
+    return True, f"Indexed {catalog.get_video(username, video_name)['chunk_count']} chunks."
 
-        if uploaded_file:
-            st.info(f"Ready to process: **{uploaded_file.name}**")
 
-            if st.button("Start Processing ⚡", type="primary", use_container_width=True):
-                file_path = os.path.join(videos_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+def save_routing_index(username, video_name, collection):
+    """Caches the video's coarse routing vectors (rebuilt on first search if this fails)."""
+    import routing
+    try:
+        routing.save_routing_vectors(username, video_name, collection)
+    except Exception as e:
+        print(f"Routing index error: {e}")
 
-                st.toast("Upload Complete! AI Processing started.")
-                thread = threading.Thread(
-                    target=process_video_in_background,
-                    args=(file_path, uploaded_file.name, chroma_dir, username)
-                )
-                thread.start()
-                time.sleep(1)
-                st.rerun()
 
+def reindex_video(username, video_name):
+    """
+    Rebuilds a video's index with the current chunking and embedding model into a shadow
+    collection, then swaps it in. Searches keep using the old collection until the swap.
+    Returns the new chunk count, or None if the video changed meanwhile.
+    """
+    videos_dir, chroma_dir, _ = get_user_paths(username)
+    client = get_db_client(chroma_dir)
+    row = catalog.get_video(username, video_name) or {}
+    old_collection = get_collection_name(username, video_name)
+
+    segments = load_transcript(username, video_name)
+    if segments is None and row.get('index_version') == INDEX_VERSION:
+        # same chunk layout, only the embedding model changed: re-embed the stored chunks
+        data = client.get_collection(old_collection).get()
+        ids, documents = data['ids'], data['documents']
+        metadatas = [{**meta, **get_index_stamp()} for meta in data['metadatas']]
+    else:
+        if segments is None:
+            # videos indexed before transcripts were cached
+            with model_manager.manager.use("whisper") as model:
+                result = model.transcribe(os.path.join(videos_dir, video_name))
+            segments = save_transcript(username, video_name, result['segments'])
+        ids, documents, metadatas = build_chunks(segments, video_name)
+
+    shadow_name = f"{get_safe_collection_name(video_name)}_v{INDEX_VERSION}_{uuid.uuid4().hex[:6]}"
+    shadow = client.create_collection(name=shadow_name, embedding_function=get_embedding_function(),
+                                      metadata=get_index_stamp())
+    if ids:
+        shadow.add(ids=ids, documents=documents, metadatas=metadatas,
+                   embeddings=list(embedding_engine.encode(documents)))
+
+    swapped = catalog.swap_collection(username, video_name, old_collection, shadow_name, chunk_count=len(ids),
+                                      index_version=INDEX_VERSION, model_version=embedding_engine.EMBEDDING_MODEL_VERSION)
+    if not swapped:
+        client.delete_collection(shadow_name)
+        return None
+    save_routing_index(username, video_name, shadow)
+    return len(ids)
+
+
+def drop_retired_collections(grace_seconds=RETIRED_COLLECTION_GRACE):
+    """Deletes collections replaced by a rebuild once in-flight searches are done with them."""
+    for username, collection_name in catalog.pop_retired_collections(grace_seconds):
+        _, chroma_dir, _ = get_user_paths(username)
+        try:
+            get_db_client(chroma_dir).delete_collection(collection_name)
+        except Exception as e:
+            print(f"Could not drop retired collection {collection_name}: {e}")
 
-# library page
-def render_library_page(username):
-    st.title("🎬 My Studio")
 
-    videos = get_videos_list(username)
-    _, _, thumbnails_dir = get_user_paths(username)
+def compute_file_hash(file_path, block_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
 
-    # handle empty library
-    if not videos:
-        st.info("Your library is empty. Go to 'Import' to add videos.")
-        return
 
-    if 'renaming_video' not in st.session_state:
-        st.session_state['renaming_video'] = None
-
-    cols_per_row = 3
-    rows = [videos[i:i + cols_per_row] for i in range(0, len(videos), cols_per_row)]
-
-    # display videos in grid
-    for row_videos in rows:
-        cols = st.columns(cols_per_row)
-        for idx, vid in enumerate(row_videos):
-            with cols[idx]:
-                with st.container(border=True):
-                    thumb_path = os.path.join(thumbnails_dir, f"{vid}.jpg")
-                    style_settings = "width: 100%; height: 180px; object-fit: cover; border-radius: 4px; margin-bottom: 10px;"
-
-                    if os.path.exists(thumb_path):
-                        try:
-                            with open(thumb_path, "rb") as img_file:
-                                b64_data = base64.b64encode(img_file.read()).decode()
-                            st.markdown(
-                                f'<img src="data:image/jpeg;base64,{b64_data}" style="{style_settings}">',
-                                unsafe_allow_html=True
-                            )
-                        except Exception:
-                            st.markdown(f'<div style="{style_settings} background-color: #262730;">Error</div>',
-                                        unsafe_allow_html=True)
-                    else:
-                        st.markdown(f'<div style="{style_settings} background-color: #262730;">No Preview</div>',
-                                    unsafe_allow_html=True)
-
-                    if st.session_state['renaming_video'] == vid:
-                        base_name = os.path.splitext(vid)[0]
-                        new_name_input = st.text_input("New Name", value=base_name, key=f"input_{vid}",
-                                                       label_visibility="collapsed")
-
-                        c_save, c_cancel = st.columns(2)
-                        with c_save:
-                            if st.button("💾 Save", key=f"save_{vid}", use_container_width=True):
-                                if new_name_input and new_name_input != base_name:
-                                    success, msg = rename_video(username, vid, new_name_input)
-                                    if success:
-                                        st.session_state['renaming_video'] = None
-                                        st.toast(f"Renamed to {msg}")
-                                        st.rerun()
-                                    else:
-                                        st.error(msg)
-                                else:
-                                    st.session_state['renaming_video'] = None
-                                    st.rerun()
-                        with c_cancel:
-                            if st.button("❌", key=f"cancel_{vid}", use_container_width=True):
-                                st.session_state['renaming_video'] = None
-                                st.rerun()
-                    else:
-                        c_text, c_edit = st.columns([5, 1])
-                        with c_text:
-                            display_name = vid if len(vid) < 20 else vid[:17] + "..."
-                            st.markdown(f"**{display_name}**")
-                        with c_edit:
-                            if st.button("✏️", key=f"edit_{vid}"):
-                                st.session_state['renaming_video'] = vid
-                                st.rerun()
-
-                    c1, c2, c3 = st.columns([1, 2, 1])
-                    with c1:
-                        if st.button("Open", key=f"open_{vid}", use_container_width=True):
-                            st.session_state['selected_video'] = vid
-                            st.session_state['current_page'] = "✨ AI Chat"
-                            st.rerun()
-                    with c2:
-                        if st.button("Summarize", key=f"sum_{vid}", use_container_width=True):
-                            show_summary_popup(vid, username, st.session_state.get('gemini_api_key', ""))
-                    with c3:
-                        if st.button("🗑️", key=f"del_{vid}", use_container_width=True):
-                            delete_video(username, vid)
-                            st.rerun()
+# library listing (served from the catalog, not the file system)
+def backfill_catalog(username):
+    """One-time import of videos that were added before the catalog existed."""
+    videos_dir, chroma_dir, _ = get_user_paths(username)
+    known = set(catalog.list_video_names(username))
+    client = None
+    for video_name in os.listdir(videos_dir):
+        if not video_name.endswith(VIDEO_EXTENSIONS) or video_name in known: continue
+        client = client or get_db_client(chroma_dir)
+        collection_name = get_safe_collection_name(video_name)
+        try:
+            chunk_count = client.get_collection(collection_name).count()
+        except Exception:
+            chunk_count = 0
+        catalog.add_video(username, video_name, collection_name=collection_name,
+                          size_bytes=os.path.getsize(os.path.join(videos_dir, video_name)),
+                          chunk_count=chunk_count, state="ready" if chunk_count else "error",
+                          # built by an unknown version, so the migration rebuilds it
+                          index_version=None, model_version=None)
+    catalog.mark_backfilled(username)
+
+
+def get_videos_list(username, states=None):
+    """Returns the user's video names from the catalog (optionally only some states, e.g. ("ready",))."""
+    if catalog.needs_backfill(username):
+        backfill_catalog(username)
+    return catalog.list_video_names(username, states)
+
+
+def get_videos_page(username, **filters):
+    """One page of the library from the catalog, see catalog.query_videos. Returns (rows, total)."""
+    if catalog.needs_backfill(username):
+        backfill_catalog(username)
+    return catalog.query_videos(username, **filters)
@@ -0,0 +1,63 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# configurations
+WARMUP_ENABLED = True  # load the embedding model and reranker in the background after login
+
+_timings = {}  # name -> seconds
+_timings_lock = threading.Lock()
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def record_timing(name, seconds, first_only=False):
+    """Stores a startup timing and prints it to the server log."""
+    with _timings_lock:
+        if first_only and name in _timings: return
+        _timings[name] = seconds
+    print(f"⏱️ {name}: {seconds:.2f}s")
+
+
+@contextmanager
+def timed(name, first_only=False):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start, first_only)
+
+
+def get_timings():
+    with _timings_lock:
+        return dict(_timings)
+
+
+def _warm_up_models():
+    import model_manager
+
+    with timed("warmup_embedding_model"):
+        model_manager.manager.preload("embedder")
+    with timed("warmup_reranker"):
+        model_manager.manager.preload("reranker")
+
+
+def start_background_warmup():
+    """Starts loading the query-time models in a daemon thread (once per process)."""
+    global _warmup_thread
+    if not WARMUP_ENABLED: return
+    with _warmup_lock:
+        if _warmup_thread is not None: return
+        _warmup_thread = threading.Thread(target=_run_warmup, daemon=True, name="model-warmup")
+        _warmup_thread.start()
+
+
+def _run_warmup():
+    try:
+        _warm_up_models()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+
+
+def is_warming_up():
+    return _warmup_thread is not None and _warmup_thread.is_alive()